@@ -0,0 +1,60 @@
+import os
+from typing import Callable
+
+import database
+import sqlite_db
+from database import AdminDashboard, ChangeFeed, Leaderboards, PostgresDB
+from sqlite_db import SQLiteDB
+from storage import STORES, check_contract
+
+# Хранилище: postgres — общий сервер для любого числа реплик,
+# sqlite — встроенная БД в файле SQLITE_PATH для установки из одной реплики
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'postgres').lower()
+
+BACKENDS = {
+    'postgres': database,
+    'sqlite': sqlite_db,
+}
+if STORAGE_BACKEND not in BACKENDS:
+    raise ValueError(f"❌ Неизвестное хранилище STORAGE_BACKEND={STORAGE_BACKEND!r}: {', '.join(BACKENDS)}")
+
+# Рассылки, метрики, лидерство и общее состояние диалогов есть только у PostgreSQL
+USES_POSTGRES = STORAGE_BACKEND == 'postgres'
+
+_module = BACKENDS[STORAGE_BACKEND]
+for _interface, _name in STORES.items():
+    check_contract(getattr(_module, _name), _interface)
+
+UserManager = _module.UserManager
+TaskManager = _module.TaskManager
+AdminManager = _module.AdminManager
+PendingLinksManager = _module.PendingLinksManager
+TrackingLinksManager = _module.TrackingLinksManager
+ReportQueueManager = _module.ReportQueueManager
+SettingsManager = _module.SettingsManager
+
+AdminDashboard.source = Leaderboards.source = TaskManager
+
+
+async def init_storage():
+    """Подключение к хранилищу и создание таблиц"""
+    if USES_POSTGRES:
+        await PostgresDB.init_db()
+    else:
+        await SQLiteDB.init_db()
+
+
+async def close_storage():
+    """Закрытие соединений хранилища"""
+    if USES_POSTGRES:
+        await PostgresDB.close_pool()
+    else:
+        await SQLiteDB.close()
+
+
+def subscribe(table: str, callback: Callable):
+    """Подписка на изменения таблицы в выбранном хранилище: callback(op, key)"""
+    if USES_POSTGRES:
+        ChangeFeed.subscribe(table, callback)
+    else:
+        SQLiteDB.subscribe(table, callback)
@@ -2,26 +2,48 @@ import logging
 import json
 import hashlib
 import secrets
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, time as dt_time
 import os
+import re
+import signal
 import asyncio
-from typing import Dict, List, Optional
+import time
+from typing import Dict, List, Optional, Tuple
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
+    CallbackContext,
     ContextTypes,
     MessageHandler,
+    TypeHandler,
     filters
 )
 
 # ========== ИМПОРТ БАЗЫ ДАННЫХ ==========
+from backend import (
+    UserManager, TaskManager, AdminManager, PendingLinksManager, TrackingLinksManager,
+    STORAGE_BACKEND, USES_POSTGRES, init_storage, close_storage
+)
 from database import (
-    PostgresDB, UserManager, TaskManager, AdminManager, 
-    PendingLinksManager, TrackingLinksManager, MAIN_ADMIN_ID
+    MAIN_ADMIN_ID, LeaderElection, JobRunsManager, UserStateManager, ChangeFeed,
+    AvailableTasksIndex, BroadcastManager, AdminDashboard, DASHBOARD_REFRESH_INTERVAL,
+    MetricsManager, METRICS_FLUSH_INTERVAL, Leaderboards, QueryStats, SLOW_QUERY_MS,
+    DatabaseUnavailable, DB_OUTAGE_ERRORS, LastKnownGood
 )
+from broadcast import BroadcastEngine, fan_out, task_announcement
+from scheduler import DeadlineScheduler
+from middleware import Idempotency, flood_control, idempotent_callback
+from screens import edit_markup, edit_screen
+from proofs import AlbumCollector, Proof
+from reports import ReportDigest, report_entry
+from settings import Config
+from models import TaskAdminRow
+from templates import Markup, join
+import texts
 
 # ========== КОНФИГУРАЦИЯ ==========
 # Берем настройки из переменных окружения
@@ -29,8 +51,76 @@ BOT_TOKEN = os.environ.get('BOT_TOKEN')  # УБРАЛИ ДЕФОЛТНЫЙ ТО
 if not BOT_TOKEN:
     raise ValueError("❌ BOT_TOKEN не установлен в переменных окружения!")
 
-TASK_NOTIFICATION_GROUP = os.environ.get('TASK_NOTIFICATION_GROUP', "@wedferfwewf")
-REPORT_GROUP = os.environ.get('REPORT_GROUP', "@ertghpjoterg")
+# Режим нескольких реплик: обновления приходят через вебхук на любую реплику,
+# состояние диалогов хранится в БД, плановые задачи выполняет только лидер
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET') or None
+PORT = int(os.environ.get('PORT', '8080'))
+MULTI_REPLICA = bool(WEBHOOK_URL)
+
+# Старт при недоступной БД: пауза между попытками растет до этого значения (секунды)
+DB_STARTUP_RETRY_MAX = float(os.environ.get('DB_STARTUP_RETRY_MAX', '60'))
+# Не чаще одного сообщения о недоступности БД пользователю за этот интервал (секунды)
+DB_NOTICE_INTERVAL = float(os.environ.get('DB_NOTICE_INTERVAL', '30'))
+DB_UNAVAILABLE_TEXT = (
+    "⚠️ База данных временно недоступна.\n\n"
+    "Просмотр заданий и профиля работает по последним данным, "
+    "а действие выполнить сейчас не получится. Попробуйте через минуту."
+)
+
+DAILY_REPORT_TIME = dt_time(hour=23, minute=0)
+# Как часто лидер повторяет неотправленный ежедневный отчет (секунды)
+DAILY_REPORT_RETRY_INTERVAL = float(os.environ.get('DAILY_REPORT_RETRY_INTERVAL', '300'))
+# Как часто лидер проверяет незавершенные рассылки (секунды)
+BROADCAST_RESUME_INTERVAL = float(os.environ.get('BROADCAST_RESUME_INTERVAL', '10'))
+
+# Массовая выдача ссылок: максимум строк и размер загружаемого файла
+BULK_LINKS_MAX = int(os.environ.get('BULK_LINKS_MAX', '1000'))
+BULK_LINKS_FILE_MAX_BYTES = 512 * 1024
+# Верхняя граница числа исполнителей одного задания
+TASK_CAPACITY_MAX = int(os.environ.get('TASK_CAPACITY_MAX', '100000'))
+# Строка массовой выдачи: «task_id[/user_id] ссылка» (допускаются разделители ; , :)
+BULK_LINK_LINE = re.compile(r'^([0-9A-Za-z]+)(?:/(\d+))?[\s;,:]+(\S+)$')
+
+# Поиск заданий: диапазоны вознаграждения (код -> от, до, подпись) и размер страницы
+SEARCH_REWARD_RANGES = {
+    "any": (None, None, "💰 Любая"),
+    "low": (None, 500, "до 500"),
+    "mid": (500, 2000, "500–2000"),
+    "high": (2000, None, "от 2000"),
+}
+SEARCH_PAGE_SIZE = 8
+SEARCH_QUERY_MAX = 200
+
+# Периоды таблицы лидеров: код -> подпись вкладки
+LEADERBOARD_PERIODS = {"day": "📅 День", "week": "🗓 Неделя", "all": "🏆 Все время"}
+LEADERBOARD_SIZE = 10
+
+# Разрезы метрик для команды /metrics
+METRICS_DIMENSIONS = {"task": "задание", "user": "исполнитель", "link": "ссылка"}
+
+# Команда /dbstats: сколько запросов показывать и длина текста запроса
+DBSTATS_SIZE = 10
+DBSTATS_SQL_LENGTH = 200
+DBSTATS_ORDERS = {"total": "суммарному времени", "mean": "среднему времени", "max": "максимуму", "calls": "числу вызовов"}
+
+# Формат дат в расписании задания
+SCHEDULE_DATE_FORMAT = "%d.%m.%Y %H:%M"
+
+# Типы заданий: код для callback_data -> название, которое хранится в БД
+TASK_TYPES = {
+    "subscribers": "Привлечение подписчиков",
+    "ad": "Рекламный пост",
+    "clicks": "Переходы по ссылке",
+    "install": "Установка приложения"
+}
+TASK_TYPE_LABELS = {
+    "subscribers": "👥 Подписчики",
+    "ad": "📢 Реклама",
+    "clicks": "🔗 Переходы",
+    "install": "📱 Установки"
+}
 
 # ========== НАСТРОЙКА ЛОГИРОВАНИЯ ==========
 logging.basicConfig(
@@ -49,72 +139,68 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     
     # Создаем или получаем пользователя в базе данных
-    await UserManager.get_or_create_user(
-        user.id, 
-        user.username or "", 
-        user.first_name or ""
-    )
+    try:
+        await UserManager.get_or_create_user(
+            user.id, 
+            user.username or "", 
+            user.first_name or ""
+        )
+    except DatabaseUnavailable:
+        # Меню показываем и без БД; пользователь запишется при следующем /start
+        logger.warning(f"БД недоступна: регистрация {user.id} отложена")
     
     if context.args and len(context.args) > 0:
         link_id = context.args[0]
         await handle_tracking_link(update, context, link_id)
         return
     
-    welcome_text = (
-        "🚀 *Приветствуем, будущий трафик-менеджер!*\n\n"
-        "Переходи по ссылкам — мы покажем и научим, "
-        "как действительно зарабатывать на трафике.\n\n"
-        "❗️ Мы работаем *ТОЛЬКО* с белым трафиком — честно, стабильно и без рисков.\n\n"
-        "*Вступая в нашу команду, ты получаешь:*\n"
-        "✅ готового бота для работы\n"
-        "✅ подробный и понятный мануал\n"
-        "✅ поддержку кураторов\n"
-        "✅ работу бок о бок с профессионалами\n"
-        "✅ практику, опыт и рост с первого дня\n\n"
-        "*Если хочешь развиваться и зарабатывать — тебе точно к нам!*"
-    )
-    
     keyboard = [
         [InlineKeyboardButton("👤 Мой профиль", callback_data="profile")],
         [InlineKeyboardButton("📋 Доступные задания", callback_data="available_tasks")],
+        [InlineKeyboardButton("🔎 Поиск заданий", callback_data="search")],
         [InlineKeyboardButton("📊 Моя статистика", callback_data="my_stats")],
         [InlineKeyboardButton("❓ Помощь", callback_data="help")]
     ]
     
-    if await AdminManager.is_admin(user.id):
+    if await menu_is_admin(user.id):
         keyboard.append([InlineKeyboardButton("👑 Админ панель", callback_data="admin_panel")])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await update.message.reply_text(
-        welcome_text,
+        Config.welcome(),
         reply_markup=reply_markup,
         parse_mode='Markdown'
     )
 
+async def menu_is_admin(user_id: int) -> bool:
+    """Показывать ли кнопку админ-панели (при недоступной БД — по последнему ответу)"""
+    try:
+        is_admin, _ = await LastKnownGood.read(('is_admin', user_id), lambda: AdminManager.is_admin(user_id))
+    except DatabaseUnavailable:
+        return False
+    return is_admin
+
+def stale_note(stale_since: Optional[datetime]) -> str:
+    """Пометка экрана, показанного по последним данным при недоступной БД"""
+    if not stale_since:
+        return ""
+    return texts.STALE_NOTE.render(since=stale_since)
+
 async def handle_tracking_link(update: Update, context: ContextTypes.DEFAULT_TYPE, link_id: str):
     """Обработка переходов по отслеживающим ссылкам"""
-    # Получаем информацию о ссылке
-    link_data = await TrackingLinksManager.get_link(link_id)
+    # Учитываем переход и получаем информацию о ссылке
+    link_data = await TrackingLinksManager.register_click(link_id)
     
     if not link_data:
         await update.message.reply_text("Ссылка не найдена или устарела.")
         return
     
-    # Увеличиваем счетчик кликов
-    await TrackingLinksManager.increment_clicks(link_id)
-    
     # Получаем информацию о задании
     task = await TaskManager.get_task(link_data["task_id"])
     
     if task:
-        await update.message.reply_text(
-            f"🎯 *Отслеживание включено!*\n\n"
-            f"*Задание:* {task['title']}\n"
-            f"*Описание:* {task['description']}\n\n"
-            f"Теперь ваши переходы по этой ссылке отслеживаются.",
-            parse_mode='Markdown'
-        )
+        await update.message.reply_text(texts.TRACKING_ENABLED.render(task=task), parse_mode='Markdown')
     else:
         await update.message.reply_text("🎯 Отслеживание включено!")
 
@@ -141,6 +227,14 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data == "my_completed_tasks":
         await show_my_completed_tasks(query, context)
     
+    elif data == "search":
+        await search_dialog(query, context)
+    elif data.startswith("search_"):
+        await update_search(query, context, data.replace("search_", ""))
+    elif data.startswith("leaderboard_"):
+        await show_leaderboard(query, context, data.replace("leaderboard_", ""))
+    elif data.startswith("tasks_filter_"):
+        await show_available_tasks(query, context, data.replace("tasks_filter_", ""))
     elif data.startswith("view_task_"):
         task_id = data.replace("view_task_", "")
         await view_task_details(query, context, task_id)
@@ -157,21 +251,28 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await create_task_dialog(query, context)
     elif data == "admin_view_stats":
         await view_admin_stats(query, context)
+    elif data == "admin_metrics":
+        await view_metrics(query, context)
     elif data == "admin_manage_blocks":
         await manage_blocks(query, context)
     elif data == "admin_add_admin":
         await add_admin_dialog(query, context)
     elif data == "admin_pending_links":
         await show_pending_links(query, context)
+    elif data == "admin_bulk_links":
+        await bulk_links_dialog(query, context)
     elif data.startswith("admin_remove_"):
         admin_id = int(data.replace("admin_remove_", ""))
         await remove_admin(query, context, admin_id)
     elif data.startswith("admin_set_link_"):
-        task_id = data.replace("admin_set_link_", "")
-        await set_work_link_dialog(query, context, task_id)
+        task_id, performer_id = parse_pending_key(data.replace("admin_set_link_", ""))
+        await set_work_link_dialog(query, context, task_id, performer_id)
     elif data.startswith("admin_skip_link_"):
-        task_id = data.replace("admin_skip_link_", "")
-        await skip_work_link(query, context, task_id)
+        task_id, performer_id = parse_pending_key(data.replace("admin_skip_link_", ""))
+        await skip_work_link(query, context, task_id, performer_id)
+    elif data.startswith("broadcast_task_"):
+        task_id = data.replace("broadcast_task_", "")
+        await start_task_broadcast(query, context, task_id)
     elif data == "back_to_admin":
         await show_admin_panel(query, context)
     elif data == "back_to_main":
@@ -188,6 +289,10 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await notification_settings_menu(query, context)
     elif data == "link_templates":
         await link_templates_menu(query, context)
+    elif data.startswith("settings_edit_"):
+        await edit_setting_dialog(query, context, data.replace("settings_edit_", ""))
+    elif data.startswith("settings_reset_"):
+        await reset_setting(query, context, data.replace("settings_reset_", ""))
     elif data == "view_all_tasks":
         await view_all_tasks_admin(query, context)
 
@@ -195,60 +300,45 @@ async def back_to_main_menu(query, context: ContextTypes.DEFAULT_TYPE):
     """Вернуться в главное меню"""
     user = query.from_user
     
-    welcome_text = "🚀 *Главное меню*\n\nВыберите раздел для работы:"
-    
     keyboard = [
         [InlineKeyboardButton("👤 Мой профиль", callback_data="profile")],
         [InlineKeyboardButton("📋 Доступные задания", callback_data="available_tasks")],
+        [InlineKeyboardButton("🔎 Поиск заданий", callback_data="search")],
         [InlineKeyboardButton("📊 Моя статистика", callback_data="my_stats")],
         [InlineKeyboardButton("❓ Помощь", callback_data="help")]
     ]
     
-    if await AdminManager.is_admin(user.id):
+    if await menu_is_admin(user.id):
         keyboard.append([InlineKeyboardButton("👑 Админ панель", callback_data="admin_panel")])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(welcome_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_screen(query, texts.MAIN_MENU.render(), reply_markup=reply_markup, parse_mode='Markdown')
 
 async def handle_task_type_selection(query, context, data):
     """Обработка выбора типа задания"""
-    task_type_map = {
-        "task_type_subscribers": "Привлечение подписчиков",
-        "task_type_ad": "Рекламный пост",
-        "task_type_clicks": "Переходы по ссылке",
-        "task_type_install": "Установка приложения"
-    }
-    
-    task_type = task_type_map.get(data, "Другое")
+    task_type = TASK_TYPES.get(data.replace("task_type_", ""), "Другое")
     
     if "creating_task" in context.user_data:
         context.user_data["creating_task"]["data"]["type"] = task_type
         context.user_data["creating_task"]["step"] = "target"
         
-        await query.edit_message_text(
-            "*Шаг 4 из 6*\n"
-            "Введите цель (количество/результат):\n\n"
-            "*Пример:* 1000 подписчиков, 500 переходов, 100 установок",
-            parse_mode='Markdown'
-        )
+        await edit_screen(query, texts.CREATE_TASK_TARGET.render(), parse_mode='Markdown')
 
 async def show_profile(query, context: ContextTypes.DEFAULT_TYPE):
     """Показать профиль пользователя"""
     user = query.from_user
-    stats = await UserManager.get_user_stats(user.id)
     
-    profile_text = (
-        f"👤 *Ваш профиль*\n\n"
-        f"*ID:* {user.id}\n"
-        f"*Имя:* {user.first_name}\n"
-        f"*Username:* @{user.username if user.username else 'не указан'}\n\n"
-        f"*Статистика:*\n"
-        f"✅ Выполнено заданий: {stats['completed_count']}\n"
-        f"📊 Активных заданий: {stats['active_count']}\n"
-        f"💰 Заработано всего: {stats['total_earned']} руб.\n"
-        f"⭐ Рейтинг: {stats['rating']}/100\n\n"
-        f"*Статус:* {'👑 Администратор' if await AdminManager.is_admin(user.id) else '👤 Исполнитель'}"
+    async def load():
+        return await UserManager.get_user_stats(user.id), await AdminManager.is_admin(user.id)
+    (stats, is_admin), stale_since = await LastKnownGood.read(('profile', user.id), load)
+    
+    profile_text = texts.PROFILE.render(
+        user=user,
+        username=user.username or 'не указан',
+        stats=stats,
+        status='👑 Администратор' if is_admin else '👤 Исполнитель',
+        stale=stale_note(stale_since)
     )
     
     keyboard = [
@@ -258,107 +348,196 @@ async def show_profile(query, context: ContextTypes.DEFAULT_TYPE):
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(profile_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_screen(query, profile_text, reply_markup=reply_markup, parse_mode='Markdown')
 
 async def show_my_active_tasks(query, context: ContextTypes.DEFAULT_TYPE):
     """Показать активные задания пользователя"""
     user_id = query.from_user.id
     
     # Получаем активные задания пользователя
-    pool = await PostgresDB.init_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch('''
-            SELECT t.* FROM tasks t
-            JOIN user_tasks ut ON t.task_id = ut.task_id
-            WHERE ut.user_id = $1 AND ut.status = 'active'
-        ''', user_id)
-    
-    if not rows:
+    tasks = await TaskManager.get_user_tasks(user_id, 'active')
+    
+    if not tasks:
         keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="profile")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
+        await edit_screen(query,
             "📭 У вас нет активных заданий.",
             reply_markup=reply_markup
         )
         return
     
-    tasks_text = "📋 *Ваши активные задания:*\n\n"
+    lines = [texts.ACTIVE_TASKS.render()]
     keyboard = []
     
-    for row in rows:
-        task = dict(row)
-        tasks_text += f"• {task['title']} - {task['reward']} руб.\n"
-        keyboard.append([InlineKeyboardButton(f"✅ Завершить: {task['title'][:20]}", callback_data=f"complete_task_{task['task_id']}")])
+    for task in tasks:
+        lines.append(texts.ACTIVE_TASK.render(task=task))
+        if task.deadline:
+            lines.append(texts.ACTIVE_TASK_DEADLINE.render(deadline=task.deadline.strftime(SCHEDULE_DATE_FORMAT)))
+        keyboard.append([InlineKeyboardButton(f"✅ Завершить: {task.title[:20]}", callback_data=f"complete_task_{task.task_id}")])
     
     keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="profile")])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(tasks_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_screen(query, join(lines), reply_markup=reply_markup, parse_mode='Markdown')
 
 async def show_my_completed_tasks(query, context: ContextTypes.DEFAULT_TYPE):
     """Показать выполненные задания пользователя"""
     user_id = query.from_user.id
     
     # Получаем выполненные задания пользователя
-    pool = await PostgresDB.init_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch('''
-            SELECT t.* FROM tasks t
-            JOIN user_tasks ut ON t.task_id = ut.task_id
-            WHERE ut.user_id = $1 AND ut.status = 'completed'
-            ORDER BY ut.completed_date DESC
-            LIMIT 10
-        ''', user_id)
-    
-    if not rows:
+    tasks = await TaskManager.get_user_tasks(user_id, 'completed', limit=10)
+    
+    if not tasks:
         keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="profile")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
+        await edit_screen(query,
             "📭 У вас нет выполненных заданий.",
             reply_markup=reply_markup
         )
         return
     
-    tasks_text = "📋 *Ваши последние выполненные задания:*\n\n"
-    
-    for row in rows:
-        task = dict(row)
-        tasks_text += f"✅ {task['title']} - {task['reward']} руб.\n"
+    tasks_text = join([texts.COMPLETED_TASKS.render()] + [texts.COMPLETED_TASK.render(task=task) for task in tasks])
     
     keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="profile")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(tasks_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_screen(query, tasks_text, reply_markup=reply_markup, parse_mode='Markdown')
 
-async def show_available_tasks(query, context: ContextTypes.DEFAULT_TYPE):
-    """Показать доступные задания"""
-    tasks = await TaskManager.get_available_tasks()
+async def show_available_tasks(query, context: ContextTypes.DEFAULT_TYPE, type_code: Optional[str] = None):
+    """Показать доступные задания (с фильтром по типу)"""
+    task_type = TASK_TYPES.get(type_code)
     
-    if not tasks:
+    async def load():
+        return await TaskManager.get_available_tasks(task_type, limit=10), await TaskManager.count_available_by_type()
+    (tasks, counts), stale_since = await LastKnownGood.read(('available_tasks', task_type), load)
+    
+    if not counts:
         keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
+        await edit_screen(query,
             "📭 На данный момент нет доступных заданий.\n"
-            "Загляните позже!",
+            "Загляните позже!" + stale_note(stale_since),
             reply_markup=reply_markup
         )
         return
     
     keyboard = []
-    for task in tasks[:10]:
-        btn_text = f"{task['title']} - {task['reward']} руб."
-        keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"view_task_{task['task_id']}")])
+    for task in tasks:
+        btn_text = f"{task.title} - {task.reward} руб.{format_slots(task)}"
+        keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"view_task_{task.task_id}")])
+    
+    # Фильтры по типу: только типы, по которым есть задания
+    filter_buttons = []
+    for code, label in TASK_TYPE_LABELS.items():
+        count = counts.get(TASK_TYPES[code], 0)
+        if count:
+            mark = "• " if code == type_code else ""
+            filter_buttons.append(InlineKeyboardButton(f"{mark}{label} ({count})", callback_data=f"tasks_filter_{code}"))
+    if task_type:
+        filter_buttons.append(InlineKeyboardButton("📋 Все типы", callback_data="available_tasks"))
+    keyboard.extend(filter_buttons[i:i + 2] for i in range(0, len(filter_buttons), 2))
     
     keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(
-        "📋 *Доступные задания:*\n\n"
-        "Выберите задание для просмотра деталей:",
+    template = texts.AVAILABLE_TASKS_OF_TYPE if task_type else texts.AVAILABLE_TASKS
+    hint = "Выберите задание для просмотра деталей:" if tasks else "Заданий этого типа сейчас нет."
+    
+    await edit_screen(query,
+        template.render(task_type=task_type, hint=hint, stale=stale_note(stale_since)),
         reply_markup=reply_markup,
         parse_mode='Markdown'
     )
 
+def new_search(text: Optional[str] = None) -> Dict:
+    """Состояние поиска в user_data"""
+    text = (text or "").strip()[:SEARCH_QUERY_MAX]
+    return {"text": None if text in ("", "-") else text, "type": None, "reward": "any", "page": 0}
+
+async def render_search(search: Dict) -> Tuple[str, InlineKeyboardMarkup]:
+    """Страница результатов поиска с фильтрами"""
+    min_reward, max_reward, reward_label = SEARCH_REWARD_RANGES[search["reward"]]
+    tasks, has_next = await TaskManager.search_tasks(
+        search["text"], TASK_TYPES.get(search["type"]), min_reward, max_reward,
+        limit=SEARCH_PAGE_SIZE, offset=search["page"] * SEARCH_PAGE_SIZE
+    )
+    
+    text = texts.SEARCH.render(
+        query=texts.SEARCH_QUERY.render(text=search["text"]) if search["text"] else "",
+        task_type=TASK_TYPES.get(search["type"], "все"),
+        reward=reward_label if search["reward"] != "any" else "любое",
+        hint=texts.SEARCH_PAGE.render(page=search["page"] + 1) if tasks else texts.SEARCH_NOTHING.render()
+    )
+    
+    keyboard = []
+    for task in tasks:
+        keyboard.append([InlineKeyboardButton(f"{task.title} - {task.reward} руб.{format_slots(task)}", callback_data=f"view_task_{task.task_id}")])
+    
+    type_buttons = [InlineKeyboardButton(("• " if search["type"] is None else "") + "Все типы", callback_data="search_type_all")]
+    for code, label in TASK_TYPE_LABELS.items():
+        mark = "• " if code == search["type"] else ""
+        type_buttons.append(InlineKeyboardButton(f"{mark}{label}", callback_data=f"search_type_{code}"))
+    keyboard.extend(type_buttons[i:i + 3] for i in range(0, len(type_buttons), 3))
+    keyboard.append([
+        InlineKeyboardButton(("• " if code == search["reward"] else "") + label, callback_data=f"search_reward_{code}")
+        for code, (_, _, label) in SEARCH_REWARD_RANGES.items()
+    ])
+    
+    pages = []
+    if search["page"] > 0:
+        pages.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"search_page_{search['page'] - 1}"))
+    if has_next:
+        pages.append(InlineKeyboardButton("Дальше ➡️", callback_data=f"search_page_{search['page'] + 1}"))
+    if pages:
+        keyboard.append(pages)
+    
+    keyboard.append([
+        InlineKeyboardButton("🔄 Новый поиск", callback_data="search"),
+        InlineKeyboardButton("🏠 Меню", callback_data="back_to_main")
+    ])
+    return text, InlineKeyboardMarkup(keyboard)
+
+async def search_dialog(query, context: ContextTypes.DEFAULT_TYPE):
+    """Начало поиска: ждем текст запроса"""
+    context.user_data["waiting_for_search"] = True
+    
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await edit_screen(query, texts.SEARCH_DIALOG.render(), reply_markup=reply_markup, parse_mode='Markdown')
+
+async def handle_search_query(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    """Текст поискового запроса из диалога поиска"""
+    context.user_data.pop("waiting_for_search", None)
+    search = context.user_data["search"] = new_search(text)
+    text, reply_markup = await render_search(search)
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /find <слова>"""
+    if not context.args:
+        context.user_data["waiting_for_search"] = True
+        await update.message.reply_text(texts.FIND_USAGE.render(), parse_mode='Markdown')
+        return
+    await handle_search_query(update, context, " ".join(context.args))
+
+async def update_search(query, context: ContextTypes.DEFAULT_TYPE, action: str):
+    """Фильтры и страницы поиска: type_<код>, reward_<код>, page_<номер>"""
+    search = context.user_data.get("search") or new_search()
+    kind, _, value = action.partition("_")
+    if kind == "type":
+        search["type"] = value if value in TASK_TYPES else None
+        search["page"] = 0
+    elif kind == "reward" and value in SEARCH_REWARD_RANGES:
+        search["reward"] = value
+        search["page"] = 0
+    elif kind == "page" and value.isdigit():
+        search["page"] = int(value)
+    context.user_data["search"] = search
+    
+    text, reply_markup = await render_search(search)
+    await edit_screen(query, text, reply_markup=reply_markup, parse_mode='Markdown')
+
 async def view_task_details(query, context: ContextTypes.DEFAULT_TYPE, task_id: str):
     """Показать детали задания"""
     task = await TaskManager.get_task(task_id)
@@ -367,70 +546,47 @@ async def view_task_details(query, context: ContextTypes.DEFAULT_TYPE, task_id:
         await query.answer("Задание не найдено!", show_alert=True)
         return
     
-    task_text = (
-        f"🎯 *{task['title']}*\n\n"
-        f"*Описание:* {task['description']}\n"
-        f"*Тип:* {task['type']}\n"
-        f"*Цель:* {task['target']}\n"
-        f"*Вознаграждение:* {task['reward']} руб.\n"
-        f"*Требования:* {task['requirements']}\n\n"
-        f"*Статус:* {'✅ Доступно' if task.get('available') else '❌ Занято'}"
+    task_text = texts.TASK_DETAILS.render(
+        task=task,
+        schedule=format_task_schedule(task.publish_at, task.expires_at, task.claim_timeout),
+        status='✅ Доступно' if task.available else '❌ Занято'
     )
+    if task.capacity and task.capacity > 1:
+        task_text += texts.TASK_DETAILS_SLOTS.render(task=task)
     
     keyboard = []
     
-    if task.get('available') and not task.get('taken_by'):
+    if task.available and task.slots_left:
         keyboard.append([InlineKeyboardButton("✅ Взять задание", callback_data=f"take_task_{task_id}")])
     
     keyboard.append([InlineKeyboardButton("◀️ Назад к заданиям", callback_data="available_tasks")])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(task_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_screen(query, task_text, reply_markup=reply_markup, parse_mode='Markdown')
 
 async def take_task(query, context: ContextTypes.DEFAULT_TYPE, task_id: str):
     """Взять задание"""
     user = query.from_user
-    task = await TaskManager.get_task(task_id)
     
-    if not task:
-        await query.answer("Задание не найдено!", show_alert=True)
-        return
+    # Назначение, отслеживающая ссылка и ожидающая выдача — один запрос
+    task = await TaskManager.take_task(task_id, user.id, user.username or f"id{user.id}")
     
-    # Назначаем задание пользователю
-    if await TaskManager.assign_task(task_id, user.id):
-        # Генерируем отслеживающую ссылку
-        tracking_link = await TaskManager.generate_tracking_link(user.id, task_id)
-        
-        # Сохраняем информацию о ожидающей ссылке
-        await PendingLinksManager.save_pending(task_id, {
-            'user_id': user.id,
-            'username': user.username or f"id{user.id}",
-            'task_title': task['title'],
-            'message_sent': datetime.now(),
-            'tracking_link': tracking_link
-        })
-        
-        notification_text = (
-            f"🚀 *НОВОЕ ЗАДАНИЕ ВЗЯТО!*\n\n"
-            f"*Исполнитель:* {user.first_name} (@{user.username if user.username else 'без username'})\n"
-            f"*Задание:* {task['title']}\n"
-            f"*Цель:* {task['target']}\n"
-            f"*Вознаграждение:* {task['reward']} руб.\n\n"
-            f"👑 *Администратору:*\n"
-            f"Выдайте исполнителю рабочую ссылку:\n"
-            f"`{tracking_link}`\n\n"
-            f"Используйте кнопки ниже для управления:"
+    if task:
+        notification_text = texts.TASK_TAKEN_NOTICE.render(
+            name=user.first_name,
+            username=user.username or 'без username',
+            task=task
         )
         
         keyboard = [
-            [InlineKeyboardButton("🔗 Отправить ссылку", callback_data=f"admin_set_link_{task_id}")],
-            [InlineKeyboardButton("⏭ Пропустить", callback_data=f"admin_skip_link_{task_id}")]
+            [InlineKeyboardButton("🔗 Отправить ссылку", callback_data=f"admin_set_link_{task_id}_{user.id}")],
+            [InlineKeyboardButton("⏭ Пропустить", callback_data=f"admin_skip_link_{task_id}_{user.id}")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         try:
             await context.bot.send_message(
-                chat_id=TASK_NOTIFICATION_GROUP,
+                chat_id=Config.get('notification_group'),
                 text=notification_text,
                 reply_markup=reply_markup,
                 parse_mode='Markdown'
@@ -438,14 +594,11 @@ async def take_task(query, context: ContextTypes.DEFAULT_TYPE, task_id: str):
         except Exception as e:
             logger.error(f"Ошибка отправки в группу: {e}")
         
-        success_text = (
-            f"✅ *Задание успешно взято!*\n\n"
-            f"*{task['title']}*\n\n"
-            f"Ожидайте, когда администратор выдаст вам "
-            f"специальную ссылку для работы в группе {TASK_NOTIFICATION_GROUP}\n\n"
-            f"Как получите ссылку — начинайте работу!\n"
-            f"После выполнения не забудьте отправить отчет."
-        )
+        success_text = texts.TASK_TAKEN.render(task=task, group=Config.get('notification_group'))
+        if task.claim_deadline:
+            success_text += texts.TASK_TAKEN_DEADLINE.render(
+                deadline=task.claim_deadline.strftime(SCHEDULE_DATE_FORMAT)
+            )
         
         keyboard = [
             [InlineKeyboardButton("📋 Мои задания", callback_data="my_active_tasks")],
@@ -453,142 +606,165 @@ async def take_task(query, context: ContextTypes.DEFAULT_TYPE, task_id: str):
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await query.edit_message_text(success_text, reply_markup=reply_markup, parse_mode='Markdown')
+        await edit_screen(query, success_text, reply_markup=reply_markup, parse_mode='Markdown')
     else:
-        await query.answer("Не удалось взять задание. Возможно, оно уже занято.", show_alert=True)
+        await query.answer(
+            "Не удалось взять задание. Возможно, свободные места закончились или вы уже взяли его.",
+            show_alert=True
+        )
 
 async def complete_task_dialog(query, context: ContextTypes.DEFAULT_TYPE, task_id: str):
     """Диалог завершения задания"""
     context.user_data["waiting_for_proof"] = task_id
     
-    await query.edit_message_text(
-        "📝 *Отправка отчета*\n\n"
-        "Пожалуйста, отправьте доказательство выполнения задания:\n"
-        "• Ссылку на результат\n"
-        "• Скриншот\n"
-        "• Текстовый отчет\n\n"
-        "Отправьте одним сообщением.",
-        parse_mode='Markdown'
-    )
+    await edit_screen(query, texts.PROOF_REQUEST.render(), parse_mode='Markdown')
 
 async def handle_proof_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка доказательств выполнения задания"""
-    user_id = update.effective_user.id
-    proof_text = update.message.text or update.message.caption or "Доказательство предоставлено"
-    
+    """Обработка доказательств выполнения задания: текст, фото, видео, файлы и альбомы"""
+    message = update.message
     task_id = context.user_data.get("waiting_for_proof")
     
     if not task_id:
         return
     
-    if await TaskManager.complete_task(task_id, user_id, proof_text):
-        task = await TaskManager.get_task(task_id)
-        
-        report_text = (
-            f"📊 *ЕЖЕДНЕВНЫЙ ОТЧЕТ*\n\n"
-            f"*Исполнитель:* {update.effective_user.first_name}\n"
-            f"*Задание:* {task['title']}\n"
-            f"*Результат:* Выполнено ✅\n"
-            f"*Вознаграждение:* {task['reward']} руб.\n"
-            f"*Доказательство:* {proof_text[:200]}..."
-        )
-        
+    if message.media_group_id:
+        # Части альбома приходят отдельными обновлениями: сдает обработчик первой
+        # части, когда придут остальные, — обработка следующих обновлений не ждет
+        if AlbumCollector.add(message):
+            async def submit_album():
+                proof = await AlbumCollector.collect(message.chat_id, message.media_group_id)
+                await submit_proof(context, update.effective_user, task_id, proof, deferred=True)
+            context.application.create_task(submit_album(), update=update)
+        return
+    
+    proof = Proof.from_message(message)
+    if not proof:
+        await message.reply_text("❌ Отправьте текст, ссылку, скриншот или файл.")
+        return
+    await submit_proof(context, update.effective_user, task_id, proof)
+
+async def submit_proof(context: ContextTypes.DEFAULT_TYPE, user, task_id: str, proof: Proof, deferred: bool = False):
+    """Сдача задания с доказательством и отчет в группу (сразу или в сводке)
+
+    В БД сохраняются только текст и file_id, в группу отчетов доказательство
+    копируется из сообщений исполнителя без скачивания файлов.
+    """
+    user_id = user.id
+    # Повторная отправка отчета, пока первый еще обрабатывается, не выполняется заново.
+    # Запоминается только успешная сдача: после неудачи отчет можно отправить снова
+    task, duplicate = await Idempotency.run(
+        ('proof', user_id, task_id),
+        lambda: TaskManager.complete_task(task_id, user_id, proof.dump()),
+        replay=bool
+    )
+    if duplicate and task:
+        # Ответ на принятый отчет уже отправлен первой попыткой
+        return
+    if task:
+        # При высокой нагрузке отчеты в группу уходят сводкой
         try:
-            await context.bot.send_message(
-                chat_id=REPORT_GROUP,
-                text=report_text,
-                parse_mode='Markdown'
-            )
+            await ReportDigest.add(report_entry(user.first_name, task.title, task.reward, proof))
         except Exception as e:
             logger.error(f"Ошибка отправки отчета: {e}")
         
-        await update.message.reply_text(
-            "✅ *Отчет успешно отправлен!*\n\n"
-            "Ваше задание отмечено как выполненное.\n"
-            "Вознаграждение будет начислено после проверки администратором.",
+        await context.bot.send_message(
+            chat_id=proof.chat_id,
+            text=texts.PROOF_ACCEPTED.render(),
             parse_mode='Markdown'
         )
         
         if "waiting_for_proof" in context.user_data:
             del context.user_data["waiting_for_proof"]
+            # Альбом сдается после обработки обновления — состояние сохраняется отдельно
+            if deferred and MULTI_REPLICA:
+                try:
+                    await UserStateManager.save(user_id, dict(context.user_data))
+                except DatabaseUnavailable:
+                    logger.warning(f"БД недоступна: состояние диалога {user_id} осталось только в памяти")
     else:
-        await update.message.reply_text("❌ Не удалось отправить отчет. Обратитесь к администратору.")
+        await context.bot.send_message(
+            chat_id=proof.chat_id, text="❌ Не удалось отправить отчет. Обратитесь к администратору."
+        )
 
 async def show_my_stats(query, context: ContextTypes.DEFAULT_TYPE):
     """Показать статистику пользователя"""
     user = query.from_user
     stats = await UserManager.get_user_stats(user.id)
     
-    stats_text = (
-        f"📊 *Ваша статистика*\n\n"
-        f"✅ *Выполнено заданий:* {stats['completed_count']}\n"
-        f"🎯 *Активных заданий:* {stats['active_count']}\n"
-        f"💰 *Всего заработано:* {stats['total_earned']} руб.\n"
-        f"⭐ *Рейтинг исполнителя:* {stats['rating']}/100\n\n"
-        f"*Эффективность:* {'🔥 Отличная' if stats['rating'] > 70 else '👍 Хорошая' if stats['rating'] > 40 else '💪 Набираете опыт'}\n\n"
-        f"Продолжайте в том же духе! Каждое выполненное задание повышает ваш рейтинг."
+    # Места в таблицах лидеров — из памяти, без запросов
+    ranks = []
+    for period, label in LEADERBOARD_PERIODS.items():
+        board = Leaderboards.board(period)
+        rank = board.rank(user.id)
+        ranks.append(f"{label}: {f'#{rank[0]} из {len(board)}' if rank else '—'}")
+    
+    rating = stats['rating']
+    stats_text = texts.MY_STATS.render(
+        stats=stats,
+        ranks="\n".join(ranks),
+        efficiency='🔥 Отличная' if rating > 70 else '👍 Хорошая' if rating > 40 else '💪 Набираете опыт'
     )
     
     keyboard = [
+        [InlineKeyboardButton("🏆 Таблица лидеров", callback_data="leaderboard_week")],
         [InlineKeyboardButton("📋 Мои задания", callback_data="my_active_tasks")],
         [InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(stats_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_screen(query, stats_text, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def show_leaderboard(query, context: ContextTypes.DEFAULT_TYPE, period: str):
+    """Таблица лидеров за период и место пользователя"""
+    if period not in LEADERBOARD_PERIODS:
+        period = "week"
+    user_id = query.from_user.id
+    board = Leaderboards.board(period)
+    
+    lines = [texts.LEADERBOARD.render(period=LEADERBOARD_PERIODS[period])]
+    top = board.top(LEADERBOARD_SIZE)
+    if not top:
+        lines.append(texts.LEADERBOARD_EMPTY.render())
+    for place, (leader_id, earned) in enumerate(top, 1):
+        # Чужие ID показываем не полностью
+        name = "Вы" if leader_id == user_id else f"ID …{str(leader_id)[-4:]}"
+        lines.append(texts.LEADERBOARD_ROW.render(place=place, name=name, earned=earned))
+    
+    rank = board.rank(user_id)
+    if rank and rank[0] > LEADERBOARD_SIZE:
+        lines.append(texts.LEADERBOARD_RANK.render(place=rank[0], size=len(board), earned=rank[1]))
+    elif not rank:
+        lines.append(texts.LEADERBOARD_UNRANKED.render())
+    
+    keyboard = [
+        [InlineKeyboardButton(("• " if code == period else "") + label, callback_data=f"leaderboard_{code}")
+         for code, label in LEADERBOARD_PERIODS.items()],
+        [InlineKeyboardButton("◀️ Назад", callback_data="my_stats")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await edit_screen(query, join(lines), reply_markup=reply_markup, parse_mode='Markdown')
 
 async def show_help(query, context: ContextTypes.DEFAULT_TYPE):
     """Показать справку"""
-    help_text = (
-        "❓ *Помощь и поддержка*\n\n"
-        "*Как работать с ботом:*\n"
-        "1. 👤 *Профиль* — ваша статистика и рейтинг\n"
-        "2. 📋 *Доступные задания* — выбирайте задания для выполнения\n"
-        "3. ✅ *Взятие задания* — после взятия ожидайте ссылку от админа\n"
-        "4. 📊 *Отчет* — после выполнения отправьте доказательство\n"
-        "5. 💰 *Вывод средств* — доступен от 500 руб. (обращаться к админу)\n\n"
-        "*Важные моменты:*\n"
-        "• Работаем только с белым трафиком\n"
-        "• Качество выполнения влияет на рейтинг\n"
-        "• Регулярные исполнители получают более выгодные задания\n"
-        "• Все вопросы к администратору\n\n"
-        "*Контакты поддержки:*\n"
-        "👑 Главный администратор: @main_admin"
-    )
     
     keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_main")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(help_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_screen(query, texts.HELP.render(), reply_markup=reply_markup, parse_mode='Markdown')
 
 # ========== АДМИН-ПАНЕЛЬ ==========
-async def show_admin_panel(query, context: ContextTypes.DEFAULT_TYPE):
-    """Показать админ-панель"""
-    user = query.from_user
-    
-    if not await AdminManager.is_admin(user.id):
-        await query.answer("Доступ запрещен!", show_alert=True)
-        return
-    
-    is_main = await AdminManager.is_main_admin(user.id)
-    
-    # Получаем количество ожидающих ссылок
-    pending_links = await PendingLinksManager.get_all_pending()
-    pending_count = len(pending_links)
-    
-    admin_text = (
-        f"👑 *Панель администратора*\n\n"
-        f"*Ваш статус:* {'Главный администратор' if is_main else 'Администратор'}\n"
-        f"*ID:* {user.id}\n"
-        f"*Дата входа:* {datetime.now().strftime('%d.%m.%Y %H:%M')}\n"
-        f"*Ожидает ссылок:* {pending_count}"
-    )
-    
+def admin_panel_keyboard(pending_count: int, is_main: bool) -> InlineKeyboardMarkup:
+    """Клавиатура админ-панели"""
     keyboard = [
         [InlineKeyboardButton("📊 Общая статистика", callback_data="admin_view_stats")],
         [InlineKeyboardButton("➕ Создать задание", callback_data="admin_create_task")],
         [InlineKeyboardButton("📁 Управление заданиями", callback_data="admin_manage_tasks")],
+        [InlineKeyboardButton("⚙️ Настройки бота", callback_data="admin_manage_blocks")],
     ]
+    # Метрики копятся только в PostgreSQL
+    if USES_POSTGRES:
+        keyboard.insert(1, [InlineKeyboardButton("📈 Динамика", callback_data="admin_metrics")])
     
     if pending_count > 0:
         keyboard.append([InlineKeyboardButton(f"🔗 Выдать ссылки ({pending_count})", callback_data="admin_pending_links")])
@@ -598,8 +774,32 @@ async def show_admin_panel(query, context: ContextTypes.DEFAULT_TYPE):
     
     keyboard.append([InlineKeyboardButton("🏠 В главное меню", callback_data="back_to_main")])
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(admin_text, reply_markup=reply_markup, parse_mode='Markdown')
+    return InlineKeyboardMarkup(keyboard)
+
+async def show_admin_panel(query, context: ContextTypes.DEFAULT_TYPE):
+    """Показать админ-панель"""
+    user = query.from_user
+    
+    if not await AdminManager.is_admin(user.id):
+        await query.answer("Доступ запрещен!", show_alert=True)
+        return
+    
+    is_main = user.id == MAIN_ADMIN_ID
+    
+    # Количество ожидающих ссылок берем из снимка в памяти
+    dashboard = await AdminDashboard.get()
+    pending_count = dashboard['pending_count']
+    
+    admin_text = texts.ADMIN_PANEL.render(
+        status='Главный администратор' if is_main else 'Администратор',
+        user_id=user.id,
+        now=datetime.now(),
+        pending_count=pending_count,
+        refreshed_at=dashboard['refreshed_at']
+    )
+    
+    reply_markup = admin_panel_keyboard(pending_count, is_main)
+    await edit_screen(query, admin_text, reply_markup=reply_markup, parse_mode='Markdown')
 
 async def show_pending_links(query, context: ContextTypes.DEFAULT_TYPE):
     """Показать ожидающие ссылки"""
@@ -607,81 +807,78 @@ async def show_pending_links(query, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("Доступ запрещен!", show_alert=True)
         return
     
-    pending_links = await PendingLinksManager.get_all_pending()
+    # Показываем первые пять; общее количество — из снимка админ-панели
+    pending_links = await PendingLinksManager.get_all_pending(limit=5)
+    pending_count = max(len(pending_links), (await AdminDashboard.get())['pending_count'])
     
     if not pending_links:
         keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="admin_panel")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
-            "🔗 *Нет ожидающих ссылок*\n\n"
-            "Все ссылки выданы.",
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
-        )
+        await edit_screen(query, texts.PENDING_LINKS_EMPTY.render(), reply_markup=reply_markup, parse_mode='Markdown')
         return
     
-    text = "🔗 *Ожидают выдачи ссылок:*\n\n"
+    lines = [texts.PENDING_LINKS.render()]
     keyboard = []
     
-    for i, pending in enumerate(pending_links[:5], 1):
-        text += f"{i}. *{pending['task_title']}*\n"
-        text += f"   Исполнитель: {pending['username']}\n"
-        text += f"   ID: {pending['user_id']}\n"
-        text += f"   Ссылка: `{pending['tracking_link']}`\n\n"
+    for i, pending in enumerate(pending_links, 1):
+        lines.append(texts.PENDING_LINK.render(number=i, pending=pending))
         
         keyboard.append([InlineKeyboardButton(
             f"✅ {pending['task_title'][:20]} - отметить выдано", 
-            callback_data=f"admin_set_link_{pending['task_id']}"
+            callback_data=f"admin_set_link_{pending['task_id']}_{pending['user_id']}"
         )])
     
-    if len(pending_links) > 5:
-        text += f"... и еще {len(pending_links) - 5} заданий\n\n"
+    if pending_count > len(pending_links):
+        lines.append(texts.PENDING_LINKS_MORE.render(count=pending_count - len(pending_links)))
     
+    keyboard.append([InlineKeyboardButton("📥 Выдать списком", callback_data="admin_bulk_links")])
     keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_panel")])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_screen(query, join(lines), reply_markup=reply_markup, parse_mode='Markdown')
 
-async def set_work_link_dialog(query, context: ContextTypes.DEFAULT_TYPE, task_id: str):
+async def set_work_link_dialog(query, context: ContextTypes.DEFAULT_TYPE, task_id: str,
+                               performer_id: Optional[int] = None):
     """Диалог установки рабочей ссылки"""
     if not await AdminManager.is_admin(query.from_user.id):
         await query.answer("Доступ запрещен!", show_alert=True)
         return
     
-    pending = await PendingLinksManager.get_pending(task_id)
+    pending = await PendingLinksManager.get_pending(task_id, performer_id)
     
     if not pending:
         await query.answer("Задание не найдено в списке ожидающих!", show_alert=True)
         return
     
-    context.user_data["setting_link_for"] = task_id
+    context.user_data["setting_link_for"] = [task_id, pending['user_id']]
     
-    await query.edit_message_text(
-        f"🔗 *Установка рабочей ссылки*\n\n"
-        f"*Задание:* {pending['task_title']}\n"
-        f"*Исполнитель:* {pending['username']}\n"
-        f"*Отслеживающая ссылка:*\n"
-        f"`{pending['tracking_link']}`\n\n"
-        f"Отправьте рабочую ссылку для этого задания.\n"
-        f"Или нажмите кнопку 'Пропустить'.",
-        parse_mode='Markdown'
-    )
+    await edit_screen(query, texts.WORK_LINK_DIALOG.render(pending=pending), parse_mode='Markdown')
     
-    keyboard = [[InlineKeyboardButton("⏭ Пропустить", callback_data=f"admin_skip_link_{task_id}")]]
+    keyboard = [[InlineKeyboardButton("⏭ Пропустить", callback_data=f"admin_skip_link_{task_id}_{pending['user_id']}")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_reply_markup(reply_markup=reply_markup)
+    await edit_markup(query, reply_markup)
 
-async def skip_work_link(query, context: ContextTypes.DEFAULT_TYPE, task_id: str):
+async def skip_work_link(query, context: ContextTypes.DEFAULT_TYPE, task_id: str,
+                         performer_id: Optional[int] = None):
     """Пропустить установку рабочей ссылки"""
     if not await AdminManager.is_admin(query.from_user.id):
         await query.answer("Доступ запрещен!", show_alert=True)
         return
     
-    await PendingLinksManager.delete_pending(task_id)
+    if performer_id is None:
+        # Кнопка старого сообщения: снимается самая ранняя выдача по заданию
+        pending = await PendingLinksManager.get_pending(task_id)
+        performer_id = pending['user_id'] if pending else None
+    if performer_id is not None:
+        await PendingLinksManager.delete_pending(task_id, performer_id)
     await query.answer("✅ Задание отмечено как выданное", show_alert=True)
     await show_pending_links(query, context)
 
+def work_link_message(task_title: str, work_link: str) -> str:
+    """Текст сообщения исполнителю с рабочей ссылкой"""
+    return texts.WORK_LINK.render(title=task_title, link=work_link)
+
 async def handle_work_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка рабочей ссылки от админа"""
     user_id = update.effective_user.id
@@ -689,45 +886,30 @@ async def handle_work_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await AdminManager.is_admin(user_id):
         return
     
-    task_id = context.user_data.get("setting_link_for")
-    if not task_id:
+    setting_link_for = context.user_data.get("setting_link_for")
+    if not setting_link_for:
         return
+    # Диалог, начатый до появления мест, хранит только ID задания
+    task_id, performer_id = setting_link_for if isinstance(setting_link_for, list) else (setting_link_for, None)
     
     work_link = update.message.text
     
-    # Сохраняем рабочую ссылку
-    await TaskManager.set_work_link(task_id, work_link)
-    
-    # Получаем информацию о задании и исполнителе
-    pending = await PendingLinksManager.get_pending(task_id)
-    task = await TaskManager.get_task(task_id)
+    # Сохраняем ссылку и снимаем выдачу из ожидающих — один запрос
+    pending = await TaskManager.issue_work_link(task_id, work_link, performer_id)
     
-    if pending and task:
+    if pending:
         # Отправляем ссылку исполнителю
         try:
             await context.bot.send_message(
                 chat_id=pending['user_id'],
-                text=(
-                    f"🔗 *Рабочая ссылка готова!*\n\n"
-                    f"*Задание:* {task['title']}\n"
-                    f"*Ваша ссылка:*\n"
-                    f"{work_link}\n\n"
-                    f"Используйте эту ссылку для выполнения задания.\n"
-                    f"После выполнения отправьте отчет командой /start и выберите задание."
-                ),
+                text=work_link_message(pending['title'], work_link),
                 parse_mode='Markdown'
             )
         except Exception as e:
             logger.error(f"Ошибка отправки ссылки пользователю: {e}")
         
-        # Удаляем из ожидающих
-        await PendingLinksManager.delete_pending(task_id)
-        
         await update.message.reply_text(
-            f"✅ *Ссылка отправлена!*\n\n"
-            f"Задание: {task['title']}\n"
-            f"Исполнитель: {pending['username']}\n"
-            f"Ссылка: {work_link}",
+            texts.WORK_LINK_SENT.render(title=pending['title'], username=pending['username'], link=work_link),
             parse_mode='Markdown'
         )
     else:
@@ -735,6 +917,122 @@ async def handle_work_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     del context.user_data["setting_link_for"]
 
+async def bulk_links_dialog(query, context: ContextTypes.DEFAULT_TYPE):
+    """Диалог массовой выдачи рабочих ссылок"""
+    if not await AdminManager.is_admin(query.from_user.id):
+        await query.answer("Доступ запрещен!", show_alert=True)
+        return
+    
+    context.user_data["bulk_links"] = True
+    
+    keyboard = [[InlineKeyboardButton("◀️ Отмена", callback_data="admin_pending_links")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await edit_screen(query,
+        texts.BULK_LINKS_DIALOG.render(limit=BULK_LINKS_MAX),
+        reply_markup=reply_markup,
+        parse_mode='Markdown'
+    )
+
+def parse_bulk_links(text: str) -> Tuple[Dict[Tuple[str, Optional[int]], str], List[str]]:
+    """Разбор строк «task_id[/user_id] ссылка»: ссылки по выдачам и нераспознанные строки"""
+    links = {}
+    bad_lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = BULK_LINK_LINE.match(line)
+        if match:
+            task_id, performer_id, link = match.groups()
+            links[(task_id, int(performer_id) if performer_id else None)] = link
+        else:
+            bad_lines.append(line)
+    return links, bad_lines
+
+async def handle_bulk_links(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    """Применение массовой выдачи ссылок и рассылка исполнителям"""
+    if not await AdminManager.is_admin(update.effective_user.id):
+        return
+    
+    links, bad_lines = parse_bulk_links(text)
+    
+    if len(links) > BULK_LINKS_MAX:
+        await update.message.reply_text(f"❌ Слишком много строк: {len(links)}. Максимум — {BULK_LINKS_MAX}.")
+        return
+    if not links:
+        await update.message.reply_text("❌ Не найдено ни одной строки вида «ID_задания ссылка». Попробуйте еще раз.")
+        return
+    
+    del context.user_data["bulk_links"]
+    
+    # Все ссылки сохраняются и снимаются из ожидающих одной транзакцией
+    issued = await TaskManager.issue_work_links(links)
+    issued_keys = {(pending['task_id'], pending['user_id']) for pending in issued}
+    issued_tasks = {task_id for task_id, _ in issued_keys}
+    not_found = [
+        task_id if performer_id is None else f"{task_id}/{performer_id}"
+        for task_id, performer_id in links
+        if (task_id not in issued_tasks if performer_id is None else (task_id, performer_id) not in issued_keys)
+    ]
+    
+    summary = texts.BULK_LINKS_SUMMARY.render(issued=len(issued), not_found=len(not_found), bad_lines=len(bad_lines))
+    if not_found:
+        summary += texts.BULK_LINKS_NOT_FOUND.render(
+            ids=join((texts.BULK_LINKS_ID.render(key=key) for key in not_found[:20]), ", "),
+            more=texts.BULK_LINKS_MORE.render(count=len(not_found) - 20) if len(not_found) > 20 else ""
+        )
+    
+    status_message = await update.message.reply_text(
+        summary + texts.BULK_LINKS_DELIVERING.render(),
+        parse_mode='Markdown'
+    )
+    
+    # Доставка идет в фоне в общем лимите рассылок, не блокируя обработку обновлений
+    messages = [(pending['user_id'], work_link_message(pending['title'], pending['link'])) for pending in issued]
+    
+    async def deliver():
+        results = await fan_out(context.bot, messages)
+        try:
+            await status_message.edit_text(
+                summary + texts.BULK_LINKS_DELIVERED.render(sent=results['sent'], failed=results['failed'] + results['blocked']),
+                parse_mode='Markdown'
+            )
+        except Exception as e:
+            logger.error(f"Не удалось обновить итог массовой выдачи: {e}")
+        logger.info(f"Массовая выдача ссылок: выдано {len(issued)}, доставка {dict(results)}")
+    
+    context.application.create_task(deliver())
+
+async def handle_media_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка фото, видео и файлов: доказательство или список ссылок"""
+    if context.user_data.get("waiting_for_proof"):
+        logger.info(f"Пользователь {update.effective_user.id} отправляет доказательство с вложением")
+        await handle_proof_message(update, context)
+        return
+    if update.message.document:
+        await handle_document_message(update, context)
+
+async def handle_document_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка загруженных файлов (список ссылок для массовой выдачи)"""
+    if not context.user_data.get("bulk_links"):
+        return
+    
+    document = update.message.document
+    if document.file_size and document.file_size > BULK_LINKS_FILE_MAX_BYTES:
+        await update.message.reply_text("❌ Файл слишком большой. Максимум — 512 КБ.")
+        return
+    
+    file = await document.get_file()
+    content = await file.download_as_bytearray()
+    try:
+        text = content.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        await update.message.reply_text("❌ Файл должен быть текстовым в кодировке UTF-8.")
+        return
+    
+    await handle_bulk_links(update, context, text)
+
 async def manage_admins(query, context: ContextTypes.DEFAULT_TYPE):
     """Управление администраторами"""
     if not await AdminManager.is_main_admin(query.from_user.id):
@@ -743,13 +1041,10 @@ async def manage_admins(query, context: ContextTypes.DEFAULT_TYPE):
     
     admins = await AdminManager.get_all_admins()
     
-    admin_list = "👥 *Список администраторов:*\n\n"
-    admin_list += f"👑 Главный администратор (ID: {MAIN_ADMIN_ID})\n\n"
-    
-    for admin in admins:
-        admin_list += f"👤 Администратор (ID: {admin['user_id']})\n"
-        admin_list += f"   Username: {admin.get('username', 'не указан')}\n"
-        admin_list += f"   Добавлен: {admin['added_date'].strftime('%d.%m.%Y')}\n\n"
+    admin_list = join([texts.ADMINS.render(main_admin_id=MAIN_ADMIN_ID)] + [
+        texts.ADMIN.render(admin=admin, username=admin.get('username', 'не указан'))
+        for admin in admins
+    ])
     
     keyboard = []
     
@@ -761,7 +1056,7 @@ async def manage_admins(query, context: ContextTypes.DEFAULT_TYPE):
     keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_panel")])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(admin_list, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_screen(query, admin_list, reply_markup=reply_markup, parse_mode='Markdown')
 
 async def add_admin_dialog(query, context: ContextTypes.DEFAULT_TYPE):
     """Диалог добавления администратора"""
@@ -771,15 +1066,7 @@ async def add_admin_dialog(query, context: ContextTypes.DEFAULT_TYPE):
     
     context.user_data["waiting_for_admin_id"] = True
     
-    await query.edit_message_text(
-        "👥 *Добавление администратора*\n\n"
-        "Отправьте мне ID пользователя, которого хотите сделать администратором.\n\n"
-        "*Как получить ID пользователя:*\n"
-        "1. Попросите пользователя написать @userinfobot\n"
-        "2. Или перешлите мне любое сообщение от этого пользователя\n\n"
-        "Отправьте ID или перешлите сообщение:",
-        parse_mode='Markdown'
-    )
+    await edit_screen(query, texts.ADD_ADMIN_DIALOG.render(), parse_mode='Markdown')
 
 async def handle_admin_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка ID нового администратора"""
@@ -809,12 +1096,10 @@ async def handle_admin_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         del context.user_data["waiting_for_admin_id"]
         
-        success_text = (
-            f"✅ *Администратор добавлен!*\n\n"
-            f"*ID:* {target_user_id}\n"
-            f"*Имя:* {target_username}\n"
-            f"*Добавил:* {update.effective_user.first_name}\n\n"
-            f"Пользователь теперь имеет доступ к админ-панели."
+        success_text = texts.ADMIN_ADDED.render(
+            user_id=target_user_id,
+            name=target_username,
+            added_by=update.effective_user.first_name
         )
         
         keyboard = [[InlineKeyboardButton("◀️ К списку админов", callback_data="admin_manage_admins")]]
@@ -825,11 +1110,7 @@ async def handle_admin_id(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             await context.bot.send_message(
                 chat_id=target_user_id,
-                text=(
-                    f"🎉 *Поздравляем!*\n\n"
-                    f"Вас назначили администратором в боте Traffic Team!\n\n"
-                    f"Теперь у вас есть доступ к админ-панели. Используйте команду /start для начала работы."
-                ),
+                text=texts.ADMIN_APPOINTED.render(),
                 parse_mode='Markdown'
             )
         except Exception as e:
@@ -867,13 +1148,7 @@ async def create_task_dialog(query, context: ContextTypes.DEFAULT_TYPE):
         "data": {}
     }
     
-    await query.edit_message_text(
-        "➕ *Создание нового задания*\n\n"
-        "*Шаг 1 из 6*\n"
-        "Введите заголовок задания:\n\n"
-        "*Пример:* Привлечение подписчиков в Telegram-канал",
-        parse_mode='Markdown'
-    )
+    await edit_screen(query, texts.CREATE_TASK_TITLE.render(), parse_mode='Markdown')
 
 async def handle_task_creation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка создания задания по шагам"""
@@ -897,13 +1172,7 @@ async def handle_task_creation(update: Update, context: ContextTypes.DEFAULT_TYP
         task_data["data"]["title"] = text
         task_data["step"] = "description"
         
-        await update.message.reply_text(
-            "*Шаг 2 из 6*\n"
-            "Введите подробное описание задания:\n\n"
-            "*Пример:* Необходимо привлечь 1000 реальных подписчиков в канал @example. "
-            "Подписчики должны быть активными, не ботами.",
-            parse_mode='Markdown'
-        )
+        await update.message.reply_text(texts.CREATE_TASK_DESCRIPTION.render(), parse_mode='Markdown')
     
     elif step == "description":
         task_data["data"]["description"] = text
@@ -918,8 +1187,7 @@ async def handle_task_creation(update: Update, context: ContextTypes.DEFAULT_TYP
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await update.message.reply_text(
-            "*Шаг 3 из 6*\n"
-            "Выберите тип задания:",
+            texts.CREATE_TASK_TYPE.render(),
             reply_markup=reply_markup,
             parse_mode='Markdown'
         )
@@ -928,30 +1196,39 @@ async def handle_task_creation(update: Update, context: ContextTypes.DEFAULT_TYP
         task_data["data"]["target"] = text
         task_data["step"] = "reward"
         
-        await update.message.reply_text(
-            "*Шаг 5 из 6*\n"
-            "Введите вознаграждение (в рублях):\n\n"
-            "*Пример:* 1500",
-            parse_mode='Markdown'
-        )
+        await update.message.reply_text(texts.CREATE_TASK_REWARD.render(), parse_mode='Markdown')
     
     elif step == "reward":
         try:
             reward = float(text)
             task_data["data"]["reward"] = reward
-            task_data["step"] = "requirements"
+            task_data["step"] = "capacity"
             
-            await update.message.reply_text(
-                "*Шаг 6 из 6*\n"
-                "Введите дополнительные требования (или '-' если нет):\n\n"
-                "*Пример:* Только реальные пользователи, без накрутки",
-                parse_mode='Markdown'
-            )
+            await update.message.reply_text(texts.CREATE_TASK_CAPACITY.render(), parse_mode='Markdown')
         except ValueError:
             await update.message.reply_text("❌ Пожалуйста, введите число (например: 1500)")
     
+    elif step == "capacity":
+        if not text.isdigit() or not 1 <= int(text) <= TASK_CAPACITY_MAX:
+            await update.message.reply_text(f"❌ Введите целое число от 1 до {TASK_CAPACITY_MAX}")
+            return
+        task_data["data"]["capacity"] = int(text)
+        task_data["step"] = "requirements"
+        
+        await update.message.reply_text(texts.CREATE_TASK_REQUIREMENTS.render(), parse_mode='Markdown')
+    
     elif step == "requirements":
         task_data["data"]["requirements"] = text
+        task_data["step"] = "schedule"
+        
+        await update.message.reply_text(texts.CREATE_TASK_SCHEDULE.render(), parse_mode='Markdown')
+    
+    elif step == "schedule":
+        try:
+            schedule = parse_task_schedule(text)
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}\n\nПопробуйте еще раз или отправьте '-'")
+            return
         
         # Создаем задание
         task_id = await TaskManager.create_task(
@@ -961,67 +1238,256 @@ async def handle_task_creation(update: Update, context: ContextTypes.DEFAULT_TYP
             target=task_data["data"]["target"],
             reward=task_data["data"]["reward"],
             created_by=user_id,
-            requirements=task_data["data"]["requirements"]
+            requirements=task_data["data"]["requirements"],
+            capacity=task_data["data"].get("capacity", 1),
+            **schedule
         )
         
         # Очищаем состояние
         del context.user_data["creating_task"]
         
         # Сообщаем об успехе
-        success_text = (
-            f"✅ *Задание успешно создано!*\n\n"
-            f"*ID задания:* {task_id}\n"
-            f"*Название:* {task_data['data']['title']}\n"
-            f"*Цель:* {task_data['data']['target']}\n"
-            f"*Вознаграждение:* {task_data['data']['reward']} руб.\n\n"
-            f"Задание теперь доступно для выполнения в разделе 'Доступные задания'."
+        publish_later = schedule.get("publish_at") and schedule["publish_at"] > datetime.now()
+        success_text = texts.TASK_CREATED.render(
+            task_id=task_id,
+            data=task_data["data"],
+            capacity=task_data["data"].get("capacity", 1),
+            schedule=format_task_schedule(**schedule),
+            availability=(texts.TASK_PUBLISH_LATER if publish_later else texts.TASK_PUBLISHED).render()
         )
         
         keyboard = [[InlineKeyboardButton("➕ Создать еще", callback_data="admin_create_task")]]
+        # Рассылки с продолжением после рестарта хранятся в PostgreSQL
+        if USES_POSTGRES:
+            keyboard.insert(0, [InlineKeyboardButton("📣 Разослать всем исполнителям", callback_data=f"broadcast_task_{task_id}")])
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await update.message.reply_text(success_text, reply_markup=reply_markup, parse_mode='Markdown')
 
+def parse_task_schedule(text: str) -> Dict:
+    """Разбор шага расписания: публикация, окончание, часы на выполнение"""
+    schedule = {}
+    if text.strip() == '-':
+        return schedule
+    for line in text.strip().splitlines():
+        if not line.strip():
+            continue
+        key, sep, value = line.partition(':')
+        key, value = key.strip().lower(), value.strip()
+        if not sep or not value:
+            raise ValueError(f"Не понял строку: {line.strip()}")
+        if key.startswith("публ") or key.startswith("оконч"):
+            try:
+                moment = datetime.strptime(value, SCHEDULE_DATE_FORMAT)
+            except ValueError:
+                raise ValueError(f"Неверная дата: {value} (нужно ДД.ММ.ГГГГ ЧЧ:ММ)")
+            schedule["publish_at" if key.startswith("публ") else "expires_at"] = moment
+        elif "выполн" in key:
+            try:
+                hours = float(value.replace(',', '.'))
+            except ValueError:
+                raise ValueError(f"Неверное число часов: {value}")
+            if hours <= 0:
+                raise ValueError("Время на выполнение должно быть больше нуля")
+            schedule["claim_timeout"] = int(hours * 60)
+        else:
+            raise ValueError(f"Неизвестный пункт: {key}")
+    if schedule.get("publish_at") and schedule.get("expires_at") \
+            and schedule["expires_at"] <= schedule["publish_at"]:
+        raise ValueError("Окончание должно быть позже публикации")
+    return schedule
+
+def format_task_schedule(publish_at: Optional[datetime] = None,
+                         expires_at: Optional[datetime] = None,
+                         claim_timeout: Optional[int] = None) -> Markup:
+    """Строки со сроками задания (пусто, если сроков нет)"""
+    lines = []
+    if publish_at and publish_at > datetime.now():
+        lines.append(texts.SCHEDULE_PUBLISH.render(moment=publish_at.strftime(SCHEDULE_DATE_FORMAT)))
+    if expires_at:
+        lines.append(texts.SCHEDULE_EXPIRES.render(moment=expires_at.strftime(SCHEDULE_DATE_FORMAT)))
+    if claim_timeout:
+        lines.append(texts.SCHEDULE_CLAIM_TIMEOUT.render(hours=claim_timeout / 60))
+    return join(line + "\n" for line in lines)
+
+def format_slots(task) -> str:
+    """Свободные места для строки списка (пусто у заданий на одного исполнителя)"""
+    if not task.capacity or task.capacity <= 1:
+        return ""
+    return f" · мест: {task.slots_left}/{task.capacity}"
+
+def task_status_icon(task: TaskAdminRow) -> str:
+    """✅ выполнено всеми, 🟡 есть исполнители в работе, 🟢 только свободные места"""
+    if task.completed:
+        return "✅"
+    in_progress = (task.capacity or 1) - (task.slots_left or 0) - (task.slots_done or 0)
+    return "🟡" if in_progress > 0 else "🟢"
+
+def parse_pending_key(value: str) -> Tuple[str, Optional[int]]:
+    """Задание и исполнитель из callback выдачи ссылки: «task_id_user_id»
+
+    Кнопки, отправленные до появления мест, содержат только ID задания.
+    """
+    task_id, _, performer_id = value.partition("_")
+    return task_id, int(performer_id) if performer_id.isdigit() else None
+
+async def start_task_broadcast(query, context: ContextTypes.DEFAULT_TYPE, task_id: str):
+    """Запуск рассылки анонса задания всем пользователям"""
+    if not await AdminManager.is_admin(query.from_user.id):
+        await query.answer("Доступ запрещен!", show_alert=True)
+        return
+    
+    task = await TaskManager.get_task(task_id)
+    if not task:
+        await query.answer("Задание не найдено!", show_alert=True)
+        return
+    
+    if not USES_POSTGRES:
+        await query.answer("Рассылки доступны только с хранилищем PostgreSQL", show_alert=True)
+        return
+    
+    if await BroadcastManager.is_running_for_task(task_id):
+        await query.answer("Рассылка по этому заданию уже идет", show_alert=True)
+        return
+    
+    # Это сообщение будет показывать прогресс рассылки
+    await edit_screen(query, texts.BROADCAST_STARTING.render(task=task), parse_mode='Markdown')
+    
+    broadcast = await BroadcastManager.create(
+        text=task_announcement(task),
+        task_id=task_id,
+        created_by=query.from_user.id,
+        report_chat_id=query.message.chat_id,
+        report_message_id=query.message.message_id
+    )
+    
+    # На другой реплике рассылку подхватит лидер при ближайшей проверке
+    if LeaderElection.is_leader():
+        BroadcastEngine.start(context.bot, broadcast)
+    
+    logger.info(f"Админ {query.from_user.id} запустил рассылку {broadcast['broadcast_id']} для задания {task_id}")
+
 async def view_admin_stats(query, context: ContextTypes.DEFAULT_TYPE):
     """Просмотр статистики для администратора"""
     if not await AdminManager.is_admin(query.from_user.id):
         await query.answer("Доступ запрещен!", show_alert=True)
         return
     
-    pool = await PostgresDB.init_pool()
-    async with pool.acquire() as conn:
-        # Общая статистика
-        total_users = await conn.fetchval('SELECT COUNT(*) FROM users')
-        total_tasks = await conn.fetchval('SELECT COUNT(*) FROM tasks')
-        active_tasks = await conn.fetchval('SELECT COUNT(*) FROM tasks WHERE active = true AND taken_by IS NOT NULL')
-        completed_tasks = await conn.fetchval('SELECT COUNT(*) FROM tasks WHERE completed = true')
-        total_payout = await conn.fetchval('SELECT COALESCE(SUM(reward), 0) FROM tasks WHERE completed = true')
-        
-        # Топ исполнителей
-        top_users = await conn.fetch('''
-            SELECT user_id, earned FROM users 
-            WHERE earned > 0 
-            ORDER BY earned DESC 
-            LIMIT 5
-        ''')
-    
-    stats_text = (
-        f"📊 *Общая статистика системы*\n\n"
-        f"*Пользователей:* {total_users}\n"
-        f"*Всего заданий:* {total_tasks}\n"
-        f"*Активных заданий:* {active_tasks}\n"
-        f"*Выполненных заданий:* {completed_tasks}\n"
-        f"*Общая выплата:* {total_payout} руб.\n\n"
-        f"*Топ-5 исполнителей:*\n"
+    # Общая статистика — из снимка админ-панели
+    dashboard = await AdminDashboard.get()
+    
+    # Топ исполнителей — из таблицы лидеров в памяти
+    top_users = Leaderboards.board('all').top(5)
+    
+    stats_text = join([texts.ADMIN_STATS.render(dashboard=dashboard)] + [
+        texts.ADMIN_STATS_TOP.render(place=i, user_id=user_id, earned=earned)
+        for i, (user_id, earned) in enumerate(top_users, 1)
+    ])
+    
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="admin_panel")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await edit_screen(query, stats_text, reply_markup=reply_markup, parse_mode='Markdown')
+
+def format_metrics(totals: Dict) -> str:
+    """Строка с метриками за период"""
+    return (
+        f"👆 {totals['click'][0]} · 🎯 {totals['conversion'][0]} · "
+        f"✋ {totals['take'][0]} · ✅ {totals['completion'][0]} · "
+        f"💰 {totals['completion'][1]:g} руб."
     )
+
+async def view_metrics(query, context: ContextTypes.DEFAULT_TYPE):
+    """Динамика системы за периоды и по дням"""
+    if not await AdminManager.is_admin(query.from_user.id):
+        await query.answer("Доступ запрещен!", show_alert=True)
+        return
+    if not USES_POSTGRES:
+        await query.answer("Динамика доступна только с хранилищем PostgreSQL", show_alert=True)
+        return
     
-    for i, user in enumerate(top_users, 1):
-        stats_text += f"{i}. ID {user['user_id']}: {user['earned']} руб.\n"
+    now = datetime.now()
+    lines = [texts.METRICS.render()]
+    for title, days in (("24 часа", 1), ("7 дней", 7), ("30 дней", 30)):
+        totals = await MetricsManager.totals('all', '', now - timedelta(days=days), now + timedelta(hours=1))
+        lines.append(texts.METRICS_PERIOD.render(title=title, totals=format_metrics(totals)))
+    
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    series = await MetricsManager.series('all', '', 'day', today - timedelta(days=6), now + timedelta(hours=1))
+    days: Dict[datetime, Dict[str, int]] = {}
+    for point in series:
+        days.setdefault(point['period'], {})[point['metric']] = point['count']
+    lines.append(texts.METRICS_DAYS.render())
+    for i in range(6, -1, -1):
+        day = today - timedelta(days=i)
+        counts = days.get(day, {})
+        lines.append(texts.METRICS_DAY.render(day=day, clicks=counts.get('click', 0), completions=counts.get('completion', 0)))
+    lines.append(texts.METRICS_HINT.render())
     
     keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="admin_panel")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(stats_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_screen(query, join(lines), reply_markup=reply_markup, parse_mode='Markdown')
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /metrics <task|user|link> <ID> [дней]"""
+    if not await AdminManager.is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ У вас нет прав для использования этой команды.")
+        return
+    
+    args = context.args or []
+    if len(args) < 2 or args[0] not in METRICS_DIMENSIONS or (len(args) > 2 and not args[2].isdigit()):
+        await update.message.reply_text(texts.METRICS_USAGE.render(), parse_mode='Markdown')
+        return
+    
+    dimension, key = args[0], args[1]
+    days = int(args[2]) if len(args) > 2 else 30
+    now = datetime.now()
+    totals = await MetricsManager.totals(dimension, key, now - timedelta(days=days), now + timedelta(hours=1))
+    
+    await update.message.reply_text(
+        texts.METRICS_SUMMARY.render(
+            dimension=METRICS_DIMENSIONS[dimension], key=key, days=days, totals=format_metrics(totals)
+        ),
+        parse_mode='Markdown'
+    )
+
+async def dbstats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /dbstats [total|mean|max|calls|reset] — статистика запросов к БД"""
+    if not await AdminManager.is_main_admin(update.effective_user.id):
+        await update.message.reply_text("❌ У вас нет прав для использования этой команды.")
+        return
+    
+    args = context.args or []
+    order = args[0] if args else "total"
+    if order == "reset":
+        QueryStats.reset()
+        await update.message.reply_text("✅ Статистика запросов обнулена")
+        return
+    if order not in DBSTATS_ORDERS:
+        await update.message.reply_text(texts.DBSTATS_USAGE.render(), parse_mode='Markdown')
+        return
+    
+    top = QueryStats.top(order, DBSTATS_SIZE)
+    text = texts.DBSTATS.render(since=QueryStats.since, order=DBSTATS_ORDERS[order], slow_ms=SLOW_QUERY_MS)
+    if not top:
+        text += texts.DBSTATS_EMPTY.render()
+    for i, item in enumerate(top, 1):
+        sql = item['sql']
+        if len(sql) > DBSTATS_SQL_LENGTH:
+            sql = sql[:DBSTATS_SQL_LENGTH] + "…"
+        flags = ""
+        if item['slow']:
+            flags += f" · 🐢 {item['slow']}"
+        if item['errors']:
+            flags += f" · ❌ {item['errors']}"
+        entry = texts.DBSTATS_QUERY.render(number=i, item=item, flags=flags, sql=sql)
+        # Сообщение Telegram ограничено 4096 символами
+        if len(text) + len(entry) > 4000:
+            break
+        text += entry
+    
+    await update.message.reply_text(text, parse_mode='Markdown')
 
 async def view_all_tasks_admin(query, context: ContextTypes.DEFAULT_TYPE):
     """Просмотр всех заданий для администратора"""
@@ -1029,40 +1495,25 @@ async def view_all_tasks_admin(query, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("Доступ запрещен!", show_alert=True)
         return
     
-    pool = await PostgresDB.init_pool()
-    async with pool.acquire() as conn:
-        rows = await conn.fetch('''
-            SELECT * FROM tasks 
-            ORDER BY created_date DESC 
-            LIMIT 20
-        ''')
+    tasks = await TaskManager.get_recent_tasks(20)
     
-    if not rows:
+    if not tasks:
         keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="admin_panel")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
-            "📁 *Все задания*\n\n"
-            "Пока нет созданных заданий.",
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
-        )
+        await edit_screen(query, texts.ALL_TASKS_EMPTY.render(), reply_markup=reply_markup, parse_mode='Markdown')
         return
     
-    tasks_text = "📁 *Все задания (последние 20):*\n\n"
+    tasks_text = join([texts.ALL_TASKS.render()] + [
+        texts.ALL_TASKS_ROW.render(icon=task_status_icon(task), task=task, title=task.title[:30])
+        for task in tasks
+    ])
     keyboard = []
     
-    for row in rows:
-        task = dict(row)
-        status = "✅" if task.get('completed') else "🟡" if task.get('taken_by') else "🟢"
-        taken_by = task.get('taken_by', '—')
-        tasks_text += f"{status} {task['task_id']}: {task['title'][:30]} - {task['reward']} руб.\n"
-        tasks_text += f"   Взял: {taken_by}, Выполнено: {'✅' if task.get('completed') else '❌'}\n\n"
-    
     keyboard.append([InlineKeyboardButton("➕ Создать задание", callback_data="admin_create_task")])
     keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_panel")])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await query.edit_message_text(tasks_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_screen(query, tasks_text, reply_markup=reply_markup, parse_mode='Markdown')
 
 async def manage_blocks(query, context: ContextTypes.DEFAULT_TYPE):
     """Управление блоками и подблоками"""
@@ -1070,25 +1521,6 @@ async def manage_blocks(query, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("Доступ запрещен!", show_alert=True)
         return
     
-    blocks_text = (
-        "📁 *Управление структурой бота*\n\n"
-        "*Основные блоки:*\n"
-        "1. 👤 Профиль пользователя\n"
-        "2. 📋 Система заданий\n"
-        "3. 📊 Статистика и отчетность\n"
-        "4. 👥 Админ-панель\n"
-        "5. ❓ Помощь и поддержка\n\n"
-        "*Подблоки заданий:*\n"
-        "• Создание/редактирование заданий\n"
-        "• Назначение/проверка заданий\n"
-        "• Генерация отслеживающих ссылок\n"
-        "• Автоматические отчеты\n\n"
-        "*Настройки коммуникации:*\n"
-        "• Уведомления в группы\n"
-        "• Личные сообщения пользователям\n"
-        "• Система эскалации проблем"
-    )
-    
     keyboard = [
         [InlineKeyboardButton("📝 Редактировать приветствие", callback_data="edit_welcome")],
         [InlineKeyboardButton("⚙️ Настройки уведомлений", callback_data="notification_settings")],
@@ -1097,7 +1529,7 @@ async def manage_blocks(query, context: ContextTypes.DEFAULT_TYPE):
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(blocks_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_screen(query, texts.MANAGE_BLOCKS.render(), reply_markup=reply_markup, parse_mode='Markdown')
 
 async def manage_tasks_menu(query, context: ContextTypes.DEFAULT_TYPE):
     """Меню управления заданиями"""
@@ -1105,30 +1537,12 @@ async def manage_tasks_menu(query, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("Доступ запрещен!", show_alert=True)
         return
     
-    pool = await PostgresDB.init_pool()
-    async with pool.acquire() as conn:
-        total_tasks = await conn.fetchval('SELECT COUNT(*) FROM tasks')
-        active_tasks = await conn.fetchval('SELECT COUNT(*) FROM tasks WHERE active = true')
-        completed_tasks = await conn.fetchval('SELECT COUNT(*) FROM tasks WHERE completed = true')
-        
-        rows = await conn.fetch('''
-            SELECT * FROM tasks 
-            ORDER BY created_date DESC 
-            LIMIT 5
-        ''')
-    
-    stats_text = (
-        f"📁 *Управление заданиями*\n\n"
-        f"*Всего заданий:* {total_tasks}\n"
-        f"*Активных:* {active_tasks}\n"
-        f"*Завершенных:* {completed_tasks}\n\n"
-        f"*Последние 5 заданий:*\n"
-    )
-    
-    for i, row in enumerate(rows, 1):
-        task = dict(row)
-        status = "✅" if task.get('completed') else "🟡" if task.get('taken_by') else "🟢"
-        stats_text += f"{i}. {status} {task['title']} - {task['reward']} руб.\n"
+    # Счетчики и последние задания — из снимка админ-панели
+    dashboard = await AdminDashboard.get()
+    stats_text = join([texts.MANAGE_TASKS.render(dashboard=dashboard)] + [
+        texts.MANAGE_TASKS_ROW.render(place=i, icon=task_status_icon(task), task=task, slots=format_slots(task))
+        for i, task in enumerate(dashboard['recent_tasks'], 1)
+    ])
     
     keyboard = [
         [InlineKeyboardButton("➕ Создать задание", callback_data="admin_create_task")],
@@ -1137,7 +1551,47 @@ async def manage_tasks_menu(query, context: ContextTypes.DEFAULT_TYPE):
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(stats_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_screen(query, stats_text, reply_markup=reply_markup, parse_mode='Markdown')
+
+# Настройка -> (название, подсказка при вводе, экран настройки)
+SETTING_SCREENS = {
+    'welcome_text': (
+        "Приветственное сообщение",
+        "Текст с разметкой Markdown: *жирный*, _курсив_, `код`, [ссылка](https://...).",
+        "edit_welcome",
+    ),
+    'notification_group': (
+        "Группа уведомлений",
+        "@username группы или числовой ID чата (например, -1001234567890).",
+        "notification_settings",
+    ),
+    'report_group': (
+        "Группа отчетов",
+        "@username группы или числовой ID чата (например, -1001234567890).",
+        "notification_settings",
+    ),
+    'tracking_link_template': (
+        "Шаблон отслеживающих ссылок",
+        "Адрес с {link_id} на месте ID ссылки, например https://t.me/your_bot?start={link_id}",
+        "link_templates",
+    ),
+}
+
+def setting_state(key: str) -> Markup:
+    """Пометка, изменена ли настройка"""
+    return (texts.SETTING_DEFAULT if Config.is_default(key) else texts.SETTING_CUSTOM).render()
+
+def setting_buttons(*keys: str) -> List[List[InlineKeyboardButton]]:
+    """Кнопки изменения и сброса настроек"""
+    keyboard = []
+    for key in keys:
+        title = SETTING_SCREENS[key][0]
+        row = [InlineKeyboardButton(f"✏️ {title}", callback_data=f"settings_edit_{key}")]
+        if not Config.is_default(key):
+            row.append(InlineKeyboardButton("↩️ Сбросить", callback_data=f"settings_reset_{key}"))
+        keyboard.append(row)
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_manage_blocks")])
+    return keyboard
 
 async def edit_welcome_message(query, context: ContextTypes.DEFAULT_TYPE):
     """Редактирование приветственного сообщения"""
@@ -1145,14 +1599,10 @@ async def edit_welcome_message(query, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("Доступ запрещен!", show_alert=True)
         return
     
-    await query.edit_message_text(
-        "📝 *Редактирование приветственного сообщения*\n\n"
-        "Эта функция в разработке.\n"
-        "В будущих обновлениях вы сможете:\n"
-        "• Изменять текст приветствия\n"
-        "• Загружать новое видео\n"
-        "• Настраивать кнопки меню\n\n"
-        "Сейчас используется стандартное приветствие.",
+    reply_markup = InlineKeyboardMarkup(setting_buttons('welcome_text'))
+    await edit_screen(query,
+        texts.WELCOME_EDITOR.render(state=setting_state('welcome_text'), current=Config.welcome()),
+        reply_markup=reply_markup,
         parse_mode='Markdown'
     )
 
@@ -1162,17 +1612,13 @@ async def notification_settings_menu(query, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("Доступ запрещен!", show_alert=True)
         return
     
-    await query.edit_message_text(
-        "⚙️ *Настройки уведомлений*\n\n"
-        "*Текущие настройки:*\n"
-        f"• Группа уведомлений: {TASK_NOTIFICATION_GROUP}\n"
-        f"• Группа отчетов: {REPORT_GROUP}\n"
-        f"• Ежедневный отчет: 23:00\n\n"
-        "*Что можно настроить:*\n"
-        "• Изменить группы для уведомлений\n"
-        "• Настроить время отчетов\n"
-        "• Включить/выключить уведомления\n\n"
-        "*Для изменения настроек обратитесь к разработчику.*",
+    reply_markup = InlineKeyboardMarkup(setting_buttons('notification_group', 'report_group'))
+    await edit_screen(query,
+        texts.NOTIFICATION_SETTINGS.render(
+            notification_group=Config.get('notification_group'),
+            report_group=Config.get('report_group')
+        ),
+        reply_markup=reply_markup,
         parse_mode='Markdown'
     )
 
@@ -1182,19 +1628,94 @@ async def link_templates_menu(query, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("Доступ запрещен!", show_alert=True)
         return
     
-    await query.edit_message_text(
-        "🔗 *Шаблоны отслеживающих ссылок*\n\n"
-        "*Текущий шаблон:*\n"
-        "`https://t.me/your_bot_username?start={link_id}`\n\n"
-        "*Как это работает:*\n"
-        "1. Бот генерирует уникальный {link_id}\n"
-        "2. Пользователь получает ссылку с этим ID\n"
-        "3. При переходе по ссылке отслеживаются клики\n"
-        "4. Статистика сохраняется в базу данных\n\n"
-        "*Для изменения шаблона обратитесь к разработчику.*",
+    reply_markup = InlineKeyboardMarkup(setting_buttons('tracking_link_template'))
+    await edit_screen(query,
+        texts.LINK_TEMPLATES.render(
+            state=setting_state('tracking_link_template'),
+            template=Config.get('tracking_link_template')
+        ),
+        reply_markup=reply_markup,
         parse_mode='Markdown'
     )
 
+async def edit_setting_dialog(query, context: ContextTypes.DEFAULT_TYPE, key: str):
+    """Запрос нового значения настройки"""
+    if not await AdminManager.is_admin(query.from_user.id):
+        await query.answer("Доступ запрещен!", show_alert=True)
+        return
+    if key not in SETTING_SCREENS:
+        await query.answer("Неизвестная настройка", show_alert=True)
+        return
+    
+    context.user_data["editing_setting"] = key
+    
+    title, hint, back = SETTING_SCREENS[key]
+    keyboard = [[InlineKeyboardButton("❌ Отмена", callback_data=back)]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await edit_screen(query, texts.SETTING_PROMPT.render(title=title, hint=hint),
+                      reply_markup=reply_markup, parse_mode='Markdown')
+
+async def reset_setting(query, context: ContextTypes.DEFAULT_TYPE, key: str):
+    """Возврат настройки к значению по умолчанию"""
+    if not await AdminManager.is_admin(query.from_user.id):
+        await query.answer("Доступ запрещен!", show_alert=True)
+        return
+    if key not in SETTING_SCREENS:
+        await query.answer("Неизвестная настройка", show_alert=True)
+        return
+    
+    await Config.set(key, None, query.from_user.id)
+    await query.answer("Возвращено значение по умолчанию")
+    
+    screens = {
+        "edit_welcome": edit_welcome_message,
+        "notification_settings": notification_settings_menu,
+        "link_templates": link_templates_menu,
+    }
+    await screens[SETTING_SCREENS[key][2]](query, context)
+
+async def handle_setting_value(update: Update, context: ContextTypes.DEFAULT_TYPE, text: Optional[str]):
+    """Обработка нового значения настройки"""
+    user_id = update.effective_user.id
+    key = context.user_data.get("editing_setting")
+    
+    if not await AdminManager.is_admin(user_id) or key not in SETTING_SCREENS:
+        context.user_data.pop("editing_setting", None)
+        return
+    
+    if not text:
+        await update.message.reply_text("❌ Отправьте значение текстом.")
+        return
+    
+    title, _, back = SETTING_SCREENS[key]
+    value = text.strip()
+    if key == 'welcome_text' and update.message.entities:
+        # Форматирование из клиента Telegram переводим в Markdown приветствия
+        try:
+            value = update.message.text_markdown
+        except ValueError:
+            await update.message.reply_text(texts.SETTING_INVALID.render(
+                error="Подчеркнутый, зачеркнутый и скрытый текст в Markdown не поддерживается"
+            ), parse_mode='Markdown')
+            return
+    
+    if value == "-":
+        await Config.set(key, None, user_id)
+        reply_text = texts.SETTING_RESET.render(title=title)
+    else:
+        error = Config.validate(key, value)
+        if error:
+            await update.message.reply_text(texts.SETTING_INVALID.render(error=error), parse_mode='Markdown')
+            return
+        await Config.set(key, value, user_id)
+        reply_text = texts.SETTING_SAVED.render(title=title)
+    
+    del context.user_data["editing_setting"]
+    
+    keyboard = [[InlineKeyboardButton("◀️ К настройке", callback_data=back)]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await update.message.reply_text(reply_text, reply_markup=reply_markup, parse_mode='Markdown')
+
 # ========== УНИВЕРСАЛЬНЫЙ ОБРАБОТЧИК СООБЩЕНИЙ ==========
 async def handle_all_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Универсальный обработчик всех текстовых сообщений"""
@@ -1221,76 +1742,175 @@ async def handle_all_messages(update: Update, context: ContextTypes.DEFAULT_TYPE
         await handle_proof_message(update, context)
         return
     
+    # Проверяем, ожидается ли список ссылок для массовой выдачи
+    if context.user_data.get("bulk_links"):
+        logger.info(f"Админ {user_id} отправляет список ссылок")
+        await handle_bulk_links(update, context, text)
+        return
+    
     # Проверяем, ожидается ли рабочая ссылка от админа
     if context.user_data.get("setting_link_for"):
         logger.info(f"Админ {user_id} отправляет рабочую ссылку")
         await handle_work_link(update, context)
         return
     
+    # Проверяем, ожидается ли новое значение настройки
+    if context.user_data.get("editing_setting"):
+        logger.info(f"Админ {user_id} отправляет значение настройки {context.user_data['editing_setting']}")
+        await handle_setting_value(update, context, text)
+        return
+    
+    # Проверяем, ожидается ли текст поискового запроса
+    if context.user_data.get("waiting_for_search"):
+        await handle_search_query(update, context, text)
+        return
+    
     # Если сообщение не обработано другими обработчиками
     logger.info(f"Сообщение от {user_id} не обработано: {text}")
 
+# ========== СОСТОЯНИЕ ДИАЛОГОВ МЕЖДУ РЕПЛИКАМИ ==========
+# Снимок состояния на момент загрузки, чтобы не писать в БД без изменений
+_loaded_user_states: Dict[int, str] = {}
+
+async def load_user_state(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Загрузка состояния диалога из БД перед обработкой обновления"""
+    user = update.effective_user
+    if not user:
+        return
+    
+    try:
+        data = await UserStateManager.load(user.id)
+    except DatabaseUnavailable:
+        # Остается состояние из памяти этой реплики: экраны только на чтение
+        # работают по последним данным, записи будут отклонены
+        _loaded_user_states.pop(user.id, None)
+        logger.warning(f"БД недоступна: состояние диалога {user.id} не загружено")
+        return
+    context.user_data.clear()
+    context.user_data.update(data)
+    _loaded_user_states[user.id] = json.dumps(data, sort_keys=True)
+
+async def save_user_state(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сохранение состояния диалога в БД после обработки обновления"""
+    user = update.effective_user
+    if not user:
+        return
+    
+    snapshot = json.dumps(context.user_data, sort_keys=True, default=str)
+    if _loaded_user_states.pop(user.id, None) != snapshot:
+        try:
+            await UserStateManager.save(user.id, json.loads(snapshot))
+        except DatabaseUnavailable:
+            logger.warning(f"БД недоступна: состояние диалога {user.id} осталось только в памяти")
+
 # ========== АВТОМАТИЧЕСКИЕ ОТЧЕТЫ ==========
-async def send_daily_report(context: ContextTypes.DEFAULT_TYPE):
-    """Отправка ежедневного отчета"""
+def leader_only(callback):
+    """Плановая задача выполняется только на реплике-лидере"""
+    async def wrapper(context: ContextTypes.DEFAULT_TYPE):
+        if not LeaderElection.is_leader():
+            return
+        await callback(context)
+    wrapper.__name__ = callback.__name__
+    return wrapper
+
+async def send_daily_report(context: ContextTypes.DEFAULT_TYPE, day: Optional[date] = None):
+    """Отправка ежедневного отчета (day=None — за сегодня)"""
     try:
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
-            today = datetime.now().date()
-            today_start = datetime.combine(today, datetime.min.time())
-            today_end = datetime.combine(today, datetime.max.time())
-            
-            # Задания выполненные сегодня
-            today_tasks = await conn.fetch('''
-                SELECT * FROM tasks 
-                WHERE completed = true 
-                AND completed_date BETWEEN $1 AND $2
-            ''', today_start, today_end)
-            
-            today_earnings = sum(t.get('reward', 0) for t in today_tasks)
-            
-            # Активные пользователи
-            active_users = await conn.fetchval('SELECT COUNT(DISTINCT user_id) FROM user_tasks')
-            
-            # Топ дня
-            top_users = await conn.fetch('''
-                SELECT ut.user_id, SUM(t.reward) as total
-                FROM user_tasks ut
-                JOIN tasks t ON ut.task_id = t.task_id
-                WHERE ut.status = 'completed'
-                AND ut.completed_date BETWEEN $1 AND $2
-                GROUP BY ut.user_id
-                ORDER BY total DESC
-                LIMIT 1
-            ''', today_start, today_end)
+        day = day or datetime.now().date()
+        # Отчет за день отправляется один раз, даже если лидер сменился
+        if USES_POSTGRES and await JobRunsManager.has_run("daily_report", day.isoformat()):
+            logger.info(f"Ежедневный отчет за {day:%d.%m.%Y} уже отправлен")
+            return
         
-        report_text = (
-            f"📊 *ЕЖЕДНЕВНЫЙ ОТЧЕТ {today.strftime('%d.%m.%Y')}*\n\n"
-            f"*Выполнено заданий за день:* {len(today_tasks)}\n"
-            f"*Выплачено за день:* {today_earnings} руб.\n"
-            f"*Активных пользователей:* {active_users}\n\n"
-            f"*Топ дня:*\n"
-        )
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = datetime.combine(day, datetime.max.time())
         
-        if top_users:
-            top = top_users[0]
-            report_text += f"Лучший исполнитель: ID {top['user_id']} - {top['total']} руб.\n"
+        # Выполнено и выплачено за день, активные пользователи
+        day_totals = await TaskManager.get_completion_totals(day_start, day_end)
+
+        if day == datetime.now().date():
+            # Топ дня — из таблицы лидеров в памяти
+            top_users = Leaderboards.board('day').top(1)
         else:
-            report_text += "Нет выполненных заданий за сегодня\n"
+            # Отчет за прошедший день: его таблица лидеров уже сброшена
+            top_users = await TaskManager.get_top_earners(day_start, day_end, 1)
         
-        report_text += "\n*Система работает стабильно. Все задачи выполнены.*"
+        if top_users:
+            top_id, top_total = top_users[0]
+            top = texts.DAILY_REPORT_TOP.render(user_id=top_id, earned=top_total)
+        else:
+            top = texts.DAILY_REPORT_NO_TOP.render()
+        report_text = texts.DAILY_REPORT.render(day=day, totals=day_totals, top=top)
         
+        report_group = Config.get('report_group')
         await context.bot.send_message(
-            chat_id=REPORT_GROUP,
+            chat_id=report_group,
             text=report_text,
             parse_mode='Markdown'
         )
         
-        logger.info(f"Ежедневный отчет отправлен в {REPORT_GROUP}")
+        logger.info(f"Ежедневный отчет отправлен в {report_group}")
+        
+        # Запуск отмечается только после отправки: при сбое отчет повторит лидер
+        if USES_POSTGRES and not await JobRunsManager.claim("daily_report", day.isoformat()):
+            logger.warning(f"Ежедневный отчет за {day:%d.%m.%Y} уже был отмечен другой репликой")
         
     except Exception as e:
         logger.error(f"Ошибка при отправке ежедневного отчета: {e}")
 
+async def refresh_dashboard(context: ContextTypes.DEFAULT_TYPE):
+    """Фоновое обновление снимка админ-панели"""
+    try:
+        await AdminDashboard.refresh()
+    except Exception as e:
+        logger.error(f"Ошибка обновления снимка админ-панели: {e}")
+
+async def resume_broadcasts(context: ContextTypes.DEFAULT_TYPE):
+    """Подхват незавершенных рассылок (после рестарта или смены лидера)"""
+    try:
+        await BroadcastEngine.resume_all(context.bot)
+    except Exception as e:
+        logger.error(f"Ошибка продолжения рассылок: {e}")
+
+async def flush_metrics(context: ContextTypes.DEFAULT_TYPE):
+    """Запись накопленных метрик (каждая реплика пишет свои)"""
+    try:
+        await MetricsManager.flush()
+    except Exception as e:
+        logger.error(f"Ошибка записи метрик: {e}")
+
+async def compact_metrics(context: ContextTypes.DEFAULT_TYPE):
+    """Укрупнение старых корзин метрик"""
+    try:
+        moved = await MetricsManager.compact()
+        logger.info(f"Метрики сжаты: {moved}")
+    except Exception as e:
+        logger.error(f"Ошибка сжатия метрик: {e}")
+
+def daily_report_due(now: datetime) -> date:
+    """День последнего отчета, время которого наступило (до DAILY_REPORT_TIME — вчерашний)"""
+    if now.time() >= DAILY_REPORT_TIME:
+        return now.date()
+    return now.date() - timedelta(days=1)
+
+async def catch_up_daily_report(application: Application):
+    """Досылка последнего отчета, если прежний лидер упал или отправка не удалась
+
+    Неотправленный отчет за вчера досылается и после полуночи — за свой день.
+    """
+    day = daily_report_due(datetime.now())
+    if await JobRunsManager.has_run("daily_report", day.isoformat()):
+        return
+    logger.info(f"Лидер досылает пропущенный ежедневный отчет за {day:%d.%m.%Y}")
+    await send_daily_report(CallbackContext(application), day)
+
+async def retry_daily_report(context: ContextTypes.DEFAULT_TYPE):
+    """Повтор последнего отчета, если его отправка не удалась"""
+    try:
+        await catch_up_daily_report(context.application)
+    except Exception as e:
+        logger.error(f"Ошибка проверки ежедневного отчета: {e}")
+
 async def show_admin_panel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /admin"""
     user = update.effective_user
@@ -1299,45 +1919,98 @@ async def show_admin_panel_command(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("❌ У вас нет прав для использования этой команды.")
         return
     
-    # Получаем количество ожидающих ссылок
-    pending_links = await PendingLinksManager.get_all_pending()
-    pending_count = len(pending_links)
-    
-    keyboard = [
-        [InlineKeyboardButton("📊 Общая статистика", callback_data="admin_view_stats")],
-        [InlineKeyboardButton("➕ Создать задание", callback_data="admin_create_task")],
-        [InlineKeyboardButton("📁 Управление заданиями", callback_data="admin_manage_tasks")],
-    ]
-    
-    if pending_count > 0:
-        keyboard.append([InlineKeyboardButton(f"🔗 Выдать ссылки ({pending_count})", callback_data="admin_pending_links")])
-    
-    if await AdminManager.is_main_admin(user.id):
-        keyboard.append([InlineKeyboardButton("👥 Управление админов", callback_data="admin_manage_admins")])
+    # Количество ожидающих ссылок берем из снимка в памяти
+    dashboard = await AdminDashboard.get()
+    pending_count = dashboard['pending_count']
     
-    keyboard.append([InlineKeyboardButton("🏠 В главное меню", callback_data="back_to_main")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = admin_panel_keyboard(pending_count, user.id == MAIN_ADMIN_ID)
     
     await update.message.reply_text(
-        f"👑 *Панель администратора*\n\n*Ожидает ссылок:* {pending_count}\n\nВыберите раздел для управления:",
+        texts.ADMIN_PANEL_SHORT.render(pending_count=pending_count),
         reply_markup=reply_markup,
         parse_mode='Markdown'
     )
 
+# Когда пользователю последний раз сообщали о недоступности БД
+_db_notices: Dict[int, float] = {}
+
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+    """Ошибки обработчиков: при недоступной БД — понятный отказ вместо молчания"""
+    error = context.error
+    if not isinstance(error, DatabaseUnavailable):
+        logger.error("Ошибка при обработке обновления", exc_info=error)
+        return
+    
+    logger.warning(f"Действие отклонено: БД недоступна ({error})")
+    if not isinstance(update, Update) or not update.effective_user:
+        return
+    user_id = update.effective_user.id
+    now = time.monotonic()
+    if now - _db_notices.get(user_id, float('-inf')) < DB_NOTICE_INTERVAL:
+        return
+    if len(_db_notices) > 10000:
+        _db_notices.clear()
+    _db_notices[user_id] = now
+    try:
+        # Кнопка могла быть нажата в группе — отказ приходит лично
+        await context.bot.send_message(chat_id=user_id, text=DB_UNAVAILABLE_TEXT)
+    except TelegramError as e:
+        logger.warning(f"Не удалось сообщить {user_id} о недоступности БД: {e}")
+
+async def init_database():
+    """Инициализация БД при старте: повтор с нарастающей паузой вместо падения"""
+    delay = 1.0
+    while True:
+        try:
+            await init_storage()
+            return
+        except DB_OUTAGE_ERRORS as e:
+            logger.error(f"БД недоступна при старте ({e or type(e).__name__}), повтор через {delay:g} с")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, DB_STARTUP_RETRY_MAX)
+
+def follow_report_group():
+    """Сводки отчетов уходят в текущую группу отчетов"""
+    ReportDigest.chat_id = Config.get('report_group')
+
 async def shutdown(application):
     """Корректное завершение работы"""
     logger.info("Завершение работы бота...")
-    await PostgresDB.close_pool()
+    await DeadlineScheduler.stop()
+    try:
+        await ReportDigest.stop()
+    except Exception as e:
+        logger.error(f"Не удалось отправить сводку отчетов при остановке: {e}")
+    if USES_POSTGRES:
+        try:
+            await MetricsManager.flush()
+        except Exception as e:
+            logger.error(f"Не удалось записать метрики при остановке: {e}")
+        await LeaderElection.stop()
+        await ChangeFeed.stop()
+    await close_storage()
     logger.info("Соединения с БД закрыты")
 
 # ========== ОСНОВНАЯ ФУНКЦИЯ ==========
 async def main_async():
     
     """Асинхронная основная функция"""
+    # Встроенная БД доступна только процессу, который ее открыл
+    if MULTI_REPLICA and not USES_POSTGRES:
+        raise ValueError("❌ Вебхук с несколькими репликами требует STORAGE_BACKEND=postgres")
+    
     # Инициализация базы данных
-    await PostgresDB.init_db()
-    logger.info("База данных инициализирована")
+    await init_database()
+    logger.info(f"База данных инициализирована ({STORAGE_BACKEND})")
+    
+    # Настройки из админ-панели держатся в памяти и перечитываются при изменении
+    await Config.load()
+    
+    # Лента изменений держит кэши согласованными с другими процессами
+    if USES_POSTGRES:
+        await ChangeFeed.start()
+        await AvailableTasksIndex.load()
+    await Leaderboards.load()
     
     # Создаем приложение
     application = Application.builder().token(BOT_TOKEN).build()
@@ -1345,36 +2018,99 @@ async def main_async():
     # Добавляем обработчики команд
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("admin", show_admin_panel_command))
+    if USES_POSTGRES:
+        application.add_handler(CommandHandler("metrics", metrics_command))
+        application.add_handler(CommandHandler("dbstats", dbstats_command))
+    application.add_handler(CommandHandler("find", find_command))
     
     # Добавляем обработчики кнопок
-    application.add_handler(CallbackQueryHandler(button_handler))
+    application.add_handler(CallbackQueryHandler(idempotent_callback(button_handler)))
     
     # Добавляем УНИВЕРСАЛЬНЫЙ обработчик сообщений
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_all_messages))
+    application.add_handler(MessageHandler(filters.PHOTO | filters.VIDEO | filters.Document.ALL, handle_media_message))
+    application.add_error_handler(error_handler)
     
-    # Настраиваем ежедневные отчеты
+    # Ограничение частоты срабатывает раньше всех остальных обработчиков
+    application.add_handler(TypeHandler(Update, flood_control), group=-2)
+    
+    # Несколько реплик: состояние диалогов загружается до и сохраняется после обработки
+    if MULTI_REPLICA:
+        application.add_handler(TypeHandler(Update, load_user_state), group=-1)
+        application.add_handler(TypeHandler(Update, save_user_state), group=1)
+    
+    # Настраиваем ежедневные отчеты (выполняет только лидер)
     job_queue = application.job_queue
     if job_queue:
-        from datetime import time as dt_time
-        job_queue.run_daily(send_daily_report, time=dt_time(hour=23, minute=0))
+        # Снимок админ-панели обновляет каждая реплика для себя
+        job_queue.run_repeating(refresh_dashboard, interval=DASHBOARD_REFRESH_INTERVAL, first=1)
+        if USES_POSTGRES:
+            job_queue.run_daily(leader_only(send_daily_report), time=DAILY_REPORT_TIME)
+            job_queue.run_repeating(leader_only(retry_daily_report), interval=DAILY_REPORT_RETRY_INTERVAL,
+                                    first=DAILY_REPORT_RETRY_INTERVAL)
+            job_queue.run_repeating(leader_only(resume_broadcasts), interval=BROADCAST_RESUME_INTERVAL, first=5)
+            job_queue.run_repeating(flush_metrics, interval=METRICS_FLUSH_INTERVAL, first=METRICS_FLUSH_INTERVAL)
+            job_queue.run_repeating(leader_only(compact_metrics), interval=3600, first=60)
+        else:
+            # Одна реплика — она же и лидер
+            job_queue.run_daily(send_daily_report, time=DAILY_REPORT_TIME)
     
-    # Добавляем обработчик завершения
-    application.post_shutdown = shutdown
+    async def on_elected():
+        await catch_up_daily_report(application)
+    LeaderElection.on_elected(on_elected)
     
     print("=" * 50)
-    print("🚀 БОТ TRAFFIC TEAM ЗАПУЩЕН С POSTGRESQL")
+    print(f"🚀 БОТ TRAFFIC TEAM ЗАПУЩЕН С {'POSTGRESQL' if USES_POSTGRES else 'SQLITE'}")
     print("=" * 50)
     print(f"🤖 Токен бота: {BOT_TOKEN[:10]}...")
     print(f"👑 Главный админ: {MAIN_ADMIN_ID}")
-    print(f"📢 Группа уведомлений: {TASK_NOTIFICATION_GROUP}")
-    print(f"📊 Группа отчетов: {REPORT_GROUP}")
+    print(f"📢 Группа уведомлений: {Config.get('notification_group')}")
+    print(f"📊 Группа отчетов: {Config.get('report_group')}")
+    print(f"🌐 Режим: {'вебхук, несколько реплик' if MULTI_REPLICA else 'polling, одна реплика'}")
     print("=" * 50)
-    print("📁 Используется база данных PostgreSQL")
+    print(f"📁 Используется база данных {'PostgreSQL' if USES_POSTGRES else 'SQLite (встроенная)'}")
     print("=" * 50)
     print("Нажмите Ctrl+C для остановки")
     
+    # Ждем сигнала остановки (Ctrl+C локально, SIGTERM при деплое)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+    
     # Запускаем бота
-    await application.run_polling(allowed_updates=Update.ALL_TYPES)
+    await application.initialize()
+    await application.start()
+    if USES_POSTGRES:
+        await LeaderElection.start()
+    # Сроки заданий обрабатывает каждая реплика (строки делятся через SKIP LOCKED)
+    DeadlineScheduler.start(application.bot)
+    # Отчеты о выполнении, оставшиеся от упавших процессов, подбирает лидер
+    ReportDigest.start(application.bot, Config.get('report_group'), LeaderElection.is_leader if USES_POSTGRES else (lambda: True))
+    # Группа отчетов меняется из админ-панели без перезапуска
+    Config.on_reload(follow_report_group)
+    if MULTI_REPLICA:
+        await application.updater.start_webhook(
+            listen="0.0.0.0",
+            port=PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+    
+    try:
+        await stop_event.wait()
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await shutdown(application)
+        await application.shutdown()
 
 def main():
     """Основная функция запуска"""
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from database import BroadcastManager, LeaderElection
+from models import TaskDetail
+from texts import TASK_ANNOUNCEMENT
+
+logger = logging.getLogger(__name__)
+
+# Telegram допускает ~30 сообщений в секунду на бота; часть оставляем
+# интерактивным обработчикам, чтобы рассылка их не вытесняла
+BROADCAST_RATE = float(os.environ.get('BROADCAST_RATE', '20'))
+# Сколько отправок выполняется параллельно
+BROADCAST_CONCURRENCY = int(os.environ.get('BROADCAST_CONCURRENCY', '8'))
+# Как часто обновляется сообщение с прогрессом (секунды)
+BROADCAST_PROGRESS_INTERVAL = float(os.environ.get('BROADCAST_PROGRESS_INTERVAL', '10'))
+
+
+class RateLimiter:
+    """Token bucket: не больше rate отправок в секунду с запасом burst"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Дождаться права на одну отправку"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    async def pause(self, seconds: float):
+        """Общая пауза после RetryAfter: Telegram ограничивает бота целиком"""
+        async with self._lock:
+            await asyncio.sleep(seconds)
+            self.tokens = 0
+            self.updated = time.monotonic()
+
+
+class BroadcastEngine:
+    """Рассылка сообщения всем пользователям с контрольными точками
+
+    Получатели читаются окнами с серверного курсора по возрастанию user_id.
+    После каждого окна прогресс сохраняется, поэтому после рестарта рассылка
+    продолжается с места остановки. Выполняет рассылки только лидер.
+    """
+
+    # Общий лимитер на процесс: параллельные рассылки делят один бюджет
+    limiter = RateLimiter(BROADCAST_RATE)
+
+    _running: Dict[str, asyncio.Task] = {}
+
+    @classmethod
+    def is_running(cls, broadcast_id: str) -> bool:
+        """Выполняется ли рассылка в этом процессе"""
+        task = cls._running.get(broadcast_id)
+        return task is not None and not task.done()
+
+    @classmethod
+    async def resume_all(cls, bot: Bot):
+        """Запуск всех незавершенных рассылок, которые еще не идут здесь"""
+        if not LeaderElection.is_leader():
+            return
+        for broadcast in await BroadcastManager.get_running():
+            cls.start(bot, broadcast)
+
+    @classmethod
+    def start(cls, bot: Bot, broadcast: Dict):
+        """Запуск рассылки в фоне"""
+        broadcast_id = broadcast['broadcast_id']
+        if cls.is_running(broadcast_id):
+            return
+        cls._running[broadcast_id] = asyncio.create_task(cls._run(bot, broadcast))
+
+    @classmethod
+    async def _run(cls, bot: Bot, broadcast: Dict):
+        """Основной цикл рассылки"""
+        broadcast_id = broadcast['broadcast_id']
+        last_user_id = broadcast['last_user_id']
+        counters = {
+            'sent': broadcast['sent'],
+            'failed': broadcast['failed'],
+            'blocked': broadcast['blocked'],
+        }
+        reply_markup = None
+        if broadcast['task_id']:
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("👀 Посмотреть задание", callback_data=f"view_task_{broadcast['task_id']}")
+            ]])
+
+        started = time.monotonic()
+        done_at_start = sum(counters.values())
+        last_progress = 0.0
+        semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+        logger.info(f"Рассылка {broadcast_id} начата с user_id > {last_user_id}")
+
+        try:
+            while True:
+                # Лидерство потеряно — рассылку продолжит новый лидер
+                if not LeaderElection.is_leader():
+                    logger.info(f"Рассылка {broadcast_id} приостановлена: реплика не лидер")
+                    return
+
+                recipients = await BroadcastManager.next_recipients(last_user_id)
+                if not recipients:
+                    break
+
+                results = await asyncio.gather(*(
+                    cls._send(bot, semaphore, user_id, broadcast['text'], reply_markup)
+                    for user_id in recipients
+                ))
+                blocked_ids = [user_id for user_id, result in zip(recipients, results) if result == 'blocked']
+                for result in results:
+                    counters[result] += 1
+
+                await BroadcastManager.mark_blocked(blocked_ids)
+                last_user_id = recipients[-1]
+                await BroadcastManager.checkpoint(broadcast_id, last_user_id, **counters)
+
+                now = time.monotonic()
+                if now - last_progress >= BROADCAST_PROGRESS_INTERVAL:
+                    last_progress = now
+                    await cls._report(bot, broadcast, counters, now - started,
+                                      sum(counters.values()) - done_at_start)
+
+            await BroadcastManager.finish(broadcast_id)
+            await cls._report(bot, broadcast, counters, time.monotonic() - started,
+                              sum(counters.values()) - done_at_start, finished=True)
+            logger.info(f"Рассылка {broadcast_id} завершена: {counters}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Статус остается running: рассылку подхватит следующий запуск
+            logger.error(f"Ошибка рассылки {broadcast_id}: {e}")
+        finally:
+            cls._running.pop(broadcast_id, None)
+
+    @classmethod
+    async def _send(cls, bot: Bot, semaphore: asyncio.Semaphore, user_id: int,
+                    text: str, reply_markup) -> str:
+        """Отправка одному получателю: sent / blocked / failed"""
+        async with semaphore:
+            for _ in range(3):
+                await cls.limiter.acquire()
+                try:
+                    await bot.send_message(
+                        chat_id=user_id,
+                        text=text,
+                        reply_markup=reply_markup,
+                        parse_mode='Markdown'
+                    )
+                    return 'sent'
+                except RetryAfter as e:
+                    await cls.limiter.pause(e.retry_after)
+                except Forbidden:
+                    return 'blocked'
+                except BadRequest as e:
+                    if 'chat not found' in str(e).lower():
+                        return 'blocked'
+                    logger.warning(f"Рассылка: ошибка отправки {user_id}: {e}")
+                    return 'failed'
+                except TelegramError as e:
+                    logger.warning(f"Рассылка: сетевая ошибка для {user_id}: {e}")
+            return 'failed'
+
+    @staticmethod
+    async def _report(bot: Bot, broadcast: Dict, counters: Dict, elapsed: float,
+                      processed: int, finished: bool = False):
+        """Обновление сообщения с прогрессом и скоростью рассылки"""
+        if not broadcast['report_chat_id']:
+            return
+        done = sum(counters.values())
+        total = max(broadcast['total'], done)
+        speed = processed / elapsed if elapsed > 0 else 0
+        eta = (total - done) / speed if speed > 0 else 0
+
+        text = (
+            f"📣 *Рассылка {'завершена' if finished else 'идет'}*\n\n"
+            f"*Обработано:* {done} из {total}\n"
+            f"✅ Доставлено: {counters['sent']}\n"
+            f"🚫 Заблокировали бота: {counters['blocked']}\n"
+            f"❌ Ошибки: {counters['failed']}\n\n"
+            f"*Скорость:* {speed:.1f} сообщ./сек"
+        )
+        if not finished and speed > 0:
+            text += f"\n*Осталось:* ~{int(eta // 60)} мин {int(eta % 60)} сек"
+
+        try:
+            await bot.edit_message_text(
+                chat_id=broadcast['report_chat_id'],
+                message_id=broadcast['report_message_id'],
+                text=text,
+                parse_mode='Markdown'
+            )
+        except TelegramError as e:
+            logger.warning(f"Не удалось обновить прогресс рассылки: {e}")
+
+
+async def fan_out(bot: Bot, messages: List[Tuple[int, str]]) -> Counter:
+    """Доставка пачки личных сообщений в общем лимите рассылок
+
+    Возвращает счетчик результатов: sent / blocked / failed.
+    """
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    results = await asyncio.gather(*(
+        BroadcastEngine._send(bot, semaphore, chat_id, text, None)
+        for chat_id, text in messages
+    ))
+    return Counter(results)
+
+
+def task_announcement(task: TaskDetail) -> str:
+    """Текст анонса нового задания"""
+    return TASK_ANNOUNCEMENT.render(task=task)
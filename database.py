@@ -1,24 +1,325 @@
 import os
+import asyncio
 import asyncpg
 import json
-import hashlib
 import secrets
-from datetime import datetime
-from typing import Dict, List, Optional
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 import ssl
+import sys
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from models import DueTask, TakenTask, TaskAdminRow, TaskDetail, TaskListItem, UserTaskRow
+from storage import (
+    AdminStore, PendingLinkStore, ReportQueueStore, SettingsStore, TaskStore, TrackingLinkStore, UserStore
+)
 
 # Получаем переменные окружения
 MAIN_ADMIN_ID = int(os.environ.get('MAIN_ADMIN_ID', '8358009538'))
 DATABASE_URL = os.environ.get('DATABASE_URL', '')
+# disable — подключение без SSL (локальный PostgreSQL); по умолчанию SSL без проверки сертификата
+DATABASE_SSL = os.environ.get('DATABASE_SSL', 'require')
+# Как часто реплика проверяет/захватывает лидерство (секунды)
+LEADER_CHECK_INTERVAL = float(os.environ.get('LEADER_CHECK_INTERVAL', '5'))
+# Как часто проверяется живость соединения ленты изменений (секунды)
+CHANGE_FEED_PING_INTERVAL = float(os.environ.get('CHANGE_FEED_PING_INTERVAL', '15'))
+# Максимум заданий в кэше TaskManager.get_task
+TASK_CACHE_SIZE = int(os.environ.get('TASK_CACHE_SIZE', '1000'))
+# Период фонового обновления снимка админ-панели и задержка после изменений (секунды)
+DASHBOARD_REFRESH_INTERVAL = float(os.environ.get('DASHBOARD_REFRESH_INTERVAL', '30'))
+DASHBOARD_NUDGE_DELAY = float(os.environ.get('DASHBOARD_NUDGE_DELAY', '1'))
+# Повтор загрузки индекса доступных заданий после сбоя: пауза растет до максимума (секунды)
+TASK_INDEX_RETRY_MAX = float(os.environ.get('TASK_INDEX_RETRY_MAX', '60'))
+# Сколько получателей рассылки читается с серверного курсора за раз
+BROADCAST_WINDOW = int(os.environ.get('BROADCAST_WINDOW', '200'))
+# Как часто накопленные метрики записываются в БД (секунды)
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '10'))
+# Почасовые метрики старше N дней сворачиваются в дневные, дневные старше N недель — в недельные
+ROLLUP_HOURLY_DAYS = int(os.environ.get('ROLLUP_HOURLY_DAYS', '2'))
+ROLLUP_DAILY_WEEKS = int(os.environ.get('ROLLUP_DAILY_WEEKS', '8'))
+# Сколько таблица лидеров помнит учтенные выполнения (защита от двойного учета, секунды)
+LEADERBOARD_APPLIED_WINDOW = float(os.environ.get('LEADERBOARD_APPLIED_WINDOW', '600'))
+# Сколько времени исполнитель держит задание, если у задания не задан свой срок (часы)
+CLAIM_TIMEOUT_HOURS = float(os.environ.get('CLAIM_TIMEOUT_HOURS', '48'))
+CLAIM_TIMEOUT_MINUTES = int(CLAIM_TIMEOUT_HOURS * 60)
+# Отслеживающая ссылка по умолчанию: {link_id} заменяется на ID ссылки
+TRACKING_LINK_TEMPLATE = f"https://t.me/{os.environ.get('BOT_USERNAME', 'your_bot_username')}?start={{link_id}}"
+# Срок одного запроса к БД (секунды): зависшая БД не держит обработчики дольше
+DB_QUERY_TIMEOUT = float(os.environ.get('DB_QUERY_TIMEOUT', '5'))
+# Срок для фоновых запросов по всей таблице (перестроения, сжатие метрик)
+DB_BACKGROUND_TIMEOUT = float(os.environ.get('DB_BACKGROUND_TIMEOUT', '60'))
+# Сколько ждать свободное соединение пула (секунды)
+DB_ACQUIRE_TIMEOUT = float(os.environ.get('DB_ACQUIRE_TIMEOUT', '2'))
+# Автомат защиты: сбоев связи подряд до размыкания и пауза до пробного запроса (секунды)
+DB_BREAKER_FAILURES = int(os.environ.get('DB_BREAKER_FAILURES', '3'))
+DB_BREAKER_COOLDOWN = float(os.environ.get('DB_BREAKER_COOLDOWN', '15'))
+# Сколько последних удачных чтений экранов хранится на случай недоступности БД
+STALE_CACHE_SIZE = int(os.environ.get('STALE_CACHE_SIZE', '10000'))
+# Запросы дольше порога пишутся в лог с местом вызова (миллисекунды)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+# Сколько разных запросов учитывает статистика; остальные копятся в одной строке
+QUERY_STATS_SIZE = int(os.environ.get('QUERY_STATS_SIZE', '500'))
+
+# ========== ИДЕНТИФИКАТОРЫ ==========
+# Crockford base32 в нижнем регистре: символы идут в порядке ASCII,
+# поэтому строки ID сортируются так же, как время их создания.
+ID_ALPHABET = "0123456789abcdefghjkmnpqrstvwxyz"
+ID_LENGTH = 16
+ID_INSERT_ATTEMPTS = 5
+
+_last_id_ms = 0
+_last_id_seq = 0
+
+
+def generate_id() -> str:
+    """Генерация компактного ID, упорядоченного по времени (16 символов)
+
+    80 бит: 48 бит миллисекунд + 32 бита счетчика, который в начале каждой
+    миллисекунды берется случайным и дальше монотонно растет. Старые
+    8-символьные hex ID остаются валидными ключами и продолжают находиться.
+    """
+    global _last_id_ms, _last_id_seq
+    now_ms = time.time_ns() // 1_000_000
+    if now_ms > _last_id_ms:
+        _last_id_ms = now_ms
+        # Старший бит свободен, чтобы счетчик не переполнялся внутри миллисекунды
+        _last_id_seq = secrets.randbits(31)
+    else:
+        # Та же миллисекунда (или часы ушли назад) — продолжаем последовательность
+        _last_id_seq += 1
+        if _last_id_seq >> 32:
+            _last_id_ms += 1
+            _last_id_seq = secrets.randbits(31)
+
+    value = (_last_id_ms << 32) | _last_id_seq
+    chars = []
+    for _ in range(ID_LENGTH):
+        chars.append(ID_ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+# Ошибки связи с БД (в отличие от ошибок самого запроса): зависание, обрыв, отказ в подключении
+DB_OUTAGE_ERRORS = (
+    asyncio.TimeoutError,
+    OSError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.QueryCanceledError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.TooManyConnectionsError,
+)
+
+
+class DatabaseUnavailable(Exception):
+    """БД не ответила вовремя или автомат защиты разомкнут: запрос не выполнен"""
+
+
+class CircuitBreaker:
+    """Автомат защиты от недоступной БД
+
+    После failures сбоев связи подряд автомат размыкается: запросы сразу
+    получают DatabaseUnavailable, не занимая пул и не дожидаясь таймаутов.
+    Через cooldown секунд пропускается один пробный запрос: успех замыкает
+    автомат, сбой продлевает паузу.
+    """
+
+    def __init__(self, failures: int, cooldown: float):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._count = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    def is_open(self) -> bool:
+        """Разомкнут ли автомат (БД считается недоступной)"""
+        return self._opened_at is not None
+
+    def before(self):
+        """Проверка перед запросом; DatabaseUnavailable — запрос не отправляется"""
+        if self._opened_at is None:
+            return
+        if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+            raise DatabaseUnavailable("БД временно недоступна")
+        self._probing = True
+
+    def success(self):
+        """БД ответила (в том числе ошибкой запроса)"""
+        if self._opened_at is not None:
+            print("✅ БД снова отвечает, автомат защиты замкнут")
+        self._count = 0
+        self._opened_at = None
+        self._probing = False
+
+    def failure(self):
+        """Сбой связи с БД"""
+        self._count += 1
+        self._probing = False
+        if self._opened_at is None and self._count < self.failures:
+            return
+        if self._opened_at is None:
+            print(f"⚠️ БД не отвечает ({self._count} сбоя подряд), автомат защиты разомкнут")
+        self._opened_at = time.monotonic()
+
+    def abandon(self):
+        """Запрос отменен, не дождавшись ответа: пробу можно повторить"""
+        self._probing = False
+
+
+class QueryStats:
+    """Статистика запросов процесса по тексту запроса: вызовы, время, строки
+
+    Ведется соединениями InstrumentedConnection; счетчики живут в памяти
+    процесса и обнуляются при рестарте или командой /dbstats reset.
+    """
+
+    OTHER = "… остальные запросы"
+    ORDERS = ('total', 'mean', 'max', 'calls')
+
+    # текст запроса -> [вызовы, ошибки, медленные, суммарное время, максимум, строки]
+    _stats: Dict[str, List[float]] = {}
+    since = datetime.now()
+
+    @classmethod
+    def record(cls, sql: str, elapsed: float, rows: int, failed: bool, slow: bool):
+        """Учет одного выполнения запроса (elapsed — секунды)"""
+        stats = cls._stats.get(sql)
+        if stats is None:
+            if len(cls._stats) >= QUERY_STATS_SIZE:
+                sql = cls.OTHER
+            stats = cls._stats.setdefault(sql, [0, 0, 0, 0.0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += failed
+        stats[2] += slow
+        stats[3] += elapsed
+        stats[4] = max(stats[4], elapsed)
+        stats[5] += rows
+
+    @classmethod
+    def top(cls, order: str = 'total', limit: int = 15) -> List[Dict]:
+        """Самые тяжелые запросы: время в миллисекундах, строки в среднем на вызов"""
+        merged: Dict[str, List[float]] = {}
+        # Тексты, различающиеся только пробелами, — один запрос
+        for sql, (calls, errors, slow, total, peak, rows) in cls._stats.items():
+            key = ' '.join(sql.split())
+            stats = merged.setdefault(key, [0, 0, 0, 0.0, 0.0, 0])
+            stats[0] += calls
+            stats[1] += errors
+            stats[2] += slow
+            stats[3] += total
+            stats[4] = max(stats[4], peak)
+            stats[5] += rows
+        result = [
+            {
+                'sql': sql,
+                'calls': calls,
+                'errors': errors,
+                'slow': slow,
+                'total': total * 1000,
+                'mean': total * 1000 / calls,
+                'max': peak * 1000,
+                'rows': rows / calls,
+            }
+            for sql, (calls, errors, slow, total, peak, rows) in merged.items()
+        ]
+        result.sort(key=lambda item: item[order], reverse=True)
+        return result[:limit]
+
+    @classmethod
+    def reset(cls):
+        """Обнуление статистики"""
+        cls._stats = {}
+        cls.since = datetime.now()
+
+
+_ASYNCPG_DIR = os.path.dirname(asyncpg.__file__)
+# Кадры драйвера и цикла событий в месте вызова не показываются
+_CALL_SITE_SKIPPED = (_ASYNCPG_DIR, os.path.dirname(asyncio.__file__))
+
+
+def _call_site(depth: int) -> str:
+    """Место вызова запроса: ближайший код вне asyncpg и код из другого файла, который его вызвал"""
+    frame = sys._getframe(depth + 1)
+    sites = []
+    while frame is not None and len(sites) < 2:
+        filename = frame.f_code.co_filename
+        if not filename.startswith(_CALL_SITE_SKIPPED) and (not sites or filename != sites[-1][0]):
+            sites.append((filename, frame.f_lineno, frame.f_code.co_name))
+        frame = frame.f_back
+    return ' ← '.join(f"{os.path.basename(filename)}:{line} {name}" for filename, line, name in sites)
+
+
+class InstrumentedConnection(asyncpg.Connection):
+    """Соединение asyncpg, которое ведет QueryStats и пишет в лог медленные запросы
+
+    Служебные запросы самого asyncpg (BEGIN/COMMIT транзакций, сброс
+    соединения при возврате в пул) не учитываются.
+    """
+
+    async def _measured(self, call: Awaitable, query: str, count_rows: Callable[[Any], int]):
+        # Кадры: _measured <- fetch/execute/... <- вызывающий код
+        if sys._getframe(2).f_code.co_filename.startswith(_ASYNCPG_DIR):
+            return await call
+        started = time.perf_counter()
+        result = None
+        failed = True
+        try:
+            result = await call
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            rows = 0 if failed else count_rows(result)
+            slow = elapsed * 1000 >= SLOW_QUERY_MS
+            QueryStats.record(query, elapsed, rows, failed, slow)
+            if slow:
+                print(
+                    f"🐢 Медленный запрос: {elapsed * 1000:.0f} мс, строк {rows}"
+                    f"{', с ошибкой' if failed else ''} ({_call_site(2)}): {' '.join(query.split())[:300]}"
+                )
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._measured(super().fetch(query, *args, **kwargs), query, len)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._measured(
+            super().fetchrow(query, *args, **kwargs), query, lambda row: int(row is not None)
+        )
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._measured(
+            super().fetchval(query, *args, **kwargs), query, lambda value: int(value is not None)
+        )
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._measured(super().execute(query, *args, **kwargs), query, self._status_rows)
+
+    @staticmethod
+    def _status_rows(status: str) -> int:
+        """Число затронутых строк из статуса вида «UPDATE 3»"""
+        count = status.rsplit(' ', 1)[-1]
+        return int(count) if count.isdigit() else 0
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL не установлен в переменных окружения!")
 
 
 class PostgresDB:
     """Класс для работы с PostgreSQL"""
 
     _pool = None
+    breaker = CircuitBreaker(DB_BREAKER_FAILURES, DB_BREAKER_COOLDOWN)
+
+    @staticmethod
+    def _ssl_context():
+        """SSL-контекст для подключения (Railway требует SSL); False — без SSL"""
+        if DATABASE_SSL == 'disable':
+            return False
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        return ssl_context
 
     @classmethod
     async def init_pool(cls):
@@ -27,17 +328,13 @@ class PostgresDB:
             if not DATABASE_URL:
                 raise ValueError("❌ DATABASE_URL не установлен в переменных окружения!")
             try:
-                # Railway требует SSL
-                ssl_context = ssl.create_default_context()
-                ssl_context.check_hostname = False
-                ssl_context.verify_mode = ssl.CERT_NONE
-                
                 cls._pool = await asyncpg.create_pool(
                     DATABASE_URL,
                     min_size=1,
                     max_size=10,
-                    command_timeout=60,
-                    ssl=ssl_context  # Добавляем SSL
+                    command_timeout=DB_QUERY_TIMEOUT,
+                    ssl=cls._ssl_context(),
+                    connection_class=InstrumentedConnection
                 )
                 print("✅ Подключение к PostgreSQL установлено")
                 
@@ -49,9 +346,54 @@ class PostgresDB:
             except Exception as e:
                 print(f"❌ Ошибка подключения к PostgreSQL: {e}")
                 print(f"DATABASE_URL: {DATABASE_URL[:20]}...")
+                # Непроверенный пул не оставляем: следующий вызов создаст его заново
+                if cls._pool:
+                    cls._pool.terminate()
+                    cls._pool = None
                 raise
         return cls._pool
 
+    @classmethod
+    @asynccontextmanager
+    async def guarded(cls):
+        """Работа с БД под автоматом защиты: сбои связи становятся DatabaseUnavailable"""
+        cls.breaker.before()
+        try:
+            yield
+        except DatabaseUnavailable:
+            raise
+        except DB_OUTAGE_ERRORS as e:
+            cls.breaker.failure()
+            raise DatabaseUnavailable(str(e) or type(e).__name__) from e
+        except Exception:
+            # БД ответила ошибкой самого запроса — связь в порядке
+            cls.breaker.success()
+            raise
+        except BaseException:
+            cls.breaker.abandon()
+            raise
+        cls.breaker.success()
+
+    @classmethod
+    @asynccontextmanager
+    async def connection(cls, conn: Optional[asyncpg.Connection] = None):
+        """Соединение для запроса: переданное вызывающим (скрипт планов запросов) или новое из пула"""
+        if conn is not None:
+            yield conn
+            return
+        async with cls.guarded():
+            pool = await cls.init_pool()
+            async with pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as acquired:
+                yield acquired
+
+    @classmethod
+    async def connect(cls) -> asyncpg.Connection:
+        """Отдельное соединение вне пула (для долгоживущих сессий и миграций)
+
+        Срок запроса у такого соединения не ограничен.
+        """
+        return await asyncpg.connect(DATABASE_URL, ssl=cls._ssl_context(), connection_class=InstrumentedConnection)
+
     @classmethod
     async def close_pool(cls):
         """Закрытие пула"""
@@ -61,9 +403,14 @@ class PostgresDB:
 
     @classmethod
     async def init_db(cls):
-        """Создание таблиц, если их нет"""
-        pool = await cls.init_pool()
-        async with pool.acquire() as conn:
+        """Создание таблиц, если их нет
+
+        Миграции идут через отдельное соединение: создание индексов и
+        заполнение новых колонок может длиться дольше DB_QUERY_TIMEOUT.
+        """
+        await cls.init_pool()
+        conn = await cls.connect()
+        try:
             # Таблица пользователей
             await conn.execute('''
                 CREATE TABLE IF NOT EXISTS users (
@@ -76,6 +423,11 @@ class PostgresDB:
                 )
             ''')
 
+            # Пользователи, заблокировавшие бота, пропускаются в рассылках
+            await conn.execute('''
+                ALTER TABLE users ADD COLUMN IF NOT EXISTS blocked BOOLEAN DEFAULT false
+            ''')
+
             # Таблица администраторов
             await conn.execute('''
                 CREATE TABLE IF NOT EXISTS admins (
@@ -110,6 +462,63 @@ class PostgresDB:
                 )
             ''')
 
+            # Последние задания для админ-панели
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS tasks_created_date_idx ON tasks (created_date DESC)
+            ''')
+
+            # Сроки заданий: отложенная публикация, окончание и время на выполнение.
+            # deadline — ближайшее событие по заданию, его ведет триггер tasks_set_deadline
+            await conn.execute('''
+                ALTER TABLE tasks
+                    ADD COLUMN IF NOT EXISTS publish_at TIMESTAMP,
+                    ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP,
+                    ADD COLUMN IF NOT EXISTS claim_timeout INTEGER,
+                    ADD COLUMN IF NOT EXISTS deadline TIMESTAMP,
+                    ADD COLUMN IF NOT EXISTS deadline_kind TEXT
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS tasks_deadline_idx ON tasks (deadline)
+                WHERE deadline IS NOT NULL
+            ''')
+
+            # Места исполнителей: capacity — сколько человек могут выполнить задание,
+            # slots_left — свободные места, slots_done — выполненные. Задание открыто,
+            # пока есть свободные места; каждое взятие — отдельная строка user_tasks
+            await conn.execute('''
+                ALTER TABLE tasks
+                    ADD COLUMN IF NOT EXISTS capacity INTEGER DEFAULT 1,
+                    ADD COLUMN IF NOT EXISTS slots_left INTEGER,
+                    ADD COLUMN IF NOT EXISTS slots_done INTEGER DEFAULT 0
+            ''')
+            # Задания, созданные до появления мест, — на одного исполнителя
+            await conn.execute('''
+                UPDATE tasks SET
+                    capacity = 1,
+                    slots_done = CASE WHEN completed THEN 1 ELSE 0 END,
+                    slots_left = CASE WHEN completed OR taken_by IS NOT NULL THEN 0 ELSE 1 END
+                WHERE slots_left IS NULL
+            ''')
+
+            # Полнотекстовый поиск по открытым заданиям: заголовок важнее описания,
+            # описание — требований. Индексы частичные, по условию открытого задания
+            await conn.execute('''
+                ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector
+                GENERATED ALWAYS AS (
+                    setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+                    setweight(to_tsvector('russian', coalesce(description, '')), 'B') ||
+                    setweight(to_tsvector('russian', coalesce(requirements, '')), 'C')
+                ) STORED
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS tasks_search_idx ON tasks USING GIN (search_vector)
+                WHERE available = true AND active = true AND taken_by IS NULL
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS tasks_open_type_reward_idx ON tasks (type, reward)
+                WHERE available = true AND active = true AND taken_by IS NULL
+            ''')
+
             # Таблица активных заданий пользователей
             await conn.execute('''
                 CREATE TABLE IF NOT EXISTS user_tasks (
@@ -122,6 +531,20 @@ class PostgresDB:
                 )
             ''')
 
+            # Срок возврата и доказательство хранятся по каждому взятию
+            await conn.execute('''
+                ALTER TABLE user_tasks
+                    ADD COLUMN IF NOT EXISTS deadline TIMESTAMP,
+                    ADD COLUMN IF NOT EXISTS proof TEXT
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS user_tasks_deadline_idx ON user_tasks (deadline)
+                WHERE status = 'active'
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS user_tasks_task_idx ON user_tasks (task_id)
+            ''')
+
             # Таблица для отслеживания ссылок
             await conn.execute('''
                 CREATE TABLE IF NOT EXISTS tracking_links (
@@ -135,28 +558,1057 @@ class PostgresDB:
                     work_link TEXT
                 )
             ''')
+            # Ссылки исполнителя: выдача рабочей ссылки и снятие просроченного взятия
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS tracking_links_task_user_idx ON tracking_links (task_id, user_id)
+            ''')
 
             # Таблица для ожидающих ссылок
             await conn.execute('''
                 CREATE TABLE IF NOT EXISTS pending_links (
-                    task_id TEXT PRIMARY KEY,
+                    task_id TEXT,
                     user_id BIGINT,
                     username TEXT,
                     task_title TEXT,
                     message_sent TIMESTAMP,
-                    tracking_link TEXT
+                    tracking_link TEXT,
+                    PRIMARY KEY (task_id, user_id)
+                )
+            ''')
+            # Раньше ожидающая ссылка была одна на задание — ключ расширяется до исполнителя
+            await conn.execute('''
+                DO $$
+                BEGIN
+                    IF (
+                        SELECT array_length(conkey, 1) FROM pg_constraint
+                        WHERE conname = 'pending_links_pkey'
+                    ) = 1 THEN
+                        DELETE FROM pending_links WHERE user_id IS NULL;
+                        ALTER TABLE pending_links DROP CONSTRAINT pending_links_pkey;
+                        ALTER TABLE pending_links ADD PRIMARY KEY (task_id, user_id);
+                    END IF;
+                END
+                $$
+            ''')
+            # Список ожидающих в админ-панели — самые старые первыми
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS pending_links_sent_idx ON pending_links (message_sent)
+            ''')
+
+            # Рассылки с контрольной точкой для продолжения после рестарта
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    broadcast_id TEXT PRIMARY KEY,
+                    task_id TEXT,
+                    text TEXT,
+                    created_by BIGINT,
+                    created TIMESTAMP,
+                    status TEXT DEFAULT 'running',
+                    last_user_id BIGINT DEFAULT 0,
+                    total INTEGER DEFAULT 0,
+                    sent INTEGER DEFAULT 0,
+                    failed INTEGER DEFAULT 0,
+                    blocked INTEGER DEFAULT 0,
+                    report_chat_id BIGINT,
+                    report_message_id BIGINT,
+                    finished TIMESTAMP
+                )
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS broadcasts_running_idx ON broadcasts (task_id)
+                WHERE status = 'running'
+            ''')
+
+            # Журнал запусков плановых задач (защита от повторной отправки)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS job_runs (
+                    job_name TEXT,
+                    run_key TEXT,
+                    started TIMESTAMP,
+                    PRIMARY KEY (job_name, run_key)
+                )
+            ''')
+
+            # Состояние диалогов пользователей (общее для всех реплик)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_states (
+                    user_id BIGINT PRIMARY KEY,
+                    data JSONB,
+                    updated TIMESTAMP
+                )
+            ''')
+
+            # Метрики по часам/дням/неделям: переходы, конверсии, взятия и выполнения
+            # в разрезе ссылки, задания, исполнителя и всей системы (dimension='all')
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS metric_rollups (
+                    dimension TEXT,
+                    key TEXT,
+                    metric TEXT,
+                    granularity TEXT,
+                    bucket TIMESTAMP,
+                    count BIGINT DEFAULT 0,
+                    amount FLOAT DEFAULT 0,
+                    PRIMARY KEY (dimension, key, metric, bucket, granularity)
+                )
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS metric_rollups_compaction_idx
+                ON metric_rollups (granularity, bucket)
+            ''')
+
+            # Отчеты о выполнении, ожидающие отправки сводкой (переживают рестарт)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS report_queue (
+                    entry_id TEXT PRIMARY KEY,
+                    created TIMESTAMP,
+                    payload JSONB
+                )
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS report_queue_created_idx ON report_queue (created)
+            ''')
+
+            # Настройки, которые админы меняют из бота (приветствие, группы, шаблон ссылок)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_by BIGINT,
+                    updated_at TIMESTAMP
                 )
             ''')
 
             print("✅ Таблицы PostgreSQL созданы/проверены")
 
+            await ChangeFeed.install(conn)
+            await cls.install_functions(conn)
+        finally:
+            await conn.close()
+
+    @staticmethod
+    async def install_functions(conn):
+        """Серверные функции для многошаговых действий (один запрос, одна транзакция)"""
+        # Взятие задания: место, запись в user_tasks, ссылка и ожидающая выдача.
+        # Сигнатура расширилась — прежний вариант функции удаляется
+        await conn.execute('''
+            DROP FUNCTION IF EXISTS take_task(TEXT, BIGINT, TEXT, TEXT, TEXT, TIMESTAMP)
+        ''')
+        await conn.execute('''
+            CREATE OR REPLACE FUNCTION take_task(
+                p_task_id TEXT, p_user_id BIGINT, p_username TEXT,
+                p_link_id TEXT, p_tracking_link TEXT, p_now TIMESTAMP,
+                p_default_timeout INTEGER
+            ) RETURNS SETOF tasks AS $$
+            DECLARE
+                t tasks;
+            BEGIN
+                -- Исполнитель уже держит или выполнил это задание
+                IF EXISTS (
+                    SELECT 1 FROM user_tasks
+                    WHERE user_id = p_user_id AND task_id = p_task_id AND status <> 'expired'
+                ) THEN
+                    RETURN;
+                END IF;
+
+                -- Место списывается одним UPDATE: одновременные взятия выстраиваются
+                -- на блокировке строки, последнее место достается одному
+                UPDATE tasks
+                SET slots_left = slots_left - 1, available = slots_left > 1
+                WHERE task_id = p_task_id
+                    AND available = true AND active = true AND taken_by IS NULL
+                    AND slots_left > 0
+                RETURNING * INTO t;
+                IF NOT FOUND THEN
+                    RETURN;
+                END IF;
+
+                -- Двойное нажатие на разных репликах: второе взятие дождалось первого
+                -- на блокировке задания и упирается в его строку — место возвращается
+                INSERT INTO user_tasks (user_id, task_id, status, taken_date, deadline)
+                VALUES (p_user_id, p_task_id, 'active', p_now,
+                    p_now + make_interval(mins => coalesce(t.claim_timeout, p_default_timeout)))
+                ON CONFLICT (user_id, task_id) DO UPDATE SET
+                    status = 'active',
+                    taken_date = EXCLUDED.taken_date,
+                    completed_date = NULL,
+                    deadline = EXCLUDED.deadline,
+                    proof = NULL
+                WHERE user_tasks.status = 'expired';
+                IF NOT FOUND THEN
+                    UPDATE tasks SET slots_left = slots_left + 1, available = true
+                    WHERE task_id = p_task_id;
+                    RETURN;
+                END IF;
+
+                INSERT INTO tracking_links (link_id, user_id, task_id, created, clicks, conversions, active)
+                VALUES (p_link_id, p_user_id, p_task_id, p_now, 0, 0, true);
+
+                INSERT INTO pending_links (task_id, user_id, username, task_title, message_sent, tracking_link)
+                VALUES (p_task_id, p_user_id, p_username, t.title, p_now, p_tracking_link)
+                ON CONFLICT (task_id, user_id) DO UPDATE SET
+                    username = EXCLUDED.username,
+                    task_title = EXCLUDED.task_title,
+                    message_sent = EXCLUDED.message_sent,
+                    tracking_link = EXCLUDED.tracking_link;
+
+                RETURN NEXT t;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+
+        # Завершение взятия: статус в user_tasks, счетчик выполненных мест и
+        # начисление заработка. Условие status = 'active' не дает начислить
+        # награду дважды; задание закрывается, когда выполнены все места
+        await conn.execute('''
+            CREATE OR REPLACE FUNCTION complete_task(
+                p_task_id TEXT, p_user_id BIGINT, p_proof TEXT, p_now TIMESTAMP
+            ) RETURNS SETOF tasks AS $$
+            DECLARE
+                t tasks;
+            BEGIN
+                UPDATE user_tasks
+                SET status = 'completed', completed_date = p_now, proof = p_proof
+                WHERE user_id = p_user_id AND task_id = p_task_id AND status = 'active';
+                IF NOT FOUND THEN
+                    RETURN;
+                END IF;
+
+                UPDATE tasks
+                SET slots_done = slots_done + 1,
+                    proof = p_proof,
+                    completed = slots_done + 1 >= capacity,
+                    completed_date = CASE WHEN slots_done + 1 >= capacity THEN p_now ELSE completed_date END,
+                    active = active AND slots_done + 1 < capacity
+                WHERE task_id = p_task_id
+                RETURNING * INTO t;
+
+                UPDATE users SET earned = earned + t.reward WHERE user_id = p_user_id;
+
+                RETURN NEXT t;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+
+        # Ближайший срок задания пересчитывается при каждой записи строки:
+        # отложенное — публикация, открытое — окончание. Сроки возврата взятий
+        # хранятся в user_tasks.deadline
+        await conn.execute('''
+            CREATE OR REPLACE FUNCTION tasks_set_deadline() RETURNS trigger AS $$
+            BEGIN
+                NEW.deadline := NULL;
+                NEW.deadline_kind := NULL;
+                IF NEW.completed IS TRUE OR NEW.active IS NOT TRUE THEN
+                    RETURN NEW;
+                END IF;
+                IF NEW.available IS NOT TRUE AND NEW.publish_at IS NOT NULL
+                        AND NEW.slots_left > 0 THEN
+                    NEW.deadline := NEW.publish_at;
+                    NEW.deadline_kind := 'publish';
+                ELSIF NEW.available IS TRUE AND NEW.expires_at IS NOT NULL THEN
+                    NEW.deadline := NEW.expires_at;
+                    NEW.deadline_kind := 'expire';
+                END IF;
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        await conn.execute('''
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM pg_trigger WHERE tgname = 'tasks_set_deadline'
+                ) THEN
+                    CREATE TRIGGER tasks_set_deadline
+                    BEFORE INSERT OR UPDATE ON tasks
+                    FOR EACH ROW EXECUTE FUNCTION tasks_set_deadline();
+                END IF;
+            END
+            $$
+        ''')
+        # Взятия, сделанные до сроков по каждому исполнителю, получают срок возврата,
+        # а сроки возврата в самих заданиях пересчитываются
+        await conn.execute('''
+            UPDATE user_tasks ut
+            SET deadline = ut.taken_date + make_interval(mins => coalesce(t.claim_timeout, $1))
+            FROM tasks t
+            WHERE t.task_id = ut.task_id AND ut.status = 'active'
+                AND ut.deadline IS NULL AND ut.taken_date IS NOT NULL
+        ''', CLAIM_TIMEOUT_MINUTES)
+        await conn.execute('''
+            UPDATE tasks SET deadline_kind = deadline_kind WHERE deadline_kind = 'claim'
+        ''')
+
+
+class ChangeFeed:
+    """Лента изменений через LISTEN/NOTIFY для согласованности кэшей между процессами
+
+    Триггеры публикуют компактные уведомления вида "таблица:операция:ключ".
+    Отдельное соединение слушает канал и вызывает зарегистрированные обработчики
+    инвалидации. Обработчик получает (op, key); key=None означает «сбросить все» —
+    так помечается переподключение, после которого часть уведомлений могла потеряться.
+    """
+
+    CHANNEL = 'traffic_changes'
+    # Таблица -> колонка ключа, который попадает в уведомление
+    TABLES = {
+        'tasks': 'task_id',
+        'admins': 'user_id',
+        'pending_links': 'task_id',
+        'tracking_links': 'link_id',
+        'settings': 'key',
+    }
+    # События, публикуемые только при нужном переходе строки:
+    # событие -> (таблица, колонка ключа, условие WHEN триггера)
+    EVENTS = {
+        # Выполнение взятия — единственное изменение, влияющее на таблицы лидеров
+        'completions': ('user_tasks', 'task_id',
+                        "NEW.status = 'completed' AND OLD.status IS DISTINCT FROM 'completed'"),
+    }
+
+    _subscribers: Dict[str, List[Callable]] = {}
+    _conn = None
+    _task = None
+    _connected: Optional[asyncio.Event] = None
+    _lost: Optional[asyncio.Event] = None
+
+    @classmethod
+    async def install(cls, conn):
+        """Создание функции и триггеров, публикующих изменения"""
+        await conn.execute(f'''
+            CREATE OR REPLACE FUNCTION notify_change() RETURNS trigger AS $$
+            DECLARE
+                rec RECORD;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    rec := OLD;
+                ELSE
+                    rec := NEW;
+                END IF;
+                -- Второй аргумент — имя события вместо имени таблицы
+                PERFORM pg_notify(
+                    '{cls.CHANNEL}',
+                    coalesce(TG_ARGV[1], TG_TABLE_NAME) || ':' || left(TG_OP, 1) || ':' ||
+                        coalesce(to_jsonb(rec) ->> TG_ARGV[0], '')
+                );
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        for table, key in cls.TABLES.items():
+            await conn.execute(f'''
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (
+                        SELECT 1 FROM pg_trigger WHERE tgname = '{table}_notify_change'
+                    ) THEN
+                        CREATE TRIGGER {table}_notify_change
+                        AFTER INSERT OR UPDATE OR DELETE ON {table}
+                        FOR EACH ROW EXECUTE FUNCTION notify_change('{key}');
+                    END IF;
+                END
+                $$
+            ''')
+        for event, (table, key, condition) in cls.EVENTS.items():
+            await conn.execute(f'''
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (
+                        SELECT 1 FROM pg_trigger WHERE tgname = '{table}_notify_{event}'
+                    ) THEN
+                        CREATE TRIGGER {table}_notify_{event}
+                        AFTER UPDATE ON {table}
+                        FOR EACH ROW WHEN ({condition})
+                        EXECUTE FUNCTION notify_change('{key}', '{event}');
+                    END IF;
+                END
+                $$
+            ''')
+
+    @classmethod
+    def subscribe(cls, table: str, callback: Callable):
+        """Регистрация обработчика изменений таблицы: callback(op, key)"""
+        cls._subscribers.setdefault(table, []).append(callback)
+
+    @classmethod
+    def is_live(cls) -> bool:
+        """Слушает ли лента изменения прямо сейчас (можно доверять кэшам)"""
+        return cls._connected is not None and cls._connected.is_set()
+
+    @classmethod
+    async def start(cls, timeout: float = 10):
+        """Запуск слушателя; ждем первого подключения, чтобы не пропустить изменения"""
+        if cls._task:
+            return
+        cls._connected = asyncio.Event()
+        cls._lost = asyncio.Event()
+        cls._task = asyncio.create_task(cls._run())
+        try:
+            await asyncio.wait_for(cls._connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            print("⚠️ Лента изменений пока не подключена, кэши работают в обход")
+
+    @classmethod
+    async def stop(cls):
+        """Остановка слушателя"""
+        if cls._task:
+            cls._task.cancel()
+            try:
+                await cls._task
+            except asyncio.CancelledError:
+                pass
+            cls._task = None
+        await cls._close()
+
+    @classmethod
+    async def _close(cls):
+        """Закрытие соединения слушателя"""
+        if cls._connected:
+            cls._connected.clear()
+        if cls._conn and not cls._conn.is_closed():
+            try:
+                await cls._conn.close(timeout=5)
+            except Exception:
+                cls._conn.terminate()
+        cls._conn = None
+
+    @classmethod
+    async def _run(cls):
+        """Цикл: подключение, прослушивание, переподключение при обрыве"""
+        first = True
+        while True:
+            try:
+                cls._lost.clear()
+                cls._conn = await PostgresDB.connect()
+                cls._conn.add_termination_listener(lambda conn: cls._lost.set())
+                await cls._conn.add_listener(cls.CHANNEL, cls._on_notify)
+                cls._connected.set()
+                if not first:
+                    # Пока слушателя не было, изменения могли пройти мимо
+                    print("🔄 Лента изменений переподключена, сбрасываем кэши")
+                    cls.invalidate_all()
+                first = False
+
+                while True:
+                    try:
+                        await asyncio.wait_for(cls._lost.wait(), CHANGE_FEED_PING_INTERVAL)
+                        break
+                    except asyncio.TimeoutError:
+                        # Обрыв TCP без закрытия сокета сам по себе не заметен
+                        await cls._conn.fetchval('SELECT 1', timeout=CHANGE_FEED_PING_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Ошибка ленты изменений: {e}")
+            await cls._close()
+            # Соединение потеряно: до переподключения кэши не доверяем
+            cls.invalidate_all()
+            first = False
+            await asyncio.sleep(1)
+
+    @classmethod
+    def _on_notify(cls, conn, pid, channel, payload: str):
+        """Разбор уведомления и вызов обработчиков"""
+        try:
+            table, op, key = payload.split(':', 2)
+        except ValueError:
+            return
+        cls._dispatch(table, op, key or None)
+
+    @classmethod
+    def _dispatch(cls, table: str, op: str, key: Optional[str]):
+        """Вызов обработчиков таблицы"""
+        for callback in cls._subscribers.get(table, []):
+            try:
+                result = callback(op, key)
+                if asyncio.iscoroutine(result):
+                    asyncio.create_task(result)
+            except Exception as e:
+                print(f"⚠️ Ошибка обработчика изменений {table}: {e}")
+
+    @classmethod
+    def invalidate_all(cls):
+        """Полная инвалидация всех подписчиков"""
+        for table in (*cls.TABLES, *cls.EVENTS):
+            cls._dispatch(table, '*', None)
+
+
+class LeaderElection:
+    """Выбор лидера среди реплик через advisory lock PostgreSQL
+
+    Блокировка держится на отдельном соединении: если процесс-лидер падает,
+    PostgreSQL снимает ее вместе с сессией, и следующая реплика захватывает
+    лидерство в течение LEADER_CHECK_INTERVAL.
+    """
+
+    LOCK_KEY = 0x74726166  # 'traf'
+
+    _conn = None
+    _task = None
+    _is_leader = False
+    _on_elected: List[Callable[[], Awaitable[None]]] = []
+
+    @classmethod
+    def is_leader(cls) -> bool:
+        """Является ли текущий процесс лидером"""
+        return cls._is_leader
+
+    @classmethod
+    def on_elected(cls, callback: Callable[[], Awaitable[None]]):
+        """Регистрация обработчика, вызываемого при получении лидерства"""
+        cls._on_elected.append(callback)
+
+    @classmethod
+    async def start(cls):
+        """Запуск фонового цикла выборов"""
+        if not cls._task:
+            cls._task = asyncio.create_task(cls._run())
+
+    @classmethod
+    async def stop(cls):
+        """Остановка и освобождение лидерства"""
+        if cls._task:
+            cls._task.cancel()
+            try:
+                await cls._task
+            except asyncio.CancelledError:
+                pass
+            cls._task = None
+        if cls._conn and not cls._conn.is_closed():
+            try:
+                if cls._is_leader:
+                    await cls._conn.execute('SELECT pg_advisory_unlock($1)', cls.LOCK_KEY)
+                await cls._conn.close()
+            except Exception as e:
+                print(f"⚠️ Ошибка при освобождении лидерства: {e}")
+        cls._conn = None
+        cls._is_leader = False
+
+    @classmethod
+    async def _run(cls):
+        """Цикл: захват блокировки или проверка, что она все еще наша"""
+        while True:
+            try:
+                if cls._conn is None or cls._conn.is_closed():
+                    cls._set_leader(False)
+                    cls._conn = await PostgresDB.connect()
+                if cls._is_leader:
+                    # Живое соединение = блокировка все еще у нас
+                    await cls._conn.fetchval('SELECT 1', timeout=LEADER_CHECK_INTERVAL)
+                else:
+                    acquired = await cls._conn.fetchval(
+                        'SELECT pg_try_advisory_lock($1)', cls.LOCK_KEY,
+                        timeout=LEADER_CHECK_INTERVAL
+                    )
+                    if acquired:
+                        cls._set_leader(True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Ошибка выбора лидера: {e}")
+                cls._set_leader(False)
+                if cls._conn:
+                    cls._conn.terminate()
+                cls._conn = None
+            await asyncio.sleep(LEADER_CHECK_INTERVAL)
+
+    @classmethod
+    def _set_leader(cls, value: bool):
+        """Смена статуса лидера с вызовом обработчиков"""
+        if value == cls._is_leader:
+            return
+        cls._is_leader = value
+        if value:
+            print("👑 Реплика стала лидером плановых задач")
+            for callback in cls._on_elected:
+                asyncio.create_task(callback())
+        else:
+            print("⚠️ Реплика потеряла лидерство")
+
+
+class JobRunsManager:
+    @staticmethod
+    async def claim(job_name: str, run_key: str, conn: Optional[asyncpg.Connection] = None) -> bool:
+        """Отметка выполненного запуска задачи; False — запуск уже отмечен другой репликой"""
+        async with PostgresDB.connection(conn) as conn:
+            result = await conn.execute('''
+                INSERT INTO job_runs (job_name, run_key, started)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (job_name, run_key) DO NOTHING
+            ''', job_name, run_key, datetime.now())
+            return result == 'INSERT 0 1'
+
+    @staticmethod
+    async def has_run(job_name: str, run_key: str, conn: Optional[asyncpg.Connection] = None) -> bool:
+        """Проверка, выполнялся ли уже запуск задачи"""
+        async with PostgresDB.connection(conn) as conn:
+            return await conn.fetchval(
+                'SELECT EXISTS(SELECT 1 FROM job_runs WHERE job_name = $1 AND run_key = $2)',
+                job_name, run_key
+            )
+
+
+class UserStateManager:
+    @staticmethod
+    async def load(user_id: int, conn: Optional[asyncpg.Connection] = None) -> Dict:
+        """Загрузка состояния диалога пользователя"""
+        async with PostgresDB.connection(conn) as conn:
+            data = await conn.fetchval(
+                'SELECT data FROM user_states WHERE user_id = $1',
+                user_id
+            )
+            return json.loads(data) if data else {}
+
+    @staticmethod
+    async def save(user_id: int, data: Dict, conn: Optional[asyncpg.Connection] = None):
+        """Сохранение состояния диалога пользователя"""
+        async with PostgresDB.connection(conn) as conn:
+            if data:
+                await conn.execute('''
+                    INSERT INTO user_states (user_id, data, updated)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        data = EXCLUDED.data,
+                        updated = EXCLUDED.updated
+                ''', user_id, json.dumps(data), datetime.now())
+            else:
+                await conn.execute(
+                    'DELETE FROM user_states WHERE user_id = $1',
+                    user_id
+                )
+
+
+class LastKnownGood:
+    """Последние удачные чтения экранов на случай недоступности БД
+
+    Экран только на чтение получает данные через read(): пока БД отвечает,
+    результат запоминается; когда БД недоступна, отдается последний удачный
+    результат вместе с моментом, на который он актуален.
+    """
+
+    _values: "OrderedDict[Tuple, Tuple[Any, datetime]]" = OrderedDict()
+
+    @classmethod
+    async def read(cls, key: Tuple, loader: Callable[[], Awaitable[Any]]) -> Tuple[Any, Optional[datetime]]:
+        """(данные, None) из БД или (данные, момент снимка) из кэша
+
+        Если БД недоступна и снимка нет, DatabaseUnavailable пробрасывается.
+        """
+        try:
+            value = await loader()
+        except DatabaseUnavailable:
+            entry = cls._values.get(key)
+            if entry is None:
+                raise
+            return entry
+        cls._values[key] = (value, datetime.now())
+        cls._values.move_to_end(key)
+        while len(cls._values) > STALE_CACHE_SIZE:
+            cls._values.popitem(last=False)
+        return value, None
+
+
+class AvailableTasksIndex:
+    """Индекс открытых заданий в памяти процесса
+
+    Задания отсортированы по дате создания и разложены по типам, поэтому
+    список доступных заданий и фильтр по типу не требуют запросов к БД.
+    Индекс строится при старте, обновляется локальными операциями и
+    уведомлениями ChangeFeed от других процессов.
+    """
+
+    # Колонки, нужные для списков; описание и доказательства в индекс не попадают
+    COLUMNS = TaskListItem.columns()
+    OPEN_CONDITION = 'available = true AND active = true AND taken_by IS NULL'
+
+    _tasks: Dict[str, TaskListItem] = {}
+    # Ключи (created_date, task_id) по возрастанию; читаются с конца
+    _order: List[Tuple] = []
+    _by_type: Dict[str, List[Tuple]] = {}
+    _ready = False
+    _loading = False
+    _reload = False
+    # Задания, изменившиеся во время полной загрузки
+    _dirty: set = set()
+    # Последний запрошенный refresh по заданию: устаревшие ответы отбрасываются
+    _refresh_seq: Dict[str, int] = {}
+    _seq = 0
+    # Отложенная повторная загрузка после сбоя и пауза перед ней
+    _retry: Optional[asyncio.TimerHandle] = None
+    _retry_delay = 1.0
+
+    @classmethod
+    def is_ready(cls) -> bool:
+        """Можно ли отвечать из индекса"""
+        return cls._ready and ChangeFeed.is_live()
+
+    @classmethod
+    async def load(cls):
+        """Полная загрузка открытых заданий из БД"""
+        if cls._loading:
+            # Снимок текущей загрузки может быть старше сброса — перезагрузим после
+            cls._reload = True
+            return
+        cls._loading = True
+        cls._reload = False
+        cls._ready = False
+        cls._dirty = set()
+        try:
+            async with PostgresDB.connection() as conn:
+                rows = await conn.fetch(f'''
+                    SELECT {cls.COLUMNS} FROM tasks
+                    WHERE {cls.OPEN_CONDITION}
+                ''', timeout=DB_BACKGROUND_TIMEOUT)
+            cls._tasks = {}
+            cls._order = []
+            cls._by_type = {}
+            for task in sorted(TaskListItem.from_records(rows), key=cls._key):
+                cls._tasks[task.task_id] = task
+                key = cls._key(task)
+                cls._order.append(key)
+                cls._by_type.setdefault(task.type, []).append(key)
+            cls._ready = True
+            cls._retry_delay = 1.0
+            print(f"✅ Индекс доступных заданий загружен: {len(cls._tasks)}")
+        except Exception as e:
+            print(f"⚠️ Не удалось загрузить индекс заданий: {e}")
+            cls._schedule_load()
+        finally:
+            cls._loading = False
+        if cls._reload:
+            return await cls.load()
+        # Догоняем изменения, пришедшие во время загрузки
+        dirty, cls._dirty = cls._dirty, set()
+        for task_id in dirty:
+            await cls.refresh(task_id)
+
+    @classmethod
+    async def refresh(cls, task_id: str):
+        """Перечитать одно задание из БД и обновить его положение в индексе"""
+        if cls._loading:
+            cls._dirty.add(task_id)
+            return
+        cls._seq += 1
+        seq = cls._refresh_seq[task_id] = cls._seq
+        try:
+            async with PostgresDB.connection() as conn:
+                row = await conn.fetchrow(f'''
+                    SELECT {cls.COLUMNS} FROM tasks
+                    WHERE task_id = $1 AND {cls.OPEN_CONDITION}
+                ''', task_id)
+        except Exception as e:
+            print(f"⚠️ Не удалось обновить задание {task_id} в индексе: {e}")
+            # Строка могла устареть: до перезагрузки списки читаются из БД
+            cls._ready = False
+            cls._schedule_load()
+            return
+        if cls._refresh_seq.get(task_id) != seq:
+            return
+        del cls._refresh_seq[task_id]
+        if row:
+            cls.put(TaskListItem.from_record(row))
+        else:
+            cls.remove(task_id)
+
+    @classmethod
+    def _schedule_load(cls):
+        """Повторить полную загрузку после сбоя с нарастающей паузой"""
+        if cls._retry is not None:
+            return
+        loop = asyncio.get_running_loop()
+        delay = cls._retry_delay
+        cls._retry_delay = min(delay * 2, TASK_INDEX_RETRY_MAX)
+
+        def fire():
+            cls._retry = None
+            asyncio.create_task(cls.load())
+        cls._retry = loop.call_later(delay, fire)
+        print(f"🔁 Индекс заданий будет перезагружен через {delay:g} с")
+
+    @classmethod
+    def put(cls, task: TaskListItem):
+        """Добавление или замена открытого задания"""
+        cls.remove(task.task_id)
+        cls._tasks[task.task_id] = task
+        key = cls._key(task)
+        insort(cls._order, key)
+        insort(cls._by_type.setdefault(task.type, []), key)
+
+    @classmethod
+    def set_slots(cls, task_id: str, slots_left: int):
+        """Изменилось число свободных мест: обновить строку, заполненное — убрать"""
+        if slots_left <= 0:
+            cls.remove(task_id)
+        elif task_id in cls._tasks:
+            cls._tasks[task_id].slots_left = slots_left
+
+    @classmethod
+    def remove(cls, task_id: str):
+        """Удаление задания из индекса (места закончились, выполнено, удалено)"""
+        task = cls._tasks.pop(task_id, None)
+        if not task:
+            return
+        key = cls._key(task)
+        for keys in (cls._order, cls._by_type.get(task.type, [])):
+            pos = bisect_left(keys, key)
+            if pos < len(keys) and keys[pos] == key:
+                del keys[pos]
+
+    @classmethod
+    def list(cls, task_type: Optional[str] = None, limit: Optional[int] = None) -> List[TaskListItem]:
+        """Открытые задания, новые первыми"""
+        keys = cls._order if task_type is None else cls._by_type.get(task_type, [])
+        count = len(keys) if limit is None else min(limit, len(keys))
+        return [cls._tasks[keys[-i][1]] for i in range(1, count + 1)]
+
+    @classmethod
+    def count_by_type(cls) -> Dict[str, int]:
+        """Количество открытых заданий по типам"""
+        return {task_type: len(keys) for task_type, keys in cls._by_type.items() if keys}
+
+    @classmethod
+    def on_change(cls, op: str, key: Optional[str]):
+        """Обработчик ChangeFeed для таблицы tasks"""
+        if key is None:
+            cls._ready = False
+            return cls.load()
+        return cls.refresh(key)
+
+    @staticmethod
+    def _key(task: TaskListItem) -> Tuple:
+        return (task.created_date or datetime.min, task.task_id)
+
+
+class AdminDashboard:
+    """Снимок данных админ-панели в памяти процесса
+
+    Обновляется фоновой задачей раз в DASHBOARD_REFRESH_INTERVAL и по
+    изменениям заданий и ожидающих ссылок (с небольшой задержкой, чтобы
+    пачка изменений дала одно обновление). Открытие панели читает снимок
+    из памяти, сколько бы ни было ожидающих ссылок.
+    """
+
+    RECENT_TASKS = 5
+    # Менеджер заданий выбранного хранилища (назначается после объявления TaskManager)
+    source: Any = None
+
+    _snapshot: Optional[Dict] = None
+    _refreshing: Optional[asyncio.Task] = None
+    _nudged: Optional[asyncio.TimerHandle] = None
+    _dirty = False
+
+    @classmethod
+    async def get(cls) -> Dict:
+        """Текущий снимок (при первом обращении — загрузка)"""
+        if cls._snapshot is None:
+            await cls.refresh()
+        return cls._snapshot
+
+    @classmethod
+    async def refresh(cls):
+        """Обновление снимка; параллельные вызовы сливаются в одно обновление"""
+        if cls._refreshing and not cls._refreshing.done():
+            cls._dirty = True
+            await asyncio.shield(cls._refreshing)
+            return
+        cls._refreshing = asyncio.create_task(cls._load())
+        await asyncio.shield(cls._refreshing)
+
+    @classmethod
+    def nudge(cls, op: str = '*', key: Optional[str] = None):
+        """Запросить скорое обновление после записи"""
+        if cls._nudged is not None:
+            return
+        loop = asyncio.get_running_loop()
+
+        def fire():
+            cls._nudged = None
+            asyncio.create_task(cls.refresh())
+        cls._nudged = loop.call_later(DASHBOARD_NUDGE_DELAY, fire)
+
+    @classmethod
+    async def _load(cls):
+        """Загрузка счетчиков и последних заданий из выбранного хранилища"""
+        while True:
+            cls._dirty = False
+            snapshot = await cls.source.get_dashboard_counters()
+            snapshot['recent_tasks'] = await cls.source.get_recent_tasks(cls.RECENT_TASKS)
+            snapshot['refreshed_at'] = datetime.now()
+            cls._snapshot = snapshot
+            # Изменения во время загрузки — перечитываем сразу
+            if not cls._dirty:
+                return
+
+
+class LeaderBoard:
+    """Таблица лидеров одного периода
+
+    Ключи (-заработок, user_id) хранятся отсортированными: начисление — это
+    удаление старого ключа и вставка нового двоичным поиском, место
+    пользователя и топ читаются без сортировки.
+    """
+
+    __slots__ = ('period', 'scores', 'order')
+
+    def __init__(self, period=None):
+        self.period = period
+        self.scores: Dict[int, float] = {}
+        self.order: List[Tuple[float, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def load(self, period, scores: Dict[int, float]):
+        """Заполнение при перестроении (единственная сортировка)"""
+        self.period = period
+        self.scores = {user_id: score for user_id, score in scores.items() if score}
+        self.order = sorted((-score, user_id) for user_id, score in self.scores.items())
+
+    def add(self, user_id: int, amount: float):
+        """Начисление пользователю"""
+        old = self.scores.get(user_id)
+        if old is not None:
+            pos = bisect_left(self.order, (-old, user_id))
+            del self.order[pos]
+        score = (old or 0) + amount
+        self.scores[user_id] = score
+        insort(self.order, (-score, user_id))
+
+    def top(self, limit: int) -> List[Tuple[int, float]]:
+        """Первые limit мест: (user_id, заработок)"""
+        return [(user_id, -score) for score, user_id in self.order[:limit]]
+
+    def rank(self, user_id: int) -> Optional[Tuple[int, float]]:
+        """Место пользователя (с 1) и его заработок; None — нет в таблице"""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return bisect_left(self.order, (-score, user_id)) + 1, score
+
+
+class Leaderboards:
+    """Таблицы лидеров за день, неделю и все время в памяти процесса
+
+    При старте строятся одним агрегирующим запросом по выполненным заданиям,
+    дальше обновляются выполнением заданий в этом процессе и уведомлениями
+    ChangeFeed о выполнениях на других репликах. День и неделя сбрасываются
+    при смене периода.
+    """
+
+    PERIODS = ('day', 'week', 'all')
+    # Менеджер заданий выбранного хранилища (назначается после объявления TaskManager)
+    source: Any = None
+
+    _boards: Dict[str, LeaderBoard] = {period: LeaderBoard() for period in PERIODS}
+    # Недавно учтенные выполнения (задание, исполнитель): уведомление о своем же
+    # выполнении не учитывается повторно
+    _applied: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+    _loading = False
+    _pending: List[str] = []
+
+    @staticmethod
+    def period_key(period: str, at: datetime):
+        """Ключ периода, к которому относится момент at"""
+        if period == 'day':
+            return at.date()
+        if period == 'week':
+            return (at - timedelta(days=at.weekday())).date()
+        return None
+
+    @classmethod
+    def board(cls, period: str) -> LeaderBoard:
+        """Таблица текущего периода (прошедший период сбрасывается)"""
+        board = cls._boards[period]
+        key = cls.period_key(period, datetime.now())
+        if board.period != key:
+            board.load(key, {})
+        return board
+
+    @classmethod
+    def apply(cls, task_id: str, user_id: int, amount: float, at: datetime):
+        """Учет выполненного задания во всех таблицах"""
+        now = time.monotonic()
+        while cls._applied and next(iter(cls._applied.values())) < now - LEADERBOARD_APPLIED_WINDOW:
+            cls._applied.popitem(last=False)
+        key = (task_id, user_id)
+        if key in cls._applied:
+            return
+        cls._applied[key] = now
+        for period in cls.PERIODS:
+            board = cls.board(period)
+            # Выполнение прошлого дня/недели, пришедшее после смены периода
+            if board.period == cls.period_key(period, at):
+                board.add(user_id, amount)
+
+    @classmethod
+    async def load(cls):
+        """Перестроение всех таблиц из выполненных заданий"""
+        if cls._loading:
+            return
+        cls._loading = True
+        cls._pending = []
+        try:
+            now = datetime.now()
+            day_start = datetime.combine(now.date(), datetime.min.time())
+            week_start = day_start - timedelta(days=now.weekday())
+            rows, recent = await cls.source.get_leaderboard_snapshot(
+                week_start, day_start, now - timedelta(seconds=LEADERBOARD_APPLIED_WINDOW)
+            )
+            for period, column in (('day', 'day'), ('week', 'week'), ('all', 'total')):
+                cls._boards[period].load(
+                    cls.period_key(period, now),
+                    {row['user_id']: row[column] or 0 for row in rows}
+                )
+            applied_at = time.monotonic()
+            cls._applied = OrderedDict(
+                ((row['task_id'], row['user_id']), applied_at) for row in recent
+            )
+            print(f"✅ Таблицы лидеров построены: {len(cls._boards['all'])} исполнителей")
+        except Exception as e:
+            print(f"⚠️ Не удалось построить таблицы лидеров: {e}")
+        finally:
+            cls._loading = False
+        # Выполнения, пришедшие во время перестроения
+        pending, cls._pending = cls._pending, []
+        for task_id in pending:
+            await cls._check(task_id)
+
+    @classmethod
+    def on_change(cls, op: str, key: Optional[str]):
+        """Обработчик ChangeFeed для выполнений взятий (событие completions)"""
+        if key is None:
+            return cls.load()
+        if op == 'D':
+            return None
+        if cls._loading:
+            cls._pending.append(key)
+            return None
+        return cls._check(key)
+
+    @classmethod
+    async def _check(cls, task_id: str):
+        """Учет выполнений задания, сделанных на других репликах"""
+        try:
+            async with PostgresDB.connection() as conn:
+                # Более старые выполнения уже вошли в таблицы при построении
+                rows = await conn.fetch('''
+                    SELECT ut.user_id, ut.completed_date, t.reward
+                    FROM user_tasks ut
+                    JOIN tasks t ON t.task_id = ut.task_id
+                    WHERE ut.task_id = $1 AND ut.status = 'completed' AND ut.completed_date >= $2
+                ''', task_id, datetime.now() - timedelta(seconds=LEADERBOARD_APPLIED_WINDOW))
+        except Exception as e:
+            print(f"⚠️ Не удалось проверить задание {task_id} для таблицы лидеров: {e}")
+            return
+        for row in rows:
+            cls.apply(task_id, row['user_id'], row['reward'] or 0, row['completed_date'])
+
 
 class UserManager:
     @staticmethod
-    async def get_or_create_user(user_id: int, username: str = "", first_name: str = ""):
+    async def get_or_create_user(user_id: int, username: str = "", first_name: str = "", conn: Optional[asyncpg.Connection] = None):
         """Получение или создание пользователя"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
+        async with PostgresDB.connection(conn) as conn:
             user = await conn.fetchrow(
                 'SELECT * FROM users WHERE user_id = $1',
                 user_id
@@ -167,34 +1619,30 @@ class UserManager:
                     VALUES ($1, $2, $3, $4, 0, 0)
                 ''', user_id, username, first_name, datetime.now())
                 return None
+            if user['blocked']:
+                # Пользователь снова написал боту — значит, разблокировал его
+                await conn.execute(
+                    'UPDATE users SET blocked = false WHERE user_id = $1',
+                    user_id
+                )
             return dict(user) if user else None
 
     @staticmethod
-    async def get_user_stats(user_id: int) -> Dict:
+    async def get_user_stats(user_id: int, conn: Optional[asyncpg.Connection] = None) -> Dict:
         """Получение статистики пользователя"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
-            completed = await conn.fetch('''
-                SELECT t.task_id, t.reward 
-                FROM user_tasks ut
-                JOIN tasks t ON ut.task_id = t.task_id
-                WHERE ut.user_id = $1 AND ut.status = 'completed'
+        async with PostgresDB.connection(conn) as conn:
+            row = await conn.fetchrow('''
+                SELECT
+                    (SELECT COUNT(*) FROM user_tasks
+                     WHERE user_id = $1 AND status = 'completed') AS completed_count,
+                    (SELECT COUNT(*) FROM user_tasks
+                     WHERE user_id = $1 AND status = 'active') AS active_count,
+                    (SELECT earned FROM users WHERE user_id = $1) AS earned
             ''', user_id)
 
-            active = await conn.fetch('''
-                SELECT task_id 
-                FROM user_tasks 
-                WHERE user_id = $1 AND status = 'active'
-            ''', user_id)
-
-            user = await conn.fetchrow(
-                'SELECT earned FROM users WHERE user_id = $1',
-                user_id
-            )
-
-            completed_count = len(completed)
-            active_count = len(active)
-            total_earned = user['earned'] if user else 0
+            completed_count = row['completed_count']
+            active_count = row['active_count']
+            total_earned = row['earned'] or 0
 
             return {
                 "completed_count": completed_count,
@@ -204,10 +1652,9 @@ class UserManager:
             }
 
     @staticmethod
-    async def add_earned(user_id: int, amount: float):
+    async def add_earned(user_id: int, amount: float, conn: Optional[asyncpg.Connection] = None):
         """Добавление заработка пользователю"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
+        async with PostgresDB.connection(conn) as conn:
             await conn.execute('''
                 UPDATE users 
                 SET earned = earned + $1 
@@ -216,6 +1663,30 @@ class UserManager:
 
 
 class TaskManager:
+    # Шаблон отслеживающей ссылки; настройка из админ-панели подменяет его без перезапуска
+    tracking_link_template = TRACKING_LINK_TEMPLATE
+    # Кэш заданий по ID; согласуется между процессами через ChangeFeed
+    _cache: "OrderedDict[str, Dict]" = OrderedDict()
+    # Растет при каждой инвалидации: строка, прочитанная до нее, в кэш не попадет
+    _generation = 0
+
+    @classmethod
+    def _forget(cls, task_id: Optional[str] = None):
+        """Инвалидация кэша заданий (task_id=None — весь кэш)"""
+        cls._generation += 1
+        if task_id is None:
+            cls._cache.clear()
+        else:
+            cls._cache.pop(task_id, None)
+
+    @classmethod
+    def _slots_changed(cls, task: TaskDetail):
+        """Задание взято или выполнено: сбросить кэш и обновить его в списке доступных"""
+        cls._forget(task.task_id)
+        AvailableTasksIndex.set_slots(
+            task.task_id, task.slots_left if task.available and task.active else 0
+        )
+
     @staticmethod
     async def create_task(
         title: str,
@@ -224,132 +1695,640 @@ class TaskManager:
         target: str,
         reward: float,
         created_by: int,
-        requirements: str = ""
+        requirements: str = "",
+        publish_at: Optional[datetime] = None,
+        expires_at: Optional[datetime] = None,
+        claim_timeout: Optional[int] = None,
+        capacity: int = 1,
+        conn: Optional[asyncpg.Connection] = None
     ) -> str:
-        """Создание нового задания"""
-        task_id = hashlib.md5(f"{title}_{datetime.now()}".encode()).hexdigest()[:8]
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
-            await conn.execute('''
-                INSERT INTO tasks (
-                    task_id, title, description, type, target, reward,
-                    requirements, created_by, created_date, active, available
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, true, true)
-            ''', task_id, title, description, task_type, target, reward,
-                requirements, created_by, datetime.now())
-        return task_id
-
-    @staticmethod
-    async def get_available_tasks() -> List[Dict]:
-        """Получение списка доступных заданий"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
-            rows = await conn.fetch('''
-                SELECT * FROM tasks 
-                WHERE available = true AND active = true AND taken_by IS NULL
+        """Создание нового задания
+
+        publish_at — отложенная публикация, expires_at — окончание приема,
+        claim_timeout — минуты на выполнение (None — CLAIM_TIMEOUT_HOURS),
+        capacity — сколько исполнителей могут выполнить задание.
+        """
+        created_date = datetime.now()
+        available = publish_at is None or publish_at <= created_date
+        async with PostgresDB.connection(conn) as conn:
+            # Коллизия практически невозможна, но первичный ключ — последняя
+            # гарантия: при конфликте просто берем следующий ID
+            for _ in range(ID_INSERT_ATTEMPTS):
+                task_id = generate_id()
+                result = await conn.execute('''
+                    INSERT INTO tasks (
+                        task_id, title, description, type, target, reward,
+                        requirements, created_by, created_date, active, available,
+                        publish_at, expires_at, claim_timeout, capacity, slots_left, slots_done
+                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, true, $10, $11, $12, $13, $14, $14, 0)
+                    ON CONFLICT (task_id) DO NOTHING
+                ''', task_id, title, description, task_type, target, reward,
+                    requirements, created_by, created_date, available,
+                    publish_at, expires_at, claim_timeout, capacity)
+                if result == 'INSERT 0 1':
+                    if not available:
+                        # Отложенное задание появится в списках после публикации
+                        return task_id
+                    AvailableTasksIndex.put(TaskListItem(
+                        task_id=task_id, title=title, type=task_type, reward=reward,
+                        created_date=created_date, capacity=capacity, slots_left=capacity
+                    ))
+                    return task_id
+        raise RuntimeError("Не удалось сгенерировать уникальный ID задания")
+
+    @staticmethod
+    async def get_available_tasks(task_type: Optional[str] = None, limit: Optional[int] = None, conn: Optional[asyncpg.Connection] = None) -> List[TaskListItem]:
+        """Получение списка доступных заданий (из индекса, если он готов)"""
+        if AvailableTasksIndex.is_ready():
+            return AvailableTasksIndex.list(task_type, limit)
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch(f'''
+                SELECT {AvailableTasksIndex.COLUMNS} FROM tasks 
+                WHERE {AvailableTasksIndex.OPEN_CONDITION}
+                    AND ($1::text IS NULL OR type = $1)
                 ORDER BY created_date DESC
-            ''')
-            return [dict(row) for row in rows]
+                LIMIT $2
+            ''', task_type, limit)
+            return TaskListItem.from_records(rows)
 
     @staticmethod
-    async def get_task(task_id: str) -> Optional[Dict]:
+    async def search_tasks(text: Optional[str] = None, task_type: Optional[str] = None,
+                           min_reward: Optional[float] = None, max_reward: Optional[float] = None,
+                           limit: int = 10, offset: int = 0,
+                           conn: Optional[asyncpg.Connection] = None) -> Tuple[List[TaskListItem], bool]:
+        """Поиск открытых заданий по тексту, типу и диапазону вознаграждения
+
+        С текстом результаты упорядочены по релевантности, без него — новые
+        первыми. Возвращает страницу и признак, что есть следующая.
+        """
+        # Условия собираются только из заданных фильтров, чтобы план запроса
+        # всегда мог опереться на частичные индексы
+        conditions = [AvailableTasksIndex.OPEN_CONDITION]
+        args: List = []
+        order = 'created_date DESC, task_id DESC'
+        if text:
+            args.append(text)
+            conditions.append(f"search_vector @@ websearch_to_tsquery('russian', ${len(args)})")
+            order = f"ts_rank_cd(search_vector, websearch_to_tsquery('russian', ${len(args)})) DESC, " + order
+        if task_type:
+            args.append(task_type)
+            conditions.append(f"type = ${len(args)}")
+        if min_reward is not None:
+            args.append(min_reward)
+            conditions.append(f"reward >= ${len(args)}")
+        if max_reward is not None:
+            args.append(max_reward)
+            conditions.append(f"reward <= ${len(args)}")
+        args.extend([limit + 1, offset])
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch(f'''
+                SELECT {TaskListItem.columns()} FROM tasks
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {order}
+                LIMIT ${len(args) - 1} OFFSET ${len(args)}
+            ''', *args)
+        return TaskListItem.from_records(rows[:limit]), len(rows) > limit
+
+    @staticmethod
+    async def count_available_by_type(conn: Optional[asyncpg.Connection] = None) -> Dict[str, int]:
+        """Количество доступных заданий по типам"""
+        if AvailableTasksIndex.is_ready():
+            return AvailableTasksIndex.count_by_type()
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch(f'''
+                SELECT type, COUNT(*) AS count FROM tasks
+                WHERE {AvailableTasksIndex.OPEN_CONDITION}
+                GROUP BY type
+            ''')
+            return {row['type']: row['count'] for row in rows}
+
+    @classmethod
+    async def get_task(cls, task_id: str, conn: Optional[asyncpg.Connection] = None) -> Optional[TaskDetail]:
         """Получение задания по ID"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
+        if task_id in cls._cache:
+            cls._cache.move_to_end(task_id)
+            return cls._cache[task_id]
+        generation = cls._generation
+        async with PostgresDB.connection(conn) as conn:
             row = await conn.fetchrow(
-                'SELECT * FROM tasks WHERE task_id = $1',
+                f'SELECT {TaskDetail.columns()} FROM tasks WHERE task_id = $1',
                 task_id
             )
-            return dict(row) if row else None
+        task = TaskDetail.from_record(row)
+        # Без живой ленты изменений кэшу нельзя доверять — не заполняем его
+        if task and ChangeFeed.is_live() and generation == cls._generation:
+            cls._cache[task_id] = task
+            if len(cls._cache) > TASK_CACHE_SIZE:
+                cls._cache.popitem(last=False)
+        return task
 
     @staticmethod
-    async def assign_task(task_id: str, user_id: int) -> bool:
-        """Назначение задания пользователю"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
-            task = await conn.fetchrow(
-                'SELECT * FROM tasks WHERE task_id = $1 AND available = true AND taken_by IS NULL',
-                task_id
-            )
-            if not task:
+    async def assign_task(task_id: str, user_id: int, conn: Optional[asyncpg.Connection] = None) -> bool:
+        """Назначение задания пользователю (место и запись в user_tasks, без ссылок)"""
+        async with PostgresDB.connection(conn) as conn:
+            now = datetime.now()
+            row = await conn.fetchrow(f'''
+                WITH slot AS (
+                    UPDATE tasks
+                    SET slots_left = slots_left - 1, available = slots_left > 1
+                    WHERE task_id = $1
+                        AND {AvailableTasksIndex.OPEN_CONDITION} AND slots_left > 0
+                        AND NOT EXISTS (
+                            SELECT 1 FROM user_tasks
+                            WHERE user_id = $2 AND task_id = $1 AND status <> 'expired'
+                        )
+                    RETURNING {TaskDetail.columns()}
+                ), claim AS (
+                    INSERT INTO user_tasks (user_id, task_id, status, taken_date, deadline)
+                    SELECT $2, task_id, 'active', $3,
+                        $3 + make_interval(mins => coalesce(claim_timeout, $4))
+                    FROM slot
+                    ON CONFLICT (user_id, task_id) DO UPDATE SET
+                        status = 'active',
+                        taken_date = EXCLUDED.taken_date,
+                        completed_date = NULL,
+                        deadline = EXCLUDED.deadline,
+                        proof = NULL
+                )
+                SELECT * FROM slot
+            ''', task_id, user_id, now, CLAIM_TIMEOUT_MINUTES)
+            if not row:
                 return False
-            await conn.execute('''
-                UPDATE tasks 
-                SET taken_by = $1, available = false, assigned_date = $2
-                WHERE task_id = $3
-            ''', user_id, datetime.now(), task_id)
-            await conn.execute('''
-                INSERT INTO user_tasks (user_id, task_id, status, taken_date)
-                VALUES ($1, $2, 'active', $3)
-                ON CONFLICT (user_id, task_id) DO UPDATE SET
-                    status = 'active',
-                    taken_date = $3,
-                    completed_date = NULL
-            ''', user_id, task_id, datetime.now())
+            task = TaskDetail.from_record(row)
+            TaskManager._slots_changed(task)
             return True
 
     @staticmethod
-    async def set_work_link(task_id: str, link: str) -> bool:
+    async def set_work_link(task_id: str, link: str, conn: Optional[asyncpg.Connection] = None) -> bool:
         """Установка рабочей ссылки"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
+        async with PostgresDB.connection(conn) as conn:
             result = await conn.execute('''
                 UPDATE tasks SET work_link = $1 WHERE task_id = $2
             ''', link, task_id)
+            TaskManager._forget(task_id)
             return 'UPDATE 1' in result
 
     @staticmethod
-    async def complete_task(task_id: str, user_id: int, proof: str = "") -> bool:
-        """Завершение задания"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
-            task = await conn.fetchrow(
-                'SELECT * FROM tasks WHERE task_id = $1 AND taken_by = $2',
-                task_id, user_id
+    async def take_task(task_id: str, user_id: int, username: str,
+                        conn: Optional[asyncpg.Connection] = None) -> Optional[TakenTask]:
+        """Взятие задания одним запросом: место, ссылка и ожидающая выдача
+
+        Возвращает задание с отслеживающей ссылкой и сроком сдачи или None,
+        если свободных мест нет или пользователь уже взял это задание.
+        """
+        async with PostgresDB.connection(conn) as conn:
+            now = datetime.now()
+            for _ in range(ID_INSERT_ATTEMPTS):
+                link_id = generate_id()
+                tracking_link = TaskManager.tracking_url(link_id)
+                try:
+                    # В уже открытой транзакции это savepoint: коллизия не ломает внешнюю транзакцию
+                    async with conn.transaction():
+                        row = await conn.fetchrow(
+                            f'SELECT {TakenTask.columns()} FROM take_task($1, $2, $3, $4, $5, $6, $7)',
+                            task_id, user_id, username, link_id, tracking_link, now,
+                            CLAIM_TIMEOUT_MINUTES
+                        )
+                except asyncpg.UniqueViolationError:
+                    # Коллизия link_id — вызов откатился целиком, пробуем другой ID
+                    continue
+                if not row:
+                    return None
+                task = TakenTask.from_record(row)
+                task.tracking_link = tracking_link
+                # Тот же расчет, что и у user_tasks.deadline в take_task
+                timeout = task.claim_timeout if task.claim_timeout is not None else CLAIM_TIMEOUT_MINUTES
+                task.claim_deadline = now + timedelta(minutes=timeout)
+                TaskManager._slots_changed(task)
+                MetricsManager.record('take', task=task_id, user=user_id, link=link_id)
+                return task
+        raise RuntimeError("Не удалось сгенерировать уникальный ID ссылки")
+
+    @staticmethod
+    async def complete_task(task_id: str, user_id: int, proof: str = "",
+                            conn: Optional[asyncpg.Connection] = None) -> Optional[TaskDetail]:
+        """Завершение задания одним запросом; возвращает задание или None"""
+        async with PostgresDB.connection(conn) as conn:
+            completed_at = datetime.now()
+            row = await conn.fetchrow(
+                f'SELECT {TaskDetail.columns()} FROM complete_task($1, $2, $3, $4)',
+                task_id, user_id, proof, completed_at
             )
-            if not task:
-                return False
-            await conn.execute('''
-                UPDATE tasks 
-                SET completed = true, completed_date = $1, proof = $2, active = false
-                WHERE task_id = $3
-            ''', datetime.now(), proof, task_id)
-            await conn.execute('''
-                UPDATE user_tasks 
-                SET status = 'completed', completed_date = $1
-                WHERE user_id = $2 AND task_id = $3
-            ''', datetime.now(), user_id, task_id)
-            await UserManager.add_earned(user_id, task['reward'])
-            return True
+            if not row:
+                return None
+            task = TaskDetail.from_record(row)
+            TaskManager._slots_changed(task)
+            Leaderboards.apply(task_id, user_id, task.reward or 0, completed_at)
+            MetricsManager.record('completion', amount=task.reward or 0, task=task_id, user=user_id)
+            return task
+
+    @staticmethod
+    async def issue_work_link(task_id: str, link: str, user_id: Optional[int] = None,
+                              conn: Optional[asyncpg.Connection] = None) -> Optional[Dict]:
+        """Выдача рабочей ссылки одним запросом: сохранение и снятие из ожидающих
+
+        user_id=None — самому раннему ожидающему исполнителю задания (кнопки
+        сообщений, отправленных до появления мест). Возвращает запись ожидающей
+        ссылки с названием задания или None.
+        """
+        async with PostgresDB.connection(conn) as conn:
+            row = await conn.fetchrow('''
+                WITH pending AS (
+                    DELETE FROM pending_links
+                    WHERE (task_id, user_id) = (
+                        SELECT task_id, user_id FROM pending_links
+                        WHERE task_id = $1 AND ($3::bigint IS NULL OR user_id = $3)
+                        ORDER BY message_sent
+                        LIMIT 1
+                    )
+                    RETURNING *
+                ), link AS (
+                    UPDATE tracking_links l SET work_link = $2
+                    FROM pending
+                    WHERE l.task_id = pending.task_id AND l.user_id = pending.user_id AND l.active
+                )
+                SELECT pending.*, t.title
+                FROM pending JOIN tasks t USING (task_id)
+            ''', task_id, link, user_id)
+            return dict(row) if row else None
 
     @staticmethod
-    async def generate_tracking_link(user_id: int, task_id: str) -> str:
+    async def generate_tracking_link(user_id: int, task_id: str, conn: Optional[asyncpg.Connection] = None) -> str:
         """Генерация отслеживающей ссылки"""
-        token = secrets.token_urlsafe(16)
-        link_id = hashlib.md5(f"{user_id}_{task_id}_{token}".encode()).hexdigest()[:8]
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
+        async with PostgresDB.connection(conn) as conn:
+            for _ in range(ID_INSERT_ATTEMPTS):
+                link_id = generate_id()
+                result = await conn.execute('''
+                    INSERT INTO tracking_links (link_id, user_id, task_id, created, clicks, conversions, active)
+                    VALUES ($1, $2, $3, $4, 0, 0, true)
+                    ON CONFLICT (link_id) DO NOTHING
+                ''', link_id, user_id, task_id, datetime.now())
+                if result == 'INSERT 0 1':
+                    break
+            else:
+                raise RuntimeError("Не удалось сгенерировать уникальный ID ссылки")
+        return TaskManager.tracking_url(link_id)
+
+    @staticmethod
+    async def issue_work_links(links: Dict[Tuple[str, Optional[int]], str],
+                               conn: Optional[asyncpg.Connection] = None) -> List[Dict]:
+        """Массовая выдача рабочих ссылок одним запросом в одной транзакции
+
+        links: (task_id, user_id) -> ссылка; user_id=None — всем ожидающим
+        исполнителям задания, строка с конкретным исполнителем важнее.
+        Возвращает снятые ожидающие записи с названием задания (title) и
+        выданной ссылкой (link).
+        """
+        if not links:
+            return []
+        keys = list(links)
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch('''
+                WITH input AS (
+                    SELECT * FROM unnest($1::text[], $2::bigint[], $3::text[])
+                        AS i(task_id, user_id, link)
+                ), matched AS (
+                    SELECT DISTINCT ON (p.task_id, p.user_id) p.task_id, p.user_id, i.link
+                    FROM pending_links p
+                    JOIN input i ON i.task_id = p.task_id
+                        AND (i.user_id IS NULL OR i.user_id = p.user_id)
+                    ORDER BY p.task_id, p.user_id, i.user_id NULLS LAST
+                ), pending AS (
+                    DELETE FROM pending_links p
+                    USING matched m
+                    WHERE p.task_id = m.task_id AND p.user_id = m.user_id
+                    RETURNING p.*
+                ), issued AS (
+                    -- Ссылка пишется только тем, чья ожидающая запись действительно снята
+                    UPDATE tracking_links l SET work_link = m.link
+                    FROM pending p
+                    JOIN matched m USING (task_id, user_id)
+                    WHERE l.task_id = p.task_id AND l.user_id = p.user_id AND l.active
+                )
+                SELECT pending.*, t.title, m.link
+                FROM pending
+                JOIN matched m USING (task_id, user_id)
+                JOIN tasks t USING (task_id)
+            ''', [task_id for task_id, _ in keys], [user_id for _, user_id in keys],
+                [links[key] for key in keys])
+            return [dict(row) for row in rows]
+
+    @staticmethod
+    async def next_deadlines(until: datetime, limit: int,
+                             conn: Optional[asyncpg.Connection] = None) -> List[Tuple[str, datetime]]:
+        """Ближайшие сроки заданий и взятий до момента until (по частичным индексам)"""
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch('''
+                (
+                    SELECT task_id, deadline FROM tasks
+                    WHERE deadline IS NOT NULL AND deadline <= $1
+                    ORDER BY deadline
+                    LIMIT $2
+                ) UNION ALL (
+                    SELECT task_id, deadline FROM user_tasks
+                    WHERE status = 'active' AND deadline <= $1
+                    ORDER BY deadline
+                    LIMIT $2
+                )
+                ORDER BY deadline
+                LIMIT $2
+            ''', until, limit)
+            return [(row['task_id'], row['deadline']) for row in rows]
+
+    @staticmethod
+    async def sweep_deadlines(now: datetime, limit: int,
+                              conn: Optional[asyncpg.Connection] = None) -> List[DueTask]:
+        """Обработка наступивших сроков: до limit заданий и до limit взятий
+
+        publish — задание публикуется; expire — снимается с приема; claim —
+        место исполнителя возвращается в задание, его ожидающая выдача и
+        ссылка снимаются. Строки, которые уже обрабатывает другой процесс,
+        пропускаются (SKIP LOCKED), поэтому чистку можно запускать на всех
+        репликах. Возвращает обработанные сроки.
+        """
+        async with PostgresDB.connection(conn) as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(f'''
+                    WITH due AS (
+                        SELECT {DueTask.columns()} FROM tasks
+                        WHERE deadline IS NOT NULL AND deadline <= $1
+                        ORDER BY deadline
+                        LIMIT $2
+                        FOR UPDATE SKIP LOCKED
+                    ), published AS (
+                        UPDATE tasks t SET available = true
+                        FROM due
+                        WHERE t.task_id = due.task_id AND due.deadline_kind = 'publish'
+                    ), expired AS (
+                        UPDATE tasks t SET active = false, available = false
+                        FROM due
+                        WHERE t.task_id = due.task_id AND due.deadline_kind = 'expire'
+                    )
+                    SELECT * FROM due
+                ''', now, limit)
+                # Просроченные взятия; задание освобождается от прежнего единственного
+                # исполнителя (taken_by), если оно было взято до появления мест
+                rows += await conn.fetch('''
+                    WITH due AS (
+                        SELECT user_id, task_id FROM user_tasks
+                        WHERE status = 'active' AND deadline <= $1
+                        ORDER BY deadline
+                        LIMIT $2
+                        FOR UPDATE SKIP LOCKED
+                    ), released AS (
+                        UPDATE user_tasks ut SET status = 'expired'
+                        FROM due
+                        WHERE ut.user_id = due.user_id AND ut.task_id = due.task_id
+                        RETURNING ut.user_id, ut.task_id
+                    ), freed AS (
+                        UPDATE tasks t
+                        SET slots_left = t.slots_left + c.released,
+                            available = t.active,
+                            taken_by = NULL, assigned_date = NULL
+                        FROM (
+                            SELECT task_id, COUNT(*) AS released FROM released GROUP BY task_id
+                        ) c
+                        WHERE t.task_id = c.task_id
+                        RETURNING t.task_id, t.title
+                    ), released_pending AS (
+                        DELETE FROM pending_links p
+                        USING released r
+                        WHERE p.task_id = r.task_id AND p.user_id = r.user_id
+                    ), released_links AS (
+                        UPDATE tracking_links l SET active = false
+                        FROM released r
+                        WHERE l.task_id = r.task_id AND l.user_id = r.user_id
+                    )
+                    SELECT r.task_id, 'claim' AS deadline_kind, r.user_id AS taken_by, f.title
+                    FROM released r JOIN freed f USING (task_id)
+                ''', now, limit)
+            tasks = DueTask.from_records(rows)
+
+            for task_id in {task.task_id for task in tasks}:
+                TaskManager._forget(task_id)
+                asyncio.create_task(AvailableTasksIndex.refresh(task_id))
+            return tasks
+
+    @staticmethod
+    async def get_user_tasks(user_id: int, status: str, limit: Optional[int] = None,
+                             conn: Optional[asyncpg.Connection] = None) -> List[UserTaskRow]:
+        """Взятия пользователя с заданным статусом (выполненные — последние первыми)"""
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch('''
+                SELECT t.task_id, t.title, t.reward, ut.deadline FROM tasks t
+                JOIN user_tasks ut ON t.task_id = ut.task_id
+                WHERE ut.user_id = $1 AND ut.status = $2
+                ORDER BY ut.completed_date DESC NULLS LAST, ut.taken_date
+                LIMIT $3
+            ''', user_id, status, limit)
+            return UserTaskRow.from_records(rows)
+
+    @staticmethod
+    async def get_recent_tasks(limit: int, conn: Optional[asyncpg.Connection] = None) -> List[TaskAdminRow]:
+        """Последние созданные задания для админских списков"""
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch(f'''
+                SELECT {TaskAdminRow.columns()} FROM tasks
+                ORDER BY created_date DESC
+                LIMIT $1
+            ''', limit)
+            return TaskAdminRow.from_records(rows)
+
+    @staticmethod
+    async def get_dashboard_counters(conn: Optional[asyncpg.Connection] = None) -> Dict:
+        """Счетчики админ-панели одним запросом"""
+        async with PostgresDB.connection(conn) as conn:
+            row = await conn.fetchrow('''
+                SELECT
+                    (SELECT COUNT(*) FROM pending_links) AS pending_count,
+                    (SELECT COUNT(*) FROM users) AS total_users,
+                    COUNT(*) AS total_tasks,
+                    COUNT(*) FILTER (WHERE active) AS active_tasks,
+                    COUNT(*) FILTER (
+                        WHERE active AND slots_left + slots_done < capacity
+                    ) AS in_progress_tasks,
+                    COUNT(*) FILTER (WHERE completed) AS completed_tasks,
+                    COALESCE(SUM(reward * slots_done), 0) AS total_payout
+                FROM tasks
+            ''')
+            return dict(row)
+
+    @staticmethod
+    async def get_completion_totals(start: datetime, end: datetime,
+                                    conn: Optional[asyncpg.Connection] = None) -> Dict:
+        """Выполненные взятия и выплаты за период, число активных пользователей"""
+        async with PostgresDB.connection(conn) as conn:
+            row = await conn.fetchrow('''
+                SELECT
+                    COUNT(*) AS count,
+                    COALESCE(SUM(t.reward), 0) AS earnings,
+                    (SELECT COUNT(DISTINCT user_id) FROM user_tasks) AS active_users
+                FROM user_tasks ut
+                JOIN tasks t ON t.task_id = ut.task_id
+                WHERE ut.status = 'completed' AND ut.completed_date BETWEEN $1 AND $2
+            ''', start, end)
+            return dict(row)
+
+    @staticmethod
+    async def get_top_earners(start: datetime, end: datetime, limit: int,
+                              conn: Optional[asyncpg.Connection] = None) -> List[Tuple[int, float]]:
+        """Лучшие исполнители за период: (user_id, заработок), порядок как у LeaderBoard.top"""
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch('''
+                SELECT ut.user_id, SUM(t.reward) AS earned
+                FROM user_tasks ut
+                JOIN tasks t ON t.task_id = ut.task_id
+                WHERE ut.status = 'completed' AND ut.completed_date BETWEEN $1 AND $2
+                GROUP BY ut.user_id
+                ORDER BY earned DESC, ut.user_id
+                LIMIT $3
+            ''', start, end, limit)
+            return [(row['user_id'], row['earned']) for row in rows]
+
+    @staticmethod
+    async def get_leaderboard_snapshot(week_start: datetime, day_start: datetime, recent_since: datetime,
+                                       conn: Optional[asyncpg.Connection] = None) -> Tuple[List, List]:
+        """Суммы заработка по исполнителям (total/week/day) и недавние выполнения
+
+        Оба запроса читают один снимок, чтобы список недавних выполнений
+        совпадал с тем, что уже вошло в суммы.
+        """
+        async with PostgresDB.connection(conn) as conn:
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                rows = await conn.fetch('''
+                    SELECT ut.user_id,
+                        SUM(t.reward) AS total,
+                        SUM(t.reward) FILTER (WHERE ut.completed_date >= $1) AS week,
+                        SUM(t.reward) FILTER (WHERE ut.completed_date >= $2) AS day
+                    FROM user_tasks ut
+                    JOIN tasks t ON t.task_id = ut.task_id
+                    WHERE ut.status = 'completed'
+                    GROUP BY ut.user_id
+                ''', week_start, day_start, timeout=DB_BACKGROUND_TIMEOUT)
+                recent = await conn.fetch('''
+                    SELECT task_id, user_id FROM user_tasks
+                    WHERE status = 'completed' AND completed_date >= $1
+                ''', recent_since)
+            return rows, recent
+
+    @staticmethod
+    def tracking_url(link_id: str) -> str:
+        """Отслеживающая ссылка на бота по ID"""
+        return TaskManager.tracking_link_template.format(link_id=link_id)
+
+
+class BroadcastManager:
+    @staticmethod
+    async def create(text: str, task_id: Optional[str], created_by: int,
+                     report_chat_id: int, report_message_id: int,
+                     conn: Optional[asyncpg.Connection] = None) -> Dict:
+        """Создание рассылки; total — число получателей на момент запуска"""
+        broadcast_id = generate_id()
+        async with PostgresDB.connection(conn) as conn:
+            row = await conn.fetchrow('''
+                INSERT INTO broadcasts (
+                    broadcast_id, task_id, text, created_by, created, status,
+                    total, report_chat_id, report_message_id
+                ) VALUES (
+                    $1, $2, $3, $4, $5, 'running',
+                    (SELECT COUNT(*) FROM users WHERE NOT blocked), $6, $7
+                )
+                RETURNING *
+            ''', broadcast_id, task_id, text, created_by, datetime.now(),
+                report_chat_id, report_message_id)
+            return dict(row)
+
+    @staticmethod
+    async def get_running(conn: Optional[asyncpg.Connection] = None) -> List[Dict]:
+        """Незавершенные рассылки (для продолжения после рестарта)"""
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch(
+                "SELECT * FROM broadcasts WHERE status = 'running' ORDER BY created"
+            )
+            return [dict(row) for row in rows]
+
+    @staticmethod
+    async def is_running_for_task(task_id: str, conn: Optional[asyncpg.Connection] = None) -> bool:
+        """Идет ли уже рассылка по заданию"""
+        async with PostgresDB.connection(conn) as conn:
+            return await conn.fetchval(
+                "SELECT EXISTS(SELECT 1 FROM broadcasts WHERE task_id = $1 AND status = 'running')",
+                task_id
+            )
+
+    @staticmethod
+    async def next_recipients(after_user_id: int, window: int = BROADCAST_WINDOW, conn: Optional[asyncpg.Connection] = None) -> List[int]:
+        """Следующее окно получателей с серверного курсора
+
+        Курсор читается окнами в короткой транзакции: соединение не удерживается
+        на время отправки, а снимок БД не живет часами.
+        """
+        async with PostgresDB.connection(conn) as conn:
+            async with conn.transaction(readonly=True):
+                cursor = await conn.cursor('''
+                    SELECT user_id FROM users
+                    WHERE user_id > $1 AND NOT blocked
+                    ORDER BY user_id
+                ''', after_user_id)
+                rows = await cursor.fetch(window)
+        return [row['user_id'] for row in rows]
+
+    @staticmethod
+    async def checkpoint(broadcast_id: str, last_user_id: int, sent: int, failed: int, blocked: int, conn: Optional[asyncpg.Connection] = None):
+        """Сохранение прогресса рассылки"""
+        async with PostgresDB.connection(conn) as conn:
             await conn.execute('''
-                INSERT INTO tracking_links (link_id, user_id, task_id, created, clicks, conversions, active)
-                VALUES ($1, $2, $3, $4, 0, 0, true)
-            ''', link_id, user_id, task_id, datetime.now())
-        BOT_USERNAME = os.environ.get('BOT_USERNAME', 'your_bot_username')
-        return f"https://t.me/{BOT_USERNAME}?start={link_id}"
+                UPDATE broadcasts
+                SET last_user_id = $2, sent = $3, failed = $4, blocked = $5
+                WHERE broadcast_id = $1
+            ''', broadcast_id, last_user_id, sent, failed, blocked)
+
+    @staticmethod
+    async def finish(broadcast_id: str, status: str = 'done', conn: Optional[asyncpg.Connection] = None):
+        """Завершение рассылки"""
+        async with PostgresDB.connection(conn) as conn:
+            await conn.execute('''
+                UPDATE broadcasts SET status = $2, finished = $3
+                WHERE broadcast_id = $1
+            ''', broadcast_id, status, datetime.now())
+
+    @staticmethod
+    async def mark_blocked(user_ids: List[int], conn: Optional[asyncpg.Connection] = None):
+        """Отметка пользователей, заблокировавших бота"""
+        if not user_ids:
+            return
+        async with PostgresDB.connection(conn) as conn:
+            await conn.execute(
+                'UPDATE users SET blocked = true WHERE user_id = ANY($1::bigint[])',
+                user_ids
+            )
 
 
 class AdminManager:
-    @staticmethod
-    async def is_admin(user_id: int) -> bool:
+    # Множество ID администраторов; согласуется между процессами через ChangeFeed
+    _admin_ids: Optional[set] = None
+    _generation = 0
+
+    @classmethod
+    def _forget(cls, op: str = '*', key: Optional[str] = None):
+        """Инвалидация кэша администраторов"""
+        cls._generation += 1
+        cls._admin_ids = None
+
+    @classmethod
+    async def is_admin(cls, user_id: int, conn: Optional[asyncpg.Connection] = None) -> bool:
         """Проверка, является ли пользователь админом"""
         if user_id == MAIN_ADMIN_ID:
             return True
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
-            row = await conn.fetchrow(
-                'SELECT * FROM admins WHERE user_id = $1',
-                user_id
-            )
-            return row is not None
+        if cls._admin_ids is not None and ChangeFeed.is_live():
+            return user_id in cls._admin_ids
+        generation = cls._generation
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch('SELECT user_id FROM admins')
+        admin_ids = {row['user_id'] for row in rows}
+        if ChangeFeed.is_live() and generation == cls._generation:
+            cls._admin_ids = admin_ids
+        return user_id in admin_ids
 
     @staticmethod
     async def is_main_admin(user_id: int) -> bool:
@@ -357,10 +2336,9 @@ class AdminManager:
         return user_id == MAIN_ADMIN_ID
 
     @staticmethod
-    async def add_admin(user_id: int, username: str = "", added_by: int = None):
+    async def add_admin(user_id: int, username: str = "", added_by: int = None, conn: Optional[asyncpg.Connection] = None):
         """Добавление администратора"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
+        async with PostgresDB.connection(conn) as conn:
             await conn.execute('''
                 INSERT INTO admins (user_id, username, added_by, added_date, permissions)
                 VALUES ($1, $2, $3, $4, $5)
@@ -371,38 +2349,36 @@ class AdminManager:
                     permissions = EXCLUDED.permissions
             ''', user_id, username, added_by, datetime.now(),
                 json.dumps(["manage_tasks", "view_stats"]))
+            AdminManager._forget()
 
     @staticmethod
-    async def remove_admin(user_id: int) -> bool:
+    async def remove_admin(user_id: int, conn: Optional[asyncpg.Connection] = None) -> bool:
         """Удаление администратора"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
+        async with PostgresDB.connection(conn) as conn:
             result = await conn.execute(
                 'DELETE FROM admins WHERE user_id = $1',
                 user_id
             )
+            AdminManager._forget()
             return 'DELETE 1' in result
 
     @staticmethod
-    async def get_all_admins() -> List[Dict]:
+    async def get_all_admins(conn: Optional[asyncpg.Connection] = None) -> List[Dict]:
         """Получение всех администраторов"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
+        async with PostgresDB.connection(conn) as conn:
             rows = await conn.fetch('SELECT * FROM admins')
             return [dict(row) for row in rows]
 
 
 class PendingLinksManager:
     @staticmethod
-    async def save_pending(task_id: str, data: Dict):
-        """Сохранение ожидающей ссылки"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
+    async def save_pending(task_id: str, data: Dict, conn: Optional[asyncpg.Connection] = None):
+        """Сохранение ожидающей ссылки исполнителя"""
+        async with PostgresDB.connection(conn) as conn:
             await conn.execute('''
                 INSERT INTO pending_links (task_id, user_id, username, task_title, message_sent, tracking_link)
                 VALUES ($1, $2, $3, $4, $5, $6)
-                ON CONFLICT (task_id) DO UPDATE SET
-                    user_id = EXCLUDED.user_id,
+                ON CONFLICT (task_id, user_id) DO UPDATE SET
                     username = EXCLUDED.username,
                     task_title = EXCLUDED.task_title,
                     message_sent = EXCLUDED.message_sent,
@@ -411,41 +2387,45 @@ class PendingLinksManager:
                 data['message_sent'], data['tracking_link'])
 
     @staticmethod
-    async def get_pending(task_id: str) -> Optional[Dict]:
-        """Получение ожидающей ссылки"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
-            row = await conn.fetchrow(
-                'SELECT * FROM pending_links WHERE task_id = $1',
-                task_id
-            )
+    async def get_pending(task_id: str, user_id: Optional[int] = None,
+                          conn: Optional[asyncpg.Connection] = None) -> Optional[Dict]:
+        """Получение ожидающей ссылки (user_id=None — самой ранней по заданию)"""
+        async with PostgresDB.connection(conn) as conn:
+            row = await conn.fetchrow('''
+                SELECT * FROM pending_links
+                WHERE task_id = $1 AND ($2::bigint IS NULL OR user_id = $2)
+                ORDER BY message_sent
+                LIMIT 1
+            ''', task_id, user_id)
             return dict(row) if row else None
 
     @staticmethod
-    async def delete_pending(task_id: str):
-        """Удаление ожидающей ссылки"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
-            await conn.execute(
-                'DELETE FROM pending_links WHERE task_id = $1',
-                task_id
-            )
+    async def delete_pending(task_id: str, user_id: Optional[int] = None,
+                             conn: Optional[asyncpg.Connection] = None):
+        """Удаление ожидающей ссылки (user_id=None — всех по заданию)"""
+        async with PostgresDB.connection(conn) as conn:
+            await conn.execute('''
+                DELETE FROM pending_links
+                WHERE task_id = $1 AND ($2::bigint IS NULL OR user_id = $2)
+            ''', task_id, user_id)
 
     @staticmethod
-    async def get_all_pending() -> List[Dict]:
-        """Получение всех ожидающих ссылок"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
-            rows = await conn.fetch('SELECT * FROM pending_links')
+    async def get_all_pending(limit: Optional[int] = None,
+                              conn: Optional[asyncpg.Connection] = None) -> List[Dict]:
+        """Получение ожидающих ссылок (самые старые первыми)"""
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch(
+                'SELECT * FROM pending_links ORDER BY message_sent LIMIT $1',
+                limit
+            )
             return [dict(row) for row in rows]
 
 
 class TrackingLinksManager:
     @staticmethod
-    async def get_link(link_id: str) -> Optional[Dict]:
+    async def get_link(link_id: str, conn: Optional[asyncpg.Connection] = None) -> Optional[Dict]:
         """Получение ссылки по ID"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
+        async with PostgresDB.connection(conn) as conn:
             row = await conn.fetchrow(
                 'SELECT * FROM tracking_links WHERE link_id = $1',
                 link_id
@@ -453,23 +2433,270 @@ class TrackingLinksManager:
             return dict(row) if row else None
 
     @staticmethod
-    async def increment_clicks(link_id: str):
+    async def register_click(link_id: str, conn: Optional[asyncpg.Connection] = None) -> Optional[Dict]:
+        """Учет перехода: счетчик кликов и данные ссылки одним запросом"""
+        async with PostgresDB.connection(conn) as conn:
+            row = await conn.fetchrow('''
+                UPDATE tracking_links
+                SET clicks = clicks + 1
+                WHERE link_id = $1
+                RETURNING *
+            ''', link_id)
+            if not row:
+                return None
+            MetricsManager.record(
+                'click', link=link_id, task=row['task_id'], user=row['user_id']
+            )
+            return dict(row)
+
+    @staticmethod
+    async def increment_clicks(link_id: str, conn: Optional[asyncpg.Connection] = None):
         """Увеличение счетчика кликов"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
-            await conn.execute('''
+        async with PostgresDB.connection(conn) as conn:
+            row = await conn.fetchrow('''
                 UPDATE tracking_links 
                 SET clicks = clicks + 1
                 WHERE link_id = $1
+                RETURNING task_id, user_id
             ''', link_id)
+            if row:
+                MetricsManager.record(
+                    'click', link=link_id, task=row['task_id'], user=row['user_id']
+                )
 
     @staticmethod
-    async def add_conversion(link_id: str):
+    async def add_conversion(link_id: str, conn: Optional[asyncpg.Connection] = None):
         """Добавление конверсии"""
-        pool = await PostgresDB.init_pool()
-        async with pool.acquire() as conn:
-            await conn.execute('''
+        async with PostgresDB.connection(conn) as conn:
+            row = await conn.fetchrow('''
                 UPDATE tracking_links 
                 SET conversions = conversions + 1
                 WHERE link_id = $1
-            ''', link_id)
\ No newline at end of file
+                RETURNING task_id, user_id
+            ''', link_id)
+            if row:
+                MetricsManager.record(
+                    'conversion', link=link_id, task=row['task_id'], user=row['user_id']
+                )
+
+
+class MetricsManager:
+    """Метрики во времени: почасовые корзины, которые со временем укрупняются
+
+    События копятся в памяти процесса и раз в METRICS_FLUSH_INTERVAL
+    дописываются в metric_rollups одним запросом (счетчики складываются).
+    Сжатие переносит старые часы в дни, старые дни — в недели, поэтому
+    каждое событие хранится ровно в одной корзине, и сумма по диапазону
+    точна с разрешением, которое грубеет с возрастом данных.
+    """
+
+    METRICS = ('click', 'conversion', 'take', 'completion')
+    GRANULARITIES = ('hour', 'day', 'week')
+
+    # (dimension, key, metric, час) -> [count, amount]
+    _buffer: Dict[Tuple[str, str, str, datetime], List[float]] = {}
+
+    @classmethod
+    def record(cls, metric: str, amount: float = 0, link: Optional[str] = None,
+               task: Optional[str] = None, user: Optional[int] = None,
+               at: Optional[datetime] = None):
+        """Учет события во всех разрезах, к которым оно относится"""
+        hour = (at or datetime.now()).replace(minute=0, second=0, microsecond=0)
+        dimensions = [('all', '')]
+        if link:
+            dimensions.append(('link', link))
+        if task:
+            dimensions.append(('task', task))
+        if user:
+            dimensions.append(('user', str(user)))
+        for dimension, key in dimensions:
+            totals = cls._buffer.setdefault((dimension, key, metric, hour), [0, 0.0])
+            totals[0] += 1
+            totals[1] += amount
+
+    @classmethod
+    async def flush(cls, conn: Optional[asyncpg.Connection] = None):
+        """Запись накопленных событий в почасовые корзины"""
+        if not cls._buffer:
+            return
+        buffer, cls._buffer = cls._buffer, {}
+        keys = list(buffer)
+        try:
+            async with PostgresDB.connection(conn) as conn:
+                await conn.execute('''
+                    INSERT INTO metric_rollups (dimension, key, metric, granularity, bucket, count, amount)
+                    SELECT d, k, m, 'hour', b, c, a
+                    FROM unnest($1::text[], $2::text[], $3::text[], $4::timestamp[],
+                                $5::bigint[], $6::float8[]) AS u(d, k, m, b, c, a)
+                    ON CONFLICT (dimension, key, metric, bucket, granularity) DO UPDATE SET
+                        count = metric_rollups.count + EXCLUDED.count,
+                        amount = metric_rollups.amount + EXCLUDED.amount
+                ''', [k[0] for k in keys], [k[1] for k in keys], [k[2] for k in keys],
+                    [k[3] for k in keys], [int(buffer[k][0]) for k in keys],
+                    [buffer[k][1] for k in keys])
+        except Exception:
+            # Не теряем события: возвращаем их в буфер до следующей попытки
+            for key, (count, amount) in buffer.items():
+                totals = cls._buffer.setdefault(key, [0, 0.0])
+                totals[0] += count
+                totals[1] += amount
+            raise
+
+    @staticmethod
+    async def compact(now: Optional[datetime] = None, conn: Optional[asyncpg.Connection] = None) -> Dict[str, int]:
+        """Укрупнение старых корзин: часы -> дни, дни -> недели
+
+        Перенос и удаление выполняются одним запросом на уровень, поэтому
+        повторный или параллельный запуск ничего не задваивает.
+        """
+        now = now or datetime.now()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        hours_cutoff = today - timedelta(days=ROLLUP_HOURLY_DAYS)
+        this_week = today - timedelta(days=today.weekday())
+        days_cutoff = this_week - timedelta(weeks=ROLLUP_DAILY_WEEKS)
+        moved = {}
+        async with PostgresDB.connection(conn) as conn:
+            for source, target, cutoff in (('hour', 'day', hours_cutoff), ('day', 'week', days_cutoff)):
+                result = await conn.execute('''
+                    WITH moved AS (
+                        DELETE FROM metric_rollups
+                        WHERE granularity = $1 AND bucket < $3
+                        RETURNING dimension, key, metric, bucket, count, amount
+                    )
+                    INSERT INTO metric_rollups (dimension, key, metric, granularity, bucket, count, amount)
+                    SELECT dimension, key, metric, $2, date_trunc($2, bucket), SUM(count), SUM(amount)
+                    FROM moved
+                    GROUP BY dimension, key, metric, date_trunc($2, bucket)
+                    ON CONFLICT (dimension, key, metric, bucket, granularity) DO UPDATE SET
+                        count = metric_rollups.count + EXCLUDED.count,
+                        amount = metric_rollups.amount + EXCLUDED.amount
+                ''', source, target, cutoff, timeout=DB_BACKGROUND_TIMEOUT)
+                moved[target] = int(result.split()[-1])
+        return moved
+
+    @classmethod
+    async def totals(cls, dimension: str, key: str, start: datetime, end: datetime,
+                     conn: Optional[asyncpg.Connection] = None) -> Dict[str, Tuple[int, float]]:
+        """Суммы метрик за [start, end): metric -> (count, amount)
+
+        Учитываются корзины, начинающиеся внутри диапазона, плюс еще не
+        записанные события этого процесса.
+        """
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch('''
+                SELECT metric, SUM(count) AS count, SUM(amount) AS amount
+                FROM metric_rollups
+                WHERE dimension = $1 AND key = $2 AND bucket >= $3 AND bucket < $4
+                GROUP BY metric
+            ''', dimension, key, start, end)
+        result = {metric: [0, 0.0] for metric in cls.METRICS}
+        for row in rows:
+            result[row['metric']] = [row['count'], row['amount']]
+        for (b_dimension, b_key, metric, hour), (count, amount) in cls._buffer.items():
+            if b_dimension == dimension and b_key == key and start <= hour < end:
+                result[metric][0] += count
+                result[metric][1] += amount
+        return {metric: (int(count), amount) for metric, (count, amount) in result.items()}
+
+    @staticmethod
+    async def series(dimension: str, key: str, granularity: str, start: datetime, end: datetime,
+                     conn: Optional[asyncpg.Connection] = None) -> List[Dict]:
+        """Ряд по периодам (hour/day/week): period, metric, count, amount"""
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch('''
+                SELECT date_trunc($3, bucket) AS period, metric,
+                    SUM(count) AS count, SUM(amount) AS amount
+                FROM metric_rollups
+                WHERE dimension = $1 AND key = $2 AND bucket >= $4 AND bucket < $5
+                GROUP BY period, metric
+                ORDER BY period
+            ''', dimension, key, granularity, start, end)
+            return [dict(row) for row in rows]
+
+
+class ReportQueueManager:
+    @staticmethod
+    async def push(entry_id: str, payload: Dict, conn: Optional[asyncpg.Connection] = None):
+        """Сохранение отчета до отправки сводкой"""
+        async with PostgresDB.connection(conn) as conn:
+            await conn.execute('''
+                INSERT INTO report_queue (entry_id, created, payload)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (entry_id) DO NOTHING
+            ''', entry_id, datetime.now(), json.dumps(payload, ensure_ascii=False))
+
+    @staticmethod
+    async def remove(entry_ids: List[str], conn: Optional[asyncpg.Connection] = None):
+        """Удаление отправленных отчетов"""
+        if not entry_ids:
+            return
+        async with PostgresDB.connection(conn) as conn:
+            await conn.execute('DELETE FROM report_queue WHERE entry_id = ANY($1::text[])', entry_ids)
+
+    @staticmethod
+    async def claim_stale(before: datetime, now: datetime,
+                          conn: Optional[asyncpg.Connection] = None) -> List[Tuple[str, Dict]]:
+        """Перехват отчетов, сохраненных раньше before: их время становится now
+
+        Так подбираются отчеты реплики, упавшей до отправки сводки. Отчеты
+        остаются в таблице до отправки, а обновление с возвратом идет одним
+        запросом, поэтому каждый отчет достается одной реплике.
+        """
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch('''
+                UPDATE report_queue SET created = $2
+                WHERE entry_id IN (
+                    SELECT entry_id FROM report_queue WHERE created < $1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING entry_id, payload
+            ''', before, now)
+        rows = sorted(rows, key=lambda row: row['entry_id'])
+        return [(row['entry_id'], json.loads(row['payload'])) for row in rows]
+
+
+class SettingsManager:
+    @staticmethod
+    async def get_all(conn: Optional[asyncpg.Connection] = None) -> Dict[str, str]:
+        """Все сохраненные настройки: ключ -> значение"""
+        async with PostgresDB.connection(conn) as conn:
+            rows = await conn.fetch('SELECT key, value FROM settings')
+        return {row['key']: row['value'] for row in rows}
+
+    @staticmethod
+    async def set(key: str, value: Optional[str], updated_by: Optional[int] = None,
+                  conn: Optional[asyncpg.Connection] = None):
+        """Сохранение настройки; None — удаление (действует значение по умолчанию)"""
+        async with PostgresDB.connection(conn) as conn:
+            if value is None:
+                await conn.execute('DELETE FROM settings WHERE key = $1', key)
+                return
+            await conn.execute('''
+                INSERT INTO settings (key, value, updated_by, updated_at)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (key) DO UPDATE SET
+                    value = EXCLUDED.value,
+                    updated_by = EXCLUDED.updated_by,
+                    updated_at = EXCLUDED.updated_at
+            ''', key, value, updated_by, datetime.now())
+
+
+# Подписки кэшей на ленту изменений
+ChangeFeed.subscribe('tasks', lambda op, key: TaskManager._forget(key))
+ChangeFeed.subscribe('tasks', AvailableTasksIndex.on_change)
+ChangeFeed.subscribe('completions', Leaderboards.on_change)
+ChangeFeed.subscribe('admins', AdminManager._forget)
+ChangeFeed.subscribe('tasks', AdminDashboard.nudge)
+ChangeFeed.subscribe('pending_links', AdminDashboard.nudge)
+
+# Снимки админ-панели и таблиц лидеров читаются из PostgreSQL, пока не выбрано другое хранилище
+AdminDashboard.source = Leaderboards.source = TaskManager
+
+# Менеджеры PostgreSQL — реализация интерфейса хранилища
+UserStore.register(UserManager)
+TaskStore.register(TaskManager)
+AdminStore.register(AdminManager)
+PendingLinkStore.register(PendingLinksManager)
+TrackingLinkStore.register(TrackingLinksManager)
+ReportQueueStore.register(ReportQueueManager)
+SettingsStore.register(SettingsManager)
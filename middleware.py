@@ -0,0 +1,232 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, Union
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+logger = logging.getLogger(__name__)
+
+
+def _bucket_config(name: str, default: str) -> Tuple[float, float]:
+    """Настройка класса маршрутов из окружения: "запас/пополнение в секунду" """
+    burst, _, rate = os.environ.get(f'FLOOD_{name.upper()}', default).partition('/')
+    return float(burst), float(rate)
+
+
+# Классы маршрутов: (запас нажатий, пополнение в секунду)
+FLOOD_ROUTES = {
+    # Экраны с несколькими запросами к БД
+    'heavy': _bucket_config('heavy', '5/1'),
+    # Взятие и сдача заданий
+    'write': _bucket_config('write', '3/0.2'),
+    # Остальная навигация
+    'nav': _bucket_config('nav', '10/2'),
+    # Текстовые сообщения и файлы
+    'message': _bucket_config('message', '5/1'),
+}
+# Верхняя граница числа корзин в памяти
+FLOOD_MAX_BUCKETS = int(os.environ.get('FLOOD_MAX_BUCKETS', '50000'))
+# Сколько секунд повторное нажатие считается дублем уже выполненного действия
+IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', '5'))
+
+HEAVY_CALLBACKS = {'available_tasks', 'profile', 'my_stats', 'my_active_tasks', 'my_completed_tasks'}
+HEAVY_PREFIXES = ('tasks_filter_', 'view_task_', 'search_')
+WRITE_PREFIXES = ('take_task_', 'complete_task_')
+# Действия с последствиями: повтор в пределах IDEMPOTENCY_TTL не выполняется заново.
+# Навигация сюда не входит — вернуться на тот же экран можно сразу
+REPLAY_PREFIXES = WRITE_PREFIXES + ('broadcast_task_', 'admin_remove_', 'admin_skip_link_')
+
+
+class TokenBucket:
+    """Корзина токенов одного пользователя для одного класса маршрутов"""
+
+    __slots__ = ('tokens', 'updated', 'warned', 'album')
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+        # Пользователь уже предупрежден в текущей серии отказов
+        self.warned = False
+        # Последний оплаченный альбом: его остальные части проходят без списания
+        self.album: Optional[str] = None
+
+    def take(self, capacity: float, rate: float, now: float) -> bool:
+        """Списать токен; False — лимит исчерпан"""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.warned = False
+            return True
+        return False
+
+
+class FloodControl:
+    """Ограничение частоты нажатий и сообщений на пользователя в памяти процесса
+
+    Корзины хранятся в порядке последнего обращения. Корзина, простоявшая
+    дольше времени полного пополнения, ничем не отличается от новой, поэтому
+    такие корзины вытесняются без потери точности. Лимит действует на
+    реплику: при нескольких репликах пользователь получает его на каждой.
+    """
+
+    _buckets: "OrderedDict[Tuple[int, str], TokenBucket]" = OrderedDict()
+
+    @staticmethod
+    def route_class(update: Update) -> Optional[str]:
+        """Класс маршрута обновления (None — не ограничивается)"""
+        if update.callback_query:
+            data = update.callback_query.data or ''
+            if data in HEAVY_CALLBACKS or data.startswith(HEAVY_PREFIXES):
+                return 'heavy'
+            if data.startswith(WRITE_PREFIXES):
+                return 'write'
+            return 'nav'
+        if update.message:
+            return 'message'
+        return None
+
+    @classmethod
+    def allow(cls, user_id: int, route: str, album: Optional[str] = None) -> Tuple[bool, TokenBucket]:
+        """Проверка лимита; возвращает решение и корзину пользователя
+
+        album — media_group_id сообщения: альбом списывает один токен на все части.
+        """
+        capacity, rate = FLOOD_ROUTES[route]
+        now = time.monotonic()
+        key = (user_id, route)
+        bucket = cls._buckets.get(key)
+        if bucket is None:
+            bucket = cls._buckets[key] = TokenBucket(capacity, now)
+        else:
+            cls._buckets.move_to_end(key)
+        if album is not None and bucket.album == album:
+            return True, bucket
+        allowed = bucket.take(capacity, rate, now)
+        if allowed and album is not None:
+            bucket.album = album
+        cls._evict(now)
+        return allowed, bucket
+
+    @classmethod
+    def _evict(cls, now: float):
+        """Вытеснение простаивающих корзин и соблюдение верхней границы"""
+        while cls._buckets:
+            (_, route), bucket = next(iter(cls._buckets.items()))
+            capacity, rate = FLOOD_ROUTES[route]
+            idle = now - bucket.updated
+            if len(cls._buckets) <= FLOOD_MAX_BUCKETS and idle * rate < capacity:
+                return
+            cls._buckets.popitem(last=False)
+
+
+async def flood_control(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отсечение слишком частых обновлений до основных обработчиков"""
+    user = update.effective_user
+    route = FloodControl.route_class(update)
+    if not user or not route:
+        return
+
+    album = update.message.media_group_id if update.message else None
+    allowed, bucket = FloodControl.allow(user.id, route, album)
+    if allowed:
+        return
+
+    try:
+        if update.callback_query:
+            # Ответ на callback обязателен, иначе у пользователя крутятся часики
+            await update.callback_query.answer("⏳ Слишком часто! Подождите пару секунд.")
+        elif not bucket.warned:
+            await update.message.reply_text("⏳ Слишком много сообщений. Подождите немного.")
+    except TelegramError as e:
+        logger.warning(f"Не удалось ответить на отклоненное обновление: {e}")
+    if not bucket.warned:
+        bucket.warned = True
+        logger.info(f"Flood control: пользователь {user.id} превысил лимит '{route}'")
+    raise ApplicationHandlerStop
+
+
+class Idempotency:
+    """Схлопывание повторных выполнений одного действия
+
+    Пока действие выполняется, дубли с тем же ключом ждут его результата
+    вместо повторного запуска. После завершения результат хранится
+    IDEMPOTENCY_TTL секунд и отдается дублям без выполнения. Если действие
+    упало или его результат не прошел проверку replay, ключ снимается сразу,
+    чтобы пользователь мог повторить.
+    """
+
+    # Ключ -> (future с результатом, момент истечения; inf — еще выполняется)
+    _entries: Dict[Tuple, Tuple[asyncio.Future, float]] = {}
+    # Очередь истечений: TTL один на всех, поэтому она упорядочена по времени
+    _expiry: Deque[Tuple[float, Tuple]] = deque()
+
+    @classmethod
+    async def run(cls, key: Tuple, action: Callable[[], Awaitable[Any]],
+                  replay: Union[bool, Callable[[Any], bool]] = True) -> Tuple[Any, bool]:
+        """Выполнить action один раз на ключ; возвращает (результат, дубль ли)
+
+        replay — хранить ли результат для дублей после завершения: флаг или
+        проверка результата (например, неудачу не запоминать).
+        """
+        now = time.monotonic()
+        cls._purge(now)
+        entry = cls._entries.get(key)
+        if entry is not None:
+            return await asyncio.shield(entry[0]), True
+
+        future = asyncio.get_running_loop().create_future()
+        cls._entries[key] = (future, float('inf'))
+        try:
+            result = await action()
+        except BaseException:
+            cls._entries.pop(key, None)
+            # Ждущие дубли не повторяют упавшее действие
+            future.set_result(None)
+            raise
+        future.set_result(result)
+        if replay(result) if callable(replay) else replay:
+            expires = time.monotonic() + IDEMPOTENCY_TTL
+            cls._entries[key] = (future, expires)
+            cls._expiry.append((expires, key))
+        else:
+            cls._entries.pop(key, None)
+        return result, False
+
+    @classmethod
+    def _purge(cls, now: float):
+        """Удаление истекших результатов"""
+        while cls._expiry and cls._expiry[0][0] <= now:
+            expires, key = cls._expiry.popleft()
+            entry = cls._entries.get(key)
+            if entry is not None and entry[1] == expires:
+                del cls._entries[key]
+
+
+def idempotent_callback(handler):
+    """Обработчик кнопок, в котором двойное нажатие выполняется один раз
+
+    Ключ — (пользователь, callback data, сообщение).
+    """
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        data = query.data or ''
+        message_id = query.message.message_id if query.message else query.inline_message_id
+        key = ('callback', query.from_user.id, data, message_id)
+        _, duplicate = await Idempotency.run(
+            key, lambda: handler(update, context), replay=data.startswith(REPLAY_PREFIXES)
+        )
+        if duplicate:
+            # Экран уже обновлен первым нажатием — остается снять часики
+            try:
+                await query.answer()
+            except TelegramError:
+                pass
+    return wrapper
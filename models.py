@@ -0,0 +1,76 @@
+from typing import Iterable, List, Optional, Tuple
+
+
+class Row:
+    """Строка результата запроса: только нужные экрану колонки, без словаря на экземпляр
+
+    Каждая модель перечисляет свои колонки в FIELDS, из них же строится
+    проекция для SELECT. Поля, которые не читаются из БД (например,
+    вычисленные после запроса), добавляются в __slots__ подкласса.
+    """
+
+    __slots__ = ()
+    FIELDS: Tuple[str, ...] = ()
+
+    def __init__(self, **values):
+        for name in self.FIELDS:
+            setattr(self, name, values.get(name))
+
+    @classmethod
+    def columns(cls, alias: str = '') -> str:
+        """Список колонок для SELECT (с префиксом таблицы, если задан alias)"""
+        prefix = f"{alias}." if alias else ''
+        return ', '.join(prefix + name for name in cls.FIELDS)
+
+    @classmethod
+    def from_record(cls, record) -> Optional["Row"]:
+        """Модель из asyncpg.Record (None остается None)"""
+        if record is None:
+            return None
+        row = cls.__new__(cls)
+        for name in cls.FIELDS:
+            setattr(row, name, record[name])
+        return row
+
+    @classmethod
+    def from_records(cls, records: Iterable) -> List["Row"]:
+        """Модели из списка записей"""
+        return [cls.from_record(record) for record in records]
+
+    def __repr__(self) -> str:
+        values = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"{type(self).__name__}({values})"
+
+
+class TaskListItem(Row):
+    """Задание в списке доступных"""
+    __slots__ = FIELDS = ('task_id', 'title', 'type', 'reward', 'created_date', 'capacity', 'slots_left')
+
+
+class TaskDetail(Row):
+    """Карточка задания: все, что показывается исполнителю, без доказательств"""
+    __slots__ = FIELDS = (
+        'task_id', 'title', 'description', 'type', 'target', 'reward', 'requirements',
+        'active', 'available', 'completed', 'capacity', 'slots_left', 'slots_done',
+        'publish_at', 'expires_at', 'claim_timeout', 'deadline', 'deadline_kind',
+    )
+
+
+class TakenTask(TaskDetail):
+    """Только что взятое задание вместе с выданной ссылкой и сроком исполнителя"""
+    __slots__ = ('tracking_link', 'claim_deadline')
+
+
+class TaskAdminRow(Row):
+    """Строка задания в админских списках"""
+    __slots__ = FIELDS = ('task_id', 'title', 'reward', 'completed', 'capacity', 'slots_left', 'slots_done')
+
+
+class UserTaskRow(Row):
+    """Задание в списках «мои задания»; deadline — срок возврата взятия"""
+    __slots__ = FIELDS = ('task_id', 'title', 'reward', 'deadline')
+
+
+class DueTask(Row):
+    """Задание, по которому наступил срок (для claim taken_by — исполнитель)"""
+    __slots__ = FIELDS = ('task_id', 'deadline_kind', 'taken_by', 'title')
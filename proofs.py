@@ -0,0 +1,207 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Bot, InputMediaDocument, InputMediaPhoto, InputMediaVideo, Message
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд тишины после очередной части альбома считать его полученным
+PROOF_ALBUM_WAIT = float(os.environ.get('PROOF_ALBUM_WAIT', '1.5'))
+# Подпись к медиа в Telegram ограничена 1024 символами, альбом — 10 элементами
+CAPTION_MAX = 1024
+MEDIA_GROUP_MAX = 10
+
+# Вид вложения -> класс элемента альбома
+INPUT_MEDIA = {
+    'photo': InputMediaPhoto,
+    'video': InputMediaVideo,
+    'document': InputMediaDocument,
+}
+
+
+class Proof:
+    """Доказательство выполнения: текст и ссылки на файлы Telegram
+
+    Файлы не скачиваются — хранятся только file_id и исходные сообщения
+    исполнителя, из которых доказательство копируется в группу отчетов.
+    """
+
+    __slots__ = ('text', 'media', 'chat_id', 'message_ids')
+
+    def __init__(self, text: str = "", media: Optional[List[Tuple[str, str]]] = None,
+                 chat_id: Optional[int] = None, message_ids: Optional[List[int]] = None):
+        self.text = text
+        # (вид, file_id) в порядке сообщений
+        self.media = media or []
+        self.chat_id = chat_id
+        self.message_ids = message_ids or []
+
+    @staticmethod
+    def attachment(message: Message) -> Optional[Tuple[str, str]]:
+        """Вложение сообщения: (вид, file_id) или None"""
+        if message.photo:
+            # Последний размер — самый крупный
+            return 'photo', message.photo[-1].file_id
+        if message.video:
+            return 'video', message.video.file_id
+        if message.document:
+            return 'document', message.document.file_id
+        return None
+
+    @classmethod
+    def from_message(cls, message: Message) -> Optional["Proof"]:
+        """Доказательство из одного сообщения; None — ни текста, ни вложения"""
+        proof = cls(chat_id=message.chat_id)
+        proof.add(message)
+        return proof if proof.text or proof.media else None
+
+    def add(self, message: Message):
+        """Добавление сообщения (части альбома)"""
+        text = message.text or message.caption
+        if text:
+            self.text = f"{self.text}\n{text}" if self.text else text
+        attachment = self.attachment(message)
+        if attachment:
+            self.media.append(attachment)
+        self.message_ids.append(message.message_id)
+
+    def summary(self) -> str:
+        """Перечень вложений для текста отчета"""
+        counts: Dict[str, int] = {}
+        for kind, _ in self.media:
+            counts[kind] = counts.get(kind, 0) + 1
+        labels = {'photo': 'фото', 'video': 'видео', 'document': 'файлы'}
+        return ", ".join(f"{labels[kind]}: {count}" for kind, count in counts.items())
+
+    def dump(self) -> str:
+        """Сериализация для хранения в БД"""
+        return json.dumps({
+            'text': self.text,
+            'media': self.media,
+            'chat_id': self.chat_id,
+            'message_ids': self.message_ids,
+        }, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, value: Optional[str]) -> "Proof":
+        """Доказательство из БД; старые записи — просто текст"""
+        try:
+            data = json.loads(value or "")
+        except ValueError:
+            return cls(text=value or "")
+        if not isinstance(data, dict):
+            return cls(text=value)
+        return cls(
+            data.get('text', ""), [tuple(item) for item in data.get('media', [])],
+            data.get('chat_id'), data.get('message_ids', [])
+        )
+
+
+class _Album:
+    __slots__ = ('proof', 'deadline')
+
+    def __init__(self, proof: Proof, deadline: float):
+        self.proof = proof
+        self.deadline = deadline
+
+
+class AlbumCollector:
+    """Сборка альбома из частей, которые приходят отдельными обновлениями
+
+    Обработчик первой части ждет, пока PROOF_ALBUM_WAIT секунд не придет
+    новых частей, и получает весь альбом; обработчики остальных частей
+    только дописывают их. Альбомы собираются в памяти процесса: при
+    нескольких репликах части одного альбома могут попасть на разные
+    реплики, и тогда засчитывается часть, сданная первой.
+    """
+
+    # (чат, media_group_id) -> собираемый альбом
+    _albums: Dict[Tuple[int, str], _Album] = {}
+
+    @classmethod
+    def add(cls, message: Message) -> bool:
+        """Добавление части альбома; True — это первая часть"""
+        key = (message.chat_id, message.media_group_id)
+        deadline = asyncio.get_running_loop().time() + PROOF_ALBUM_WAIT
+        album = cls._albums.get(key)
+        if album is None:
+            album = cls._albums[key] = _Album(Proof(chat_id=message.chat_id), deadline)
+            album.proof.add(message)
+            return True
+        album.proof.add(message)
+        album.deadline = deadline
+        return False
+
+    @classmethod
+    async def collect(cls, chat_id: int, media_group_id: str) -> Proof:
+        """Ожидание последней части и весь альбом по порядку сообщений"""
+        key = (chat_id, media_group_id)
+        album = cls._albums[key]
+        loop = asyncio.get_running_loop()
+        try:
+            while (delay := album.deadline - loop.time()) > 0:
+                await asyncio.sleep(delay)
+        finally:
+            del cls._albums[key]
+        # Части могут прийти не по порядку
+        proof = album.proof
+        order = sorted(range(len(proof.message_ids)), key=lambda i: proof.message_ids[i])
+        proof.message_ids = [proof.message_ids[i] for i in order]
+        if len(proof.media) == len(order):
+            proof.media = [proof.media[i] for i in order]
+        return proof
+
+
+async def deliver_proof(bot: Bot, chat_id, proof: Proof, reply_to: Optional[int] = None):
+    """Доставка доказательства в чат без скачивания файлов
+
+    Одно сообщение копируется (copy_message), альбом отправляется группой
+    медиа по file_id. Если исходное сообщение уже удалено, одиночное
+    вложение отправляется заново по file_id, текст — обычным сообщением.
+    """
+    if len(proof.message_ids) == 1 and proof.chat_id:
+        try:
+            await bot.copy_message(
+                chat_id=chat_id, from_chat_id=proof.chat_id, message_id=proof.message_ids[0],
+                reply_to_message_id=reply_to
+            )
+            return
+        except BadRequest as e:
+            logger.warning(f"Не удалось скопировать доказательство ({e}), отправка по file_id")
+
+    if not proof.media:
+        await bot.send_message(chat_id=chat_id, text=proof.text, reply_to_message_id=reply_to)
+        return
+    caption = proof.text[:CAPTION_MAX] or None
+    await send_media(bot, chat_id, [
+        (kind, file_id, caption if i == 0 else None) for i, (kind, file_id) in enumerate(proof.media)
+    ], reply_to=reply_to)
+
+
+async def send_media(bot: Bot, chat_id, items: List[Tuple[str, str, Optional[str]]],
+                     reply_to: Optional[int] = None):
+    """Отправка вложений (вид, file_id, подпись) по file_id как можно меньшим числом сообщений
+
+    Фото и видео идут общими альбомами, файлы — отдельными: Telegram не
+    смешивает их в одной группе. Альбом — от 2 до 10 элементов, одиночный
+    остаток отправляется отдельным сообщением.
+    """
+    visual = [item for item in items if item[0] != 'document']
+    documents = [item for item in items if item[0] == 'document']
+    for group in (visual, documents):
+        for start in range(0, len(group), MEDIA_GROUP_MAX):
+            chunk = group[start:start + MEDIA_GROUP_MAX]
+            if len(chunk) == 1:
+                kind, file_id, caption = chunk[0]
+                send = {'photo': bot.send_photo, 'video': bot.send_video, 'document': bot.send_document}[kind]
+                await send(chat_id, file_id, caption=caption, reply_to_message_id=reply_to)
+                continue
+            await bot.send_media_group(
+                chat_id=chat_id,
+                media=[INPUT_MEDIA[kind](file_id, caption=caption) for kind, file_id, caption in chunk],
+                reply_to_message_id=reply_to
+            )
@@ -0,0 +1,445 @@
+"""Проверка планов горячих запросов на PostgreSQL с данными реалистичного объема
+
+Скрипт заполняет отдельную БД синтетическими данными, вызывает методы
+менеджеров через соединение-посредник и для каждого их запроса снимает
+EXPLAIN (ANALYZE, BUFFERS). Проверка не проходит, если запрос читает
+большую таблицу последовательным сканированием, план отличается от
+сохраненного в query_plans/ или буферов читается заметно больше, чем
+в сохраненном плане.
+
+    PLAN_CHECK_DATABASE_URL=postgresql://localhost/traffic_plans DATABASE_SSL=disable \\
+        python query_plans.py [--update] [--reseed] [--only ИМЯ]
+
+--update перезаписывает сохраненные планы (их изменения смотрятся в ревью),
+--reseed заполняет БД заново, --only — только сценарии, в имени которых есть ИМЯ.
+Та же проверка без --update собирается pytest (tests/test_query_plans.py).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+import asyncpg
+
+import database
+from database import (
+    AdminManager, BroadcastManager, JobRunsManager, MetricsManager, PendingLinksManager,
+    PostgresDB, TaskManager, TrackingLinksManager, UserManager, UserStateManager,
+)
+
+PLAN_CHECK_DATABASE_URL = os.environ.get('PLAN_CHECK_DATABASE_URL', '')
+# Множитель объема данных (1 — около 100 тыс. пользователей и 200 тыс. взятий)
+PLAN_CHECK_SCALE = float(os.environ.get('PLAN_CHECK_SCALE', '1'))
+# Допуск по буферам относительно сохраненного плана: доля и абсолютный запас
+PLAN_BUFFER_SLACK = float(os.environ.get('PLAN_BUFFER_SLACK', '1.5'))
+PLAN_BUFFER_MARGIN = int(os.environ.get('PLAN_BUFFER_MARGIN', '50'))
+# Верхняя граница буферов на запрос, если сценарий не задал свою
+PLAN_BUFFER_BUDGET = int(os.environ.get('PLAN_BUFFER_BUDGET', '2000'))
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_plans')
+
+SEED_USERS = int(100_000 * PLAN_CHECK_SCALE)
+SEED_TASKS = int(20_000 * PLAN_CHECK_SCALE)
+SEED_CLAIMS = int(200_000 * PLAN_CHECK_SCALE)
+SEED_ROLLUPS = int(200_000 * PLAN_CHECK_SCALE)
+
+# Таблицы, которые растут с нагрузкой: последовательное чтение — ошибка,
+# если сценарий явно его не разрешил
+BIG_TABLES = frozenset({
+    'users', 'tasks', 'user_tasks', 'tracking_links', 'pending_links', 'metric_rollups', 'broadcasts',
+})
+
+
+class _Rollback(Exception):
+    """Откат точки сохранения после EXPLAIN ANALYZE"""
+
+
+class PlanRecorder:
+    """Соединение-посредник для методов менеджеров (conn=...)
+
+    Каждый запрос сначала выполняется под EXPLAIN (ANALYZE, BUFFERS) в
+    точке сохранения, которая откатывается, а затем — по-настоящему, чтобы
+    метод получил свой результат и дошел до следующих запросов.
+    """
+
+    def __init__(self, conn: asyncpg.Connection):
+        self._conn = conn
+        self.plans: List[Dict] = []
+
+    async def _explain(self, sql: str, args, kwargs):
+        plan = None
+        try:
+            async with self._conn.transaction():
+                plan = await self._conn.fetchval(
+                    f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', *args, **kwargs
+                )
+                raise _Rollback
+        except _Rollback:
+            pass
+        self.plans.append({'sql': sql, 'plan': json.loads(plan)[0]})
+
+    async def fetch(self, sql: str, *args, **kwargs):
+        await self._explain(sql, args, kwargs)
+        return await self._conn.fetch(sql, *args, **kwargs)
+
+    async def fetchrow(self, sql: str, *args, **kwargs):
+        await self._explain(sql, args, kwargs)
+        return await self._conn.fetchrow(sql, *args, **kwargs)
+
+    async def fetchval(self, sql: str, *args, **kwargs):
+        await self._explain(sql, args, kwargs)
+        return await self._conn.fetchval(sql, *args, **kwargs)
+
+    async def execute(self, sql: str, *args, **kwargs):
+        await self._explain(sql, args, kwargs)
+        return await self._conn.execute(sql, *args, **kwargs)
+
+    def transaction(self, **kwargs):
+        # Сценарий уже идет в транзакции: вложенная — точка сохранения без своей изоляции
+        return self._conn.transaction()
+
+
+class Scenario(NamedTuple):
+    """Вызов метода менеджера, планы запросов которого проверяются"""
+    name: str
+    run: Callable[[PlanRecorder, Dict], Awaitable]
+    # Таблицы, которые сценарию разрешено читать целиком (фоновые агрегаты)
+    allow_seq_scan: FrozenSet[str] = frozenset()
+    buffer_budget: int = PLAN_BUFFER_BUDGET
+
+
+def _now() -> datetime:
+    return datetime.now()
+
+
+SCENARIOS = [
+    Scenario('users.get_or_create_user', lambda c, s: UserManager.get_or_create_user(s['user_id'], conn=c)),
+    Scenario('users.get_user_stats', lambda c, s: UserManager.get_user_stats(s['user_id'], conn=c)),
+    Scenario('tasks.get_available_tasks', lambda c, s: TaskManager.get_available_tasks(limit=20, conn=c)),
+    Scenario('tasks.get_available_tasks_by_type', lambda c, s: TaskManager.get_available_tasks('Рекламный пост', 20, conn=c)),
+    Scenario('tasks.count_available_by_type', lambda c, s: TaskManager.count_available_by_type(conn=c)),
+    Scenario('tasks.search_text', lambda c, s: TaskManager.search_tasks('подписчики канал', conn=c)),
+    Scenario('tasks.search_filters', lambda c, s: TaskManager.search_tasks(
+        None, 'Рекламный пост', 500, 2000, conn=c
+    )),
+    Scenario('tasks.get_task', lambda c, s: TaskManager.get_task(s['open_task_id'], conn=c)),
+    Scenario('tasks.take_task', lambda c, s: TaskManager.take_task(s['open_task_id'], s['free_user_id'], 'plan', conn=c)),
+    Scenario('tasks.complete_task', lambda c, s: TaskManager.complete_task(
+        s['claim_task_id'], s['claim_user_id'], 'proof', conn=c
+    )),
+    Scenario('tasks.issue_work_link', lambda c, s: TaskManager.issue_work_link(
+        s['pending_task_id'], 'https://example.com', s['pending_user_id'], conn=c
+    )),
+    Scenario('tasks.issue_work_links', lambda c, s: TaskManager.issue_work_links(
+        {(s['pending_task_id'], None): 'https://example.com'}, conn=c
+    )),
+    Scenario('tasks.next_deadlines', lambda c, s: TaskManager.next_deadlines(_now() + timedelta(minutes=10), 200, conn=c)),
+    # Чистка за раз снимает до 200 взятий, и каждое пишет в четыре таблицы с их индексами
+    Scenario('tasks.sweep_deadlines', lambda c, s: TaskManager.sweep_deadlines(_now(), 200, conn=c),
+             buffer_budget=10_000),
+    Scenario('tasks.get_user_tasks_active', lambda c, s: TaskManager.get_user_tasks(s['claim_user_id'], 'active', conn=c)),
+    Scenario('tasks.get_user_tasks_completed', lambda c, s: TaskManager.get_user_tasks(
+        s['user_id'], 'completed', 10, conn=c
+    )),
+    Scenario('tasks.get_recent_tasks', lambda c, s: TaskManager.get_recent_tasks(20, conn=c)),
+    # Счетчики и агрегаты читаются фоновыми задачами раз в несколько секунд или раз в сутки
+    Scenario('tasks.get_dashboard_counters', lambda c, s: TaskManager.get_dashboard_counters(conn=c),
+             allow_seq_scan=frozenset({'tasks', 'users', 'pending_links'}), buffer_budget=20_000),
+    Scenario('tasks.get_completion_totals', lambda c, s: TaskManager.get_completion_totals(
+        _now() - timedelta(days=1), _now(), conn=c
+    ), allow_seq_scan=frozenset({'tasks', 'user_tasks'}), buffer_budget=20_000),
+    Scenario('tasks.get_leaderboard_snapshot', lambda c, s: TaskManager.get_leaderboard_snapshot(
+        _now() - timedelta(days=7), _now() - timedelta(days=1), _now() - timedelta(minutes=10), conn=c
+    ), allow_seq_scan=frozenset({'tasks', 'user_tasks'}), buffer_budget=50_000),
+    Scenario('admins.is_admin', lambda c, s: AdminManager.is_admin(s['user_id'], conn=c)),
+    Scenario('pending.get_pending', lambda c, s: PendingLinksManager.get_pending(s['pending_task_id'], conn=c)),
+    Scenario('pending.get_all_pending', lambda c, s: PendingLinksManager.get_all_pending(5, conn=c)),
+    Scenario('tracking.get_link', lambda c, s: TrackingLinksManager.get_link(s['link_id'], conn=c)),
+    Scenario('tracking.register_click', lambda c, s: TrackingLinksManager.register_click(s['link_id'], conn=c)),
+    Scenario('broadcasts.is_running_for_task', lambda c, s: BroadcastManager.is_running_for_task(s['open_task_id'], conn=c)),
+    Scenario('metrics.totals', lambda c, s: MetricsManager.totals(
+        'task', s['open_task_id'], _now() - timedelta(days=30), _now(), conn=c
+    )),
+    Scenario('metrics.series', lambda c, s: MetricsManager.series(
+        'all', '', 'day', _now() - timedelta(days=7), _now(), conn=c
+    )),
+    Scenario('jobs.has_run', lambda c, s: JobRunsManager.has_run('daily_report', '2000-01-01', conn=c)),
+    Scenario('states.load', lambda c, s: UserStateManager.load(s['user_id'], conn=c)),
+]
+
+
+async def seed(conn: asyncpg.Connection):
+    """Заполнение БД синтетическими данными"""
+    print(f"🌱 Заполнение: {SEED_USERS} пользователей, {SEED_TASKS} заданий, {SEED_CLAIMS} взятий")
+    async with conn.transaction():
+        await conn.execute('''
+            TRUNCATE users, admins, tasks, user_tasks, tracking_links, pending_links,
+                broadcasts, job_runs, user_states, metric_rollups
+        ''')
+        await conn.execute('''
+            INSERT INTO users (user_id, username, first_name, joined_date, earned, rating, blocked)
+            SELECT g, 'user' || g, 'User', now() - make_interval(days => g % 365), 0, 0, g % 50 = 0
+            FROM generate_series(1, $1) g
+        ''', SEED_USERS)
+        await conn.execute('''
+            INSERT INTO admins (user_id, username, added_by, added_date, permissions)
+            SELECT g, 'admin' || g, 1, now(), '[]'::jsonb FROM generate_series(1, 10) g
+        ''')
+        # 10% открыты, 5% ждут публикации, остальные выполнены и закрыты
+        await conn.execute('''
+            INSERT INTO tasks (
+                task_id, title, description, type, target, reward, requirements,
+                created_by, created_date, active, available, completed, completed_date,
+                publish_at, expires_at, capacity, slots_left, slots_done
+            )
+            SELECT
+                lpad(g::text, 16, '0'),
+                (ARRAY['Подписчики на канал', 'Рекламный пост в канале',
+                       'Переходы по ссылке', 'Установка приложения'])[1 + g % 4] || ' №' || g,
+                'Описание задания ' || g,
+                (ARRAY['Привлечение подписчиков', 'Рекламный пост',
+                       'Переходы по ссылке', 'Установка приложения'])[1 + g % 4],
+                '@channel' || g % 100,
+                100 + (g * 37) % 3000,
+                'Требования ' || g,
+                1,
+                now() - make_interval(mins => $1 - g),
+                g % 20 < 3,
+                g % 20 < 2,
+                g % 20 >= 3,
+                CASE WHEN g % 20 >= 3 THEN now() - make_interval(mins => $1 - g) END,
+                CASE WHEN g % 20 = 2 THEN now() + make_interval(hours => g % 48) END,
+                CASE WHEN g % 20 < 2 THEN now() + make_interval(hours => g % 72) END,
+                1 + g % 5,
+                CASE WHEN g % 20 < 3 THEN 1 + g % 5 ELSE 0 END,
+                CASE WHEN g % 20 >= 3 THEN 1 + g % 5 ELSE 0 END
+            FROM generate_series(1, $1) g
+        ''', SEED_TASKS)
+        # 90% взятий выполнены за последние 90 дней, остальные активны
+        await conn.execute('''
+            INSERT INTO user_tasks (user_id, task_id, status, taken_date, completed_date, deadline)
+            SELECT
+                1 + (g::bigint * 7919) % $2,
+                lpad((1 + g % $3)::text, 16, '0'),
+                CASE WHEN g % 10 = 0 THEN 'active' ELSE 'completed' END,
+                now() - make_interval(mins => g % 129600),
+                CASE WHEN g % 10 <> 0 THEN now() - make_interval(mins => g % 129600) END,
+                CASE WHEN g % 10 = 0 THEN now() + make_interval(mins => g % 2880 - 60) END
+            FROM generate_series(1, $1) g
+            ON CONFLICT DO NOTHING
+        ''', SEED_CLAIMS, SEED_USERS, SEED_TASKS)
+        await conn.execute('''
+            INSERT INTO tracking_links (link_id, user_id, task_id, created, clicks, conversions, active)
+            SELECT lpad(row_number() OVER ()::text, 16, 'l'), user_id, task_id, taken_date,
+                0, 0, status = 'active'
+            FROM user_tasks
+        ''')
+        await conn.execute('''
+            INSERT INTO pending_links (task_id, user_id, username, task_title, message_sent, tracking_link)
+            SELECT task_id, user_id, 'user' || user_id, 'Задание', taken_date, 'https://t.me/bot'
+            FROM user_tasks WHERE status = 'active'
+            LIMIT 2000
+        ''')
+        await conn.execute('''
+            INSERT INTO metric_rollups (dimension, key, metric, granularity, bucket, count, amount)
+            SELECT 'task', lpad((1 + g % $2)::text, 16, '0'),
+                (ARRAY['click', 'conversion', 'take', 'completion'])[1 + g % 4], 'hour',
+                date_trunc('hour', now()) - make_interval(hours => g / $2), 1 + g % 7, 0
+            FROM generate_series(1, $1) g
+            ON CONFLICT DO NOTHING
+        ''', SEED_ROLLUPS, SEED_TASKS)
+        # Рассылка была по каждому десятому заданию; идущих почти нет
+        await conn.execute('''
+            INSERT INTO broadcasts (broadcast_id, task_id, text, created_by, created, status, finished)
+            SELECT 'b' || g, lpad(g::text, 16, '0'), 'Новое задание', 1,
+                now() - make_interval(mins => $1 - g),
+                CASE WHEN g % 1000 = 0 THEN 'running' ELSE 'finished' END,
+                CASE WHEN g % 1000 <> 0 THEN now() - make_interval(mins => $1 - g) END
+            FROM generate_series(10, $1, 10) g
+        ''', SEED_TASKS)
+    # Как после автоочистки на рабочей БД: карта видимости заполнена,
+    # поэтому сканирование только индекса не ходит в таблицу
+    await conn.execute('VACUUM ANALYZE')
+
+
+async def seed_ids(conn: asyncpg.Connection) -> Dict:
+    """ID из заполненных данных, на которых запускаются сценарии"""
+    open_task_id = await conn.fetchval('''
+        SELECT task_id FROM tasks WHERE available AND active AND taken_by IS NULL AND slots_left > 0
+        ORDER BY task_id LIMIT 1
+    ''')
+    claim = await conn.fetchrow('''
+        SELECT user_id, task_id FROM user_tasks WHERE status = 'active' ORDER BY user_id, task_id LIMIT 1
+    ''')
+    pending = await conn.fetchrow('SELECT task_id, user_id FROM pending_links ORDER BY task_id, user_id LIMIT 1')
+    free_user_id = await conn.fetchval('''
+        SELECT u.user_id FROM users u
+        WHERE NOT EXISTS (SELECT 1 FROM user_tasks ut WHERE ut.user_id = u.user_id AND ut.task_id = $1)
+        ORDER BY u.user_id LIMIT 1
+    ''', open_task_id)
+    return {
+        'user_id': claim['user_id'],
+        'free_user_id': free_user_id,
+        'open_task_id': open_task_id,
+        'claim_user_id': claim['user_id'],
+        'claim_task_id': claim['task_id'],
+        'pending_task_id': pending['task_id'],
+        'pending_user_id': pending['user_id'],
+        'link_id': await conn.fetchval('SELECT link_id FROM tracking_links ORDER BY link_id LIMIT 1'),
+    }
+
+
+def _walk(node: Dict, depth: int = 0):
+    yield depth, node
+    for child in node.get('Plans', []):
+        yield from _walk(child, depth + 1)
+
+
+def summarize(sql: str, plan: Dict) -> Dict:
+    """Сравнимая часть плана: форма дерева, буферы и строки (без времени и стоимости)"""
+    root = plan['Plan']
+    shape = []
+    seq_scans = set()
+    for depth, node in _walk(root):
+        line = '  ' * depth + node['Node Type']
+        if 'Relation Name' in node:
+            line += f" on {node['Relation Name']}"
+        if 'Index Name' in node:
+            line += f" using {node['Index Name']}"
+        shape.append(line)
+        if node['Node Type'] == 'Seq Scan':
+            seq_scans.add(node['Relation Name'])
+    return {
+        'sql': ' '.join(sql.split()),
+        'shape': shape,
+        'buffers': root.get('Shared Hit Blocks', 0) + root.get('Shared Read Blocks', 0),
+        'rows': root.get('Actual Rows', 0),
+        'seq_scans': sorted(seq_scans),
+    }
+
+
+def check(scenario: Scenario, statements: List[Dict], baseline: Optional[Dict]) -> List[str]:
+    """Нарушения сценария относительно правил и сохраненного плана"""
+    problems = []
+    for i, statement in enumerate(statements, 1):
+        forbidden = set(statement['seq_scans']) & (BIG_TABLES - scenario.allow_seq_scan)
+        if forbidden:
+            problems.append(f"запрос {i}: последовательное чтение {', '.join(sorted(forbidden))}")
+        if statement['buffers'] > scenario.buffer_budget:
+            problems.append(f"запрос {i}: {statement['buffers']} буферов при бюджете {scenario.buffer_budget}")
+    if baseline is None:
+        problems.append("нет сохраненного плана (запустите с --update)")
+        return problems
+    saved = baseline['statements']
+    if [s['sql'] for s in saved] != [s['sql'] for s in statements]:
+        problems.append("изменился набор запросов сценария")
+        return problems
+    for i, (old, new) in enumerate(zip(saved, statements), 1):
+        if old['shape'] != new['shape']:
+            problems.append(f"запрос {i}: план изменился:\n      было: " + '\n            '.join(old['shape'])
+                            + "\n      стало: " + '\n             '.join(new['shape']))
+        limit = old['buffers'] * PLAN_BUFFER_SLACK + PLAN_BUFFER_MARGIN
+        if new['buffers'] > limit:
+            problems.append(f"запрос {i}: {new['buffers']} буферов, в сохраненном плане {old['buffers']}")
+    return problems
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def load_baseline(name: str) -> Optional[Dict]:
+    try:
+        with open(baseline_path(name), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(name: str, statements: List[Dict]):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(baseline_path(name), 'w', encoding='utf-8') as f:
+        json.dump({'statements': statements}, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+async def run_scenario(conn: asyncpg.Connection, scenario: Scenario, ids: Dict) -> List[Dict]:
+    """Запуск сценария в транзакции, которая затем откатывается"""
+    recorder = PlanRecorder(conn)
+    transaction = conn.transaction()
+    await transaction.start()
+    try:
+        await scenario.run(recorder, ids)
+    finally:
+        await transaction.rollback()
+    return [summarize(entry['sql'], entry['plan']) for entry in recorder.plans]
+
+
+async def prepare(reseed: bool = False) -> Tuple[asyncpg.Connection, Dict]:
+    """Схема и данные БД проверки; возвращает соединение и ID для сценариев"""
+    if not PLAN_CHECK_DATABASE_URL:
+        raise ValueError("PLAN_CHECK_DATABASE_URL не задан: нужна отдельная БД, она будет перезаполнена")
+    if PLAN_CHECK_DATABASE_URL == os.environ.get('DATABASE_URL'):
+        raise ValueError("PLAN_CHECK_DATABASE_URL совпадает с DATABASE_URL — рабочую БД не трогаем")
+
+    # Схема, функции и триггеры создаются тем же кодом, что и в боте
+    database.DATABASE_URL = PLAN_CHECK_DATABASE_URL
+    await PostgresDB.init_db()
+    conn = await PostgresDB.connect()
+    try:
+        if reseed or not await conn.fetchval('SELECT EXISTS(SELECT 1 FROM users)'):
+            await seed(conn)
+        return conn, await seed_ids(conn)
+    except BaseException:
+        await conn.close()
+        raise
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Проверка планов горячих запросов")
+    parser.add_argument('--update', action='store_true', help="перезаписать сохраненные планы")
+    parser.add_argument('--reseed', action='store_true', help="заполнить БД заново")
+    parser.add_argument('--only', help="только сценарии, в имени которых есть эта строка")
+    args = parser.parse_args()
+
+    try:
+        conn, ids = await prepare(args.reseed)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+    failed = 0
+    try:
+        for scenario in SCENARIOS:
+            if args.only and args.only not in scenario.name:
+                continue
+            try:
+                statements = await run_scenario(conn, scenario, ids)
+            except Exception as e:
+                failed += 1
+                print(f"❌ {scenario.name}: ошибка {type(e).__name__}: {e}")
+                continue
+            if args.update:
+                save_baseline(scenario.name, statements)
+            problems = check(scenario, statements, None if args.update else load_baseline(scenario.name))
+            if args.update:
+                problems = [p for p in problems if not p.startswith("нет сохраненного плана")]
+            buffers = sum(s['buffers'] for s in statements)
+            if problems:
+                failed += 1
+                print(f"❌ {scenario.name} ({len(statements)} запр., {buffers} буф.)")
+                for problem in problems:
+                    print(f"   • {problem}")
+            else:
+                print(f"✅ {scenario.name} ({len(statements)} запр., {buffers} буф.)")
+    finally:
+        await conn.close()
+        await PostgresDB.close_pool()
+    print(f"\n{'❌' if failed else '✅'} Сценариев с нарушениями: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
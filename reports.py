@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telegram import Bot
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from backend import ReportQueueManager
+from database import DatabaseUnavailable, generate_id
+from proofs import Proof, deliver_proof, send_media
+from templates import Template
+from texts import REPORT, REPORT_DIGEST, REPORT_DIGEST_ITEM
+
+logger = logging.getLogger(__name__)
+
+# Окно сводки (секунды): отчеты, пришедшие в течение окна после предыдущей
+# отправки, уходят одним сообщением; 0 — каждый отчет отдельно и сразу
+REPORT_DIGEST_WINDOW = float(os.environ.get('REPORT_DIGEST_WINDOW', '60'))
+# Столько накопленных отчетов отправляются сводкой, не дожидаясь конца окна
+REPORT_DIGEST_SIZE = int(os.environ.get('REPORT_DIGEST_SIZE', '30'))
+# Отчеты старше этого (секунды) считаются оставшимися от упавшего процесса
+REPORT_DIGEST_ORPHAN_AGE = float(os.environ.get('REPORT_DIGEST_ORPHAN_AGE', str(max(600, REPORT_DIGEST_WINDOW * 3))))
+# Сколько символов текстового доказательства и названия задания показывать в отчете
+PROOF_PREVIEW_LENGTH = 200
+TITLE_PREVIEW_LENGTH = 200
+# Запас до лимита Telegram в 4096 символов на сообщение
+MESSAGE_MAX = 4000
+
+
+def report_entry(name: str, title: str, reward: float, proof: Proof) -> Dict:
+    """Отчет о выполнении в виде, который хранится в очереди"""
+    return {'name': name, 'title': title, 'reward': reward or 0, 'proof': proof.dump()}
+
+
+def proof_preview(proof: Proof) -> str:
+    """Начало текста доказательства и перечень вложений (без разметки)"""
+    preview = proof.text[:PROOF_PREVIEW_LENGTH]
+    if len(proof.text) > PROOF_PREVIEW_LENGTH:
+        preview += "..."
+    if proof.media:
+        preview = f"{preview}\n📎 {proof.summary()}" if preview else f"📎 {proof.summary()}"
+    return preview
+
+
+def _plain(template: Template) -> Template:
+    """Тот же текст без разметки: запасной вариант, если Telegram не принял Markdown"""
+    return Template(template.source.replace('*', ''), parse_mode=None)
+
+
+REPORT_PLAIN = _plain(REPORT)
+REPORT_DIGEST_PLAIN = _plain(REPORT_DIGEST)
+REPORT_DIGEST_ITEM_PLAIN = _plain(REPORT_DIGEST_ITEM)
+
+
+def split_messages(header: str, blocks: List[str], limit: int = MESSAGE_MAX) -> List[List[int]]:
+    """Разбиение сводки на сообщения по границам блоков: номера блоков каждого сообщения
+
+    Блоки не режутся: обрезка посреди разметки сделала бы сообщение
+    неотправляемым. Размер блока ограничен длиной превью, поэтому блок
+    длиннее лимита уходит отдельным сообщением.
+    """
+    messages = [[]]
+    size = len(header)
+    for i, block in enumerate(blocks):
+        if size + len(block) > limit and messages[-1]:
+            messages.append([])
+            size = len(header)
+        messages[-1].append(i)
+        size += len(block)
+    return messages
+
+
+class _Batch:
+    """Сводка в процессе отправки: повтор продолжает с первой неотправленной части"""
+
+    __slots__ = ('entries', 'messages', 'media', 'sent')
+
+    def __init__(self, entries: List[Tuple[str, Dict]], messages: List[Tuple[str, str]],
+                 media: List[Tuple[str, str, Optional[str]]]):
+        self.entries = entries
+        # (Markdown, простой текст) каждой части
+        self.messages = messages
+        self.media = media
+        self.sent = 0
+
+
+class ReportDigest:
+    """Отчеты о выполнении в группу отчетов: поштучно при низкой нагрузке, сводкой в пик
+
+    Первый отчет после тихого периода уходит сразу. Следующие, пришедшие в
+    течение REPORT_DIGEST_WINDOW после предыдущей отправки, копятся и уходят
+    одной сводкой по окончании окна или по достижении REPORT_DIGEST_SIZE.
+    Накопленные отчеты сохраняются в хранилище до отправки; отчеты упавшего
+    процесса подбирает реплика, которой это поручено (лидер), по возрасту.
+    """
+
+    _bot: Optional[Bot] = None
+    chat_id = None
+    # Подбирает ли этот процесс отчеты упавших процессов
+    _owns_orphans: Optional[Callable[[], bool]] = None
+    _task: Optional[asyncio.Task] = None
+    _wakeup: Optional[asyncio.Event] = None
+    # (entry_id, отчет) в порядке поступления
+    _entries: List[Tuple[str, Dict]] = []
+    # Сводка, отправка которой прервалась сетевой ошибкой
+    _batch: Optional[_Batch] = None
+    _last_sent = float('-inf')
+    _lock: Optional[asyncio.Lock] = None
+
+    @classmethod
+    def start(cls, bot: Bot, chat_id, owns_orphans: Callable[[], bool]):
+        """Запуск фонового цикла отправки сводок"""
+        cls._bot = bot
+        cls.chat_id = chat_id
+        # Без окна каждый отчет уходит сразу — копить и подбирать нечего
+        if cls._task or REPORT_DIGEST_WINDOW <= 0:
+            return
+        cls._owns_orphans = owns_orphans
+        cls._wakeup = asyncio.Event()
+        cls._lock = asyncio.Lock()
+        cls._task = asyncio.create_task(cls._run())
+
+    @classmethod
+    async def stop(cls):
+        """Остановка цикла и отправка накопленного"""
+        if cls._task:
+            cls._task.cancel()
+            try:
+                await cls._task
+            except asyncio.CancelledError:
+                pass
+            cls._task = None
+            await cls.flush()
+
+    @classmethod
+    async def add(cls, entry: Dict):
+        """Отчет о выполнении: сразу, если отчетов давно не было, иначе в сводку"""
+        now = time.monotonic()
+        quiet = not cls._entries and not cls._batch and now - cls._last_sent >= REPORT_DIGEST_WINDOW
+        if cls._task is None or quiet:
+            cls._last_sent = now
+            await cls._send_single(entry)
+            return
+
+        entry_id = generate_id()
+        try:
+            await ReportQueueManager.push(entry_id, entry)
+        except DatabaseUnavailable:
+            logger.warning("БД недоступна: отчет о выполнении хранится только в памяти до отправки сводки")
+        cls._entries.append((entry_id, entry))
+        # Первый отчет в сводке задает срок отправки, полная сводка уходит сразу
+        if len(cls._entries) == 1 or len(cls._entries) >= REPORT_DIGEST_SIZE:
+            cls._wakeup.set()
+
+    @classmethod
+    async def _run(cls):
+        """Цикл: сводка по окончании окна или по размеру, подбор отчетов упавших процессов"""
+        while True:
+            try:
+                if cls._entries or cls._batch:
+                    delay = cls._last_sent + REPORT_DIGEST_WINDOW - time.monotonic()
+                else:
+                    delay = REPORT_DIGEST_WINDOW
+                try:
+                    await asyncio.wait_for(cls._wakeup.wait(), max(delay, 0))
+                except asyncio.TimeoutError:
+                    pass
+                cls._wakeup.clear()
+                if cls._owns_orphans():
+                    await cls._adopt_orphans()
+                if cls._batch or (cls._entries and (
+                    len(cls._entries) >= REPORT_DIGEST_SIZE
+                    or time.monotonic() - cls._last_sent >= REPORT_DIGEST_WINDOW
+                )):
+                    await cls.flush()
+            except asyncio.CancelledError:
+                raise
+            except DatabaseUnavailable:
+                # Отчеты остаются в памяти — уйдут, когда БД вернется
+                pass
+            except Exception as e:
+                logger.error(f"Ошибка отправки сводки отчетов: {e}")
+
+    @classmethod
+    async def _adopt_orphans(cls):
+        """Отчеты, которые процесс сохранил, но не успел отправить до падения"""
+        now = datetime.now()
+        orphans = await ReportQueueManager.claim_stale(now - timedelta(seconds=REPORT_DIGEST_ORPHAN_AGE), now)
+        known = {entry_id for entry_id, _ in cls._entries + (cls._batch.entries if cls._batch else [])}
+        adopted = [(entry_id, entry) for entry_id, entry in orphans if entry_id not in known]
+        if adopted:
+            logger.info(f"Подобрано неотправленных отчетов о выполнении: {len(adopted)}")
+            cls._entries = adopted + cls._entries
+
+    @classmethod
+    async def flush(cls):
+        """Отправка накопленных отчетов сводкой
+
+        Сетевая ошибка оставляет сводку для повтора через окно, и повтор
+        досылает только неотправленные части. Остальные ошибки Telegram
+        (группа удалена, бот исключен) окончательны: сводка снимается.
+        """
+        if cls._lock is None or not (cls._batch or cls._entries):
+            return
+        async with cls._lock:
+            if cls._batch is None:
+                entries, cls._entries = cls._entries, []
+                cls._batch = cls._digest(entries)
+            batch = cls._batch
+            try:
+                await cls._deliver(batch)
+            except BadRequest as e:
+                logger.error(f"Сводка отчетов не принята и снята ({len(batch.entries)} отчетов): {e}")
+            except NetworkError:
+                # Сводка остается, следующая попытка через окно
+                cls._last_sent = time.monotonic()
+                raise
+            except TelegramError as e:
+                logger.error(f"Сводка отчетов не отправлена и снята ({len(batch.entries)} отчетов): {e}")
+            cls._batch = None
+            cls._last_sent = time.monotonic()
+            try:
+                await ReportQueueManager.remove([entry_id for entry_id, _ in batch.entries])
+            except DatabaseUnavailable:
+                logger.warning("БД недоступна: отправленные отчеты не удалены из очереди и могут повториться")
+
+    @classmethod
+    async def _send(cls, text: str, plain: str):
+        """Сообщение в группу отчетов с ожиданием при ограничении частоты
+
+        Если Telegram не разобрал разметку, сообщение уходит простым текстом.
+        """
+        parse_mode = 'Markdown'
+        while True:
+            try:
+                return await cls._bot.send_message(chat_id=cls.chat_id, text=text, parse_mode=parse_mode)
+            except RetryAfter as e:
+                logger.warning(f"Группа отчетов: ограничение частоты, пауза {e.retry_after} с")
+                await asyncio.sleep(e.retry_after)
+            except BadRequest as e:
+                if parse_mode is None:
+                    raise
+                logger.warning(f"Отчет не принят с разметкой ({e}), отправка простым текстом")
+                text, parse_mode = plain, None
+
+    @classmethod
+    async def _send_single(cls, entry: Dict):
+        """Отдельный отчет; доказательство с вложениями — ответом на него"""
+        proof = Proof.load(entry['proof'])
+        entry = cls._preview_entry(entry)
+        preview = proof_preview(proof)
+        try:
+            report = await cls._send(
+                REPORT.render(entry=entry, preview=preview), REPORT_PLAIN.render(entry=entry, preview=preview)
+            )
+            # Вложения и длинный текст — копией сообщений исполнителя
+            if proof.media or len(proof.text) > PROOF_PREVIEW_LENGTH:
+                await deliver_proof(cls._bot, cls.chat_id, proof, reply_to=report.message_id)
+        except TelegramError as e:
+            logger.error(f"Ошибка отправки отчета: {e}")
+
+    @staticmethod
+    def _preview_entry(entry: Dict) -> Dict:
+        """Отчет с укороченным названием задания: блок сводки не выходит за лимит сообщения"""
+        if len(entry['title']) <= TITLE_PREVIEW_LENGTH:
+            return entry
+        return {**entry, 'title': entry['title'][:TITLE_PREVIEW_LENGTH] + "..."}
+
+    @classmethod
+    def _digest(cls, entries: List[Tuple[str, Dict]]) -> _Batch:
+        """Сводка: текст частями до лимита сообщения, затем вложения альбомами"""
+        total = sum(entry['reward'] for _, entry in entries)
+        header = REPORT_DIGEST.render(count=len(entries), total=total)
+        plain_header = REPORT_DIGEST_PLAIN.render(count=len(entries), total=total)
+        blocks = []
+        plain_blocks = []
+        media = []
+        for i, (_, entry) in enumerate(entries, 1):
+            proof = Proof.load(entry['proof'])
+            entry = cls._preview_entry(entry)
+            preview = proof_preview(proof)
+            blocks.append(REPORT_DIGEST_ITEM.render(number=i, entry=entry, preview=preview))
+            plain_blocks.append(REPORT_DIGEST_ITEM_PLAIN.render(number=i, entry=entry, preview=preview))
+            # Номер отчета — подписью к первому вложению
+            media += [(kind, file_id, f"№{i}" if j == 0 else None) for j, (kind, file_id) in enumerate(proof.media)]
+        messages = [
+            (header + "".join(blocks[i] for i in part), plain_header + "".join(plain_blocks[i] for i in part))
+            for part in split_messages(header, blocks)
+        ]
+        return _Batch(entries, messages, media)
+
+    @classmethod
+    async def _deliver(cls, batch: _Batch):
+        """Отправка неотправленных частей сводки, затем вложений"""
+        while batch.sent < len(batch.messages):
+            await cls._send(*batch.messages[batch.sent])
+            batch.sent += 1
+        if batch.media:
+            try:
+                await send_media(cls._bot, cls.chat_id, batch.media)
+            except TelegramError as e:
+                # Текст сводки уже отправлен: повтор задвоил бы его
+                logger.error(f"Ошибка отправки вложений сводки: {e}")
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
+
+from backend import TaskManager, subscribe
+from database import DatabaseUnavailable
+from models import DueTask
+from texts import CLAIM_EXPIRED
+
+logger = logging.getLogger(__name__)
+
+# Шаг колеса таймеров (секунды): точность срабатывания сроков
+DEADLINE_TICK = float(os.environ.get('DEADLINE_TICK', '1'))
+# Горизонт колеса (секунды): сроки дальше подгружаются при следующем обновлении
+DEADLINE_HORIZON = float(os.environ.get('DEADLINE_HORIZON', '600'))
+# Сколько сроков загружается в колесо и обрабатывается одним запросом
+DEADLINE_BATCH = int(os.environ.get('DEADLINE_BATCH', '200'))
+# Задержка перечитывания сроков после изменений заданий (секунды)
+DEADLINE_NUDGE_DELAY = float(os.environ.get('DEADLINE_NUDGE_DELAY', '1'))
+
+
+class TimerWheel:
+    """Колесо таймеров: кольцо корзин по одной на шаг времени
+
+    Добавление и срабатывание — O(1), сколько бы сроков ни было загружено.
+    Сроки дальше горизонта (slots * tick) не принимаются.
+    """
+
+    def __init__(self, tick: float, slots: int):
+        self.tick = tick
+        self.slots = slots
+        self._buckets: List[Set[str]] = [set() for _ in range(slots)]
+        self._position = 0
+        self._started = time.monotonic()
+
+    def _now_tick(self) -> int:
+        return int((time.monotonic() - self._started) // self.tick)
+
+    def add(self, key: str, delay: float) -> bool:
+        """Поставить key на срабатывание через delay секунд"""
+        ticks = max(0, math.ceil(delay / self.tick))
+        target = max(self._now_tick() + ticks, self._position)
+        if target - self._position >= self.slots:
+            return False
+        self._buckets[target % self.slots].add(key)
+        return True
+
+    def clear(self):
+        """Снять все таймеры"""
+        for bucket in self._buckets:
+            bucket.clear()
+
+    def advance(self) -> Set[str]:
+        """Провернуть колесо до текущего момента; вернуть сработавшие ключи"""
+        fired: Set[str] = set()
+        now = self._now_tick()
+        while self._position <= now:
+            bucket = self._buckets[self._position % self.slots]
+            fired |= bucket
+            bucket.clear()
+            self._position += 1
+        return fired
+
+
+class DeadlineScheduler:
+    """Сроки заданий: возврат просроченных мест, отложенная публикация и окончание
+
+    Ближайшие сроки держатся в колесе таймеров процесса; когда корзина
+    срабатывает, наступившие сроки обрабатываются пачками в БД. Колесо
+    перечитывается каждые полгоризонта и по изменениям заданий в хранилище.
+    В PostgreSQL чистка использует SKIP LOCKED, поэтому работает на всех репликах.
+    """
+
+    wheel = TimerWheel(DEADLINE_TICK, max(1, int(DEADLINE_HORIZON / DEADLINE_TICK)))
+
+    _bot: Optional[Bot] = None
+    _task: Optional[asyncio.Task] = None
+    _reload: Optional[asyncio.Event] = None
+    # В колесо попали не все сроки горизонта — после срабатывания дочитать
+    _truncated = False
+    _nudged: Optional[asyncio.TimerHandle] = None
+
+    @classmethod
+    def start(cls, bot: Bot):
+        """Запуск фонового цикла"""
+        if cls._task:
+            return
+        cls._bot = bot
+        cls._reload = asyncio.Event()
+        cls._task = asyncio.create_task(cls._run())
+
+    @classmethod
+    async def stop(cls):
+        """Остановка фонового цикла"""
+        if cls._task:
+            cls._task.cancel()
+            try:
+                await cls._task
+            except asyncio.CancelledError:
+                pass
+            cls._task = None
+
+    @classmethod
+    def nudge(cls, op: str = '*', key: Optional[str] = None):
+        """Сроки могли измениться — перечитать колесо с небольшой задержкой"""
+        if cls._nudged is not None or cls._task is None:
+            return
+        loop = asyncio.get_running_loop()
+
+        def fire():
+            cls._nudged = None
+            cls._reload.set()
+        cls._nudged = loop.call_later(DEADLINE_NUDGE_DELAY, fire)
+
+    @classmethod
+    async def _run(cls):
+        """Цикл: обновление колеса, проворот по шагам, чистка сработавших"""
+        loaded_at = 0.0
+        while True:
+            try:
+                if cls._reload.is_set() or time.monotonic() - loaded_at >= DEADLINE_HORIZON / 2:
+                    cls._reload.clear()
+                    loaded_at = time.monotonic()
+                    await cls._load()
+                if cls.wheel.advance():
+                    await cls.sweep()
+                    if cls._truncated:
+                        cls._reload.set()
+            except asyncio.CancelledError:
+                raise
+            except DatabaseUnavailable:
+                # Автомат защиты разомкнут — сроки обработаются, когда БД вернется
+                pass
+            except Exception as e:
+                logger.error(f"Ошибка планировщика сроков: {e}")
+            try:
+                await asyncio.wait_for(cls._reload.wait(), DEADLINE_TICK)
+            except asyncio.TimeoutError:
+                pass
+
+    @classmethod
+    async def _load(cls):
+        """Загрузка сроков в пределах горизонта; наступившие сработают сразу"""
+        now = datetime.now()
+        deadlines = await TaskManager.next_deadlines(
+            now + timedelta(seconds=DEADLINE_HORIZON), DEADLINE_BATCH
+        )
+        cls.wheel.clear()
+        cls._truncated = len(deadlines) >= DEADLINE_BATCH
+        for task_id, deadline in deadlines:
+            cls.wheel.add(task_id, (deadline - now).total_seconds())
+
+    @classmethod
+    async def sweep(cls):
+        """Обработка всех наступивших сроков пачками по DEADLINE_BATCH"""
+        while True:
+            tasks = await TaskManager.sweep_deadlines(datetime.now(), DEADLINE_BATCH)
+            for task in tasks:
+                await cls._on_due(task)
+            if len(tasks) < DEADLINE_BATCH:
+                return
+
+    @classmethod
+    async def _on_due(cls, task: DueTask):
+        """Журнал и уведомление исполнителя о возврате места"""
+        kind = task.deadline_kind
+        if kind == 'publish':
+            logger.info(f"Задание {task.task_id} опубликовано по расписанию")
+        elif kind == 'expire':
+            logger.info(f"Задание {task.task_id} снято: срок приема истек")
+        elif kind == 'claim':
+            logger.info(f"Место в задании {task.task_id} возвращено: исполнитель {task.taken_by} не уложился в срок")
+            if not cls._bot or not task.taken_by:
+                return
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("📋 Доступные задания", callback_data="available_tasks")
+            ]])
+            try:
+                await cls._bot.send_message(
+                    chat_id=task.taken_by,
+                    text=CLAIM_EXPIRED.render(task=task),
+                    reply_markup=reply_markup,
+                    parse_mode='Markdown'
+                )
+            except TelegramError as e:
+                logger.warning(f"Не удалось уведомить исполнителя {task.taken_by}: {e}")
+
+
+# Сроки меняются при любой записи задания
+subscribe('tasks', DeadlineScheduler.nudge)
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+
+from telegram import CallbackQuery, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+# Сколько последних экранов (сообщений) помнит процесс
+SCREEN_CACHE_SIZE = int(os.environ.get('SCREEN_CACHE_SIZE', '5000'))
+
+
+def _digest(value) -> bytes:
+    return hashlib.blake2b(
+        json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode(),
+        digest_size=16
+    ).digest()
+
+
+def _markup_digest(reply_markup: Optional[InlineKeyboardMarkup]) -> bytes:
+    return _digest(reply_markup.to_dict() if reply_markup else None)
+
+
+class ScreenCache:
+    """Последний отрисованный экран каждого сообщения (LRU)
+
+    Хранятся хэш текста с клавиатурой и отдельно хэш клавиатуры. Клавиатура
+    сверяется с той, что пришла в callback: если сообщение успели изменить
+    в другом месте (другая реплика, ручная правка), запись считается устаревшей.
+    """
+
+    _screens: "OrderedDict[Union[Tuple[int, int], str], Tuple[bytes, bytes]]" = OrderedDict()
+
+    @staticmethod
+    def key(query: CallbackQuery) -> Union[Tuple[int, int], str, None]:
+        """Ключ сообщения, к которому относится callback"""
+        if query.message:
+            return (query.message.chat_id, query.message.message_id)
+        return query.inline_message_id
+
+    @classmethod
+    def is_shown(cls, query: CallbackQuery, screen: bytes) -> bool:
+        """Показан ли этот экран в сообщении прямо сейчас"""
+        key = cls.key(query)
+        entry = cls._screens.get(key)
+        if entry is None or entry[0] != screen:
+            return False
+        if query.message and _markup_digest(query.message.reply_markup) != entry[1]:
+            cls.forget(query)
+            return False
+        cls._screens.move_to_end(key)
+        return True
+
+    @classmethod
+    def remember(cls, query: CallbackQuery, screen: bytes,
+                 reply_markup: Optional[InlineKeyboardMarkup]):
+        """Запомнить отрисованный экран"""
+        key = cls.key(query)
+        if key is None:
+            return
+        cls._screens[key] = (screen, _markup_digest(reply_markup))
+        cls._screens.move_to_end(key)
+        while len(cls._screens) > SCREEN_CACHE_SIZE:
+            cls._screens.popitem(last=False)
+
+    @classmethod
+    def forget(cls, query: CallbackQuery):
+        """Сообщение изменено в обход edit_screen"""
+        cls._screens.pop(cls.key(query), None)
+
+
+async def edit_screen(query: CallbackQuery, text: str,
+                      reply_markup: Optional[InlineKeyboardMarkup] = None,
+                      parse_mode: Optional[str] = None, **kwargs) -> bool:
+    """Замена query.edit_message_text без повторной отрисовки того же экрана
+
+    Возвращает False, если сообщение уже показывало этот экран и запрос
+    к Bot API не понадобился. Callback к этому моменту уже подтвержден
+    в button_handler.
+    """
+    screen = _digest([text, reply_markup.to_dict() if reply_markup else None, parse_mode, kwargs])
+    if ScreenCache.is_shown(query, screen):
+        return False
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode, **kwargs)
+    except BadRequest as e:
+        if 'message is not modified' in str(e).lower():
+            ScreenCache.remember(query, screen, reply_markup)
+            return False
+        ScreenCache.forget(query)
+        raise
+    ScreenCache.remember(query, screen, reply_markup)
+    return True
+
+
+async def edit_markup(query: CallbackQuery, reply_markup: Optional[InlineKeyboardMarkup]):
+    """Замена query.edit_message_reply_markup: экран в кэше больше не актуален"""
+    ScreenCache.forget(query)
+    await query.edit_message_reply_markup(reply_markup=reply_markup)
@@ -0,0 +1,157 @@
+import logging
+import os
+import re
+from typing import Callable, Dict, List, Optional
+
+from backend import SettingsManager, subscribe
+from database import DatabaseUnavailable, TRACKING_LINK_TEMPLATE, TaskManager as PostgresTaskManager
+from templates import Markup, Template
+import texts
+
+logger = logging.getLogger(__name__)
+
+# Значения по умолчанию: действуют, пока настройка не сохранена в админ-панели
+DEFAULTS: Dict[str, str] = {
+    'welcome_text': texts.WELCOME.source,
+    'notification_group': os.environ.get('TASK_NOTIFICATION_GROUP', "@wedferfwewf"),
+    'report_group': os.environ.get('REPORT_GROUP', "@ertghpjoterg"),
+    'tracking_link_template': TRACKING_LINK_TEMPLATE,
+}
+
+# Группа: @username или числовой ID чата
+_CHAT_RE = re.compile(r'^(@[A-Za-z][A-Za-z0-9_]{4,}|-?\d+)$')
+
+
+def _welcome_template(text: str) -> Template:
+    """Приветствие как шаблон без полей: фигурные скобки админа — обычный текст"""
+    return Template(text.replace('{', '{{').replace('}', '}}'))
+
+
+def _check_welcome(text: str) -> Optional[str]:
+    # Остальное место в сообщении занимает экран предпросмотра
+    if len(text) > 3500:
+        return "Текст длиннее 3500 символов"
+    try:
+        _welcome_template(text)
+    except ValueError:
+        return "Незакрытая разметка: проверьте *, _, ` и ["
+    return None
+
+
+def _check_chat(text: str) -> Optional[str]:
+    if not _CHAT_RE.match(text):
+        return "Укажите @username группы или числовой ID чата"
+    return None
+
+
+def _check_link_template(text: str) -> Optional[str]:
+    if '{link_id}' not in text:
+        return "В шаблоне нет {link_id}"
+    if not text.startswith(('https://', 'http://', 'tg://')):
+        return "Ссылка должна начинаться с https://, http:// или tg://"
+    try:
+        text.format(link_id='test')
+    except (KeyError, IndexError, ValueError):
+        return "Кроме {link_id}, фигурных скобок в шаблоне быть не должно"
+    return None
+
+
+# Настройка -> проверка значения (текст ошибки или None)
+VALIDATORS: Dict[str, Callable[[str], Optional[str]]] = {
+    'welcome_text': _check_welcome,
+    'notification_group': _check_chat,
+    'report_group': _check_chat,
+    'tracking_link_template': _check_link_template,
+}
+
+
+class Config:
+    """Настройки бота в памяти процесса
+
+    Читаются из таблицы settings при запуске и перечитываются при каждом ее
+    изменении (LISTEN/NOTIFY или локальное уведомление SQLite), поэтому
+    обработчики берут значения без обращения к БД, а изменение из админ-панели
+    действует на всех репликах без перезапуска.
+    """
+
+    _values: Dict[str, str] = dict(DEFAULTS)
+    _welcome: Template = texts.WELCOME
+    _listeners: List[Callable[[], None]] = []
+
+    @staticmethod
+    def validate(key: str, value: str) -> Optional[str]:
+        """Текст ошибки для значения настройки или None"""
+        if key not in VALIDATORS:
+            return f"Неизвестная настройка: {key}"
+        return VALIDATORS[key](value)
+
+    @classmethod
+    def get(cls, key: str) -> str:
+        """Текущее значение настройки"""
+        return cls._values[key]
+
+    @classmethod
+    def is_default(cls, key: str) -> bool:
+        """Действует ли значение по умолчанию"""
+        return cls._values[key] == DEFAULTS[key]
+
+    @classmethod
+    def welcome(cls) -> Markup:
+        """Приветствие для /start"""
+        return cls._welcome.render()
+
+    @classmethod
+    def on_reload(cls, callback: Callable[[], None]):
+        """Подписка на смену настроек (вызывается и при подписке)"""
+        cls._listeners.append(callback)
+        callback()
+
+    @classmethod
+    async def load(cls):
+        """Перечитать настройки из БД; при недоступной БД остаются прежние"""
+        try:
+            stored = await SettingsManager.get_all()
+        except DatabaseUnavailable:
+            logger.warning("БД недоступна: настройки не перечитаны, действуют прежние")
+            return
+        cls._apply(stored)
+
+    @classmethod
+    async def set(cls, key: str, value: Optional[str], updated_by: Optional[int] = None):
+        """Сохранение настройки; None — вернуть значение по умолчанию"""
+        if value is not None:
+            error = cls.validate(key, value)
+            if error:
+                raise ValueError(error)
+        await SettingsManager.set(key, value, updated_by)
+        # Эта реплика применяет сразу, остальные — по уведомлению
+        cls._apply({**cls._values, key: value if value is not None else DEFAULTS[key]})
+
+    @classmethod
+    def on_change(cls, op: str = '*', key: Optional[str] = None):
+        """Таблица настроек изменилась — перечитать"""
+        return cls.load()
+
+    @classmethod
+    def _apply(cls, stored: Dict[str, str]):
+        values = dict(DEFAULTS)
+        for key, value in stored.items():
+            if key not in VALIDATORS:
+                continue
+            error = VALIDATORS[key](value)
+            if error:
+                logger.error(f"Настройка {key} отклонена ({error}), действует значение по умолчанию")
+                continue
+            values[key] = value
+        cls._welcome = _welcome_template(values['welcome_text'])
+        cls._values = values
+        PostgresTaskManager.tracking_link_template = values['tracking_link_template']
+        for callback in cls._listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Ошибка применения настроек: {e}")
+
+
+# Настройки меняются из админ-панели любой реплики
+subscribe('settings', Config.on_change)
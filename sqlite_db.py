@@ -0,0 +1,897 @@
+import asyncio
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from database import (
+    CLAIM_TIMEOUT_MINUTES, ID_INSERT_ATTEMPTS, MAIN_ADMIN_ID,
+    AdminDashboard, AvailableTasksIndex, Leaderboards, generate_id,
+    TaskManager as PostgresTaskManager,
+)
+from models import DueTask, TakenTask, TaskAdminRow, TaskDetail, TaskListItem, UserTaskRow
+from storage import (
+    AdminStore, PendingLinkStore, ReportQueueStore, SettingsStore, TaskStore, TrackingLinkStore, UserStore
+)
+
+# Файл встроенной БД (STORAGE_BACKEND=sqlite)
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'traffic.db')
+# Сколько ждать, пока другой процесс отпустит запись (миллисекунды)
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+OPEN_CONDITION = AvailableTasksIndex.OPEN_CONDITION
+
+# Даты хранятся текстом ISO с микросекундами: такие строки сравниваются как даты
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' ', timespec='microseconds'))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('BOOLEAN', lambda value: value not in (b'0', b''))
+
+
+def _casefold(value: Optional[str]) -> Optional[str]:
+    # Встроенный lower() в SQLite понимает только латиницу
+    return value.casefold() if value is not None else None
+
+
+def _limit(limit: Optional[int]) -> int:
+    # Отрицательный LIMIT в SQLite — без ограничения
+    return -1 if limit is None else limit
+
+
+class SQLiteDB:
+    """Встроенная БД SQLite для установки из одной реплики
+
+    Одно соединение на процесс в режиме WAL: чтение не ждет записи, а
+    запросы выполняются прямо в цикле событий — ответ встроенной БД
+    занимает микросекунды, и поток на каждый запрос стоил бы дороже
+    самого запроса. Многошаговые записи идут в BEGIN IMMEDIATE без
+    await внутри, поэтому другие корутины их не перемежают. Лента
+    изменений — локальная: подписчики вызываются после фиксации.
+    """
+
+    _conn: Optional[sqlite3.Connection] = None
+    _subscribers: Dict[str, List[Callable]] = {}
+
+    @classmethod
+    def connection(cls) -> sqlite3.Connection:
+        """Соединение процесса (открывается при первом обращении)"""
+        if cls._conn is None:
+            conn = sqlite3.connect(
+                SQLITE_PATH,
+                detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            # В WAL фиксация без fsync журнала не теряет целостность, только последние транзакции при сбое ОС
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+            conn.create_function('casefold', 1, _casefold, deterministic=True)
+            cls._conn = conn
+        return cls._conn
+
+    @classmethod
+    @contextmanager
+    def transaction(cls):
+        """Транзакция с блокировкой записи с первого запроса"""
+        conn = cls.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    @classmethod
+    def subscribe(cls, table: str, callback: Callable):
+        """Регистрация обработчика изменений таблицы: callback(op, key)"""
+        cls._subscribers.setdefault(table, []).append(callback)
+
+    @classmethod
+    def notify(cls, table: str, op: str, key: Optional[str]):
+        """Вызов обработчиков таблицы после записи"""
+        for callback in cls._subscribers.get(table, []):
+            try:
+                result = callback(op, key)
+                if asyncio.iscoroutine(result):
+                    asyncio.create_task(result)
+            except Exception as e:
+                print(f"⚠️ Ошибка обработчика изменений {table}: {e}")
+
+    @classmethod
+    async def init_db(cls):
+        """Создание таблиц, индексов и триггеров, если их нет"""
+        conn = cls.connection()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                joined_date TIMESTAMP,
+                earned REAL DEFAULT 0,
+                rating INTEGER DEFAULT 0,
+                blocked BOOLEAN DEFAULT false
+            );
+
+            CREATE TABLE IF NOT EXISTS admins (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                added_by INTEGER,
+                added_date TIMESTAMP,
+                permissions TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                title TEXT,
+                description TEXT,
+                type TEXT,
+                target TEXT,
+                reward REAL,
+                requirements TEXT,
+                created_by INTEGER,
+                created_date TIMESTAMP,
+                active BOOLEAN DEFAULT true,
+                taken_by INTEGER,
+                assigned_date TIMESTAMP,
+                completed BOOLEAN DEFAULT false,
+                completed_date TIMESTAMP,
+                proof TEXT,
+                work_link TEXT,
+                available BOOLEAN DEFAULT true,
+                publish_at TIMESTAMP,
+                expires_at TIMESTAMP,
+                claim_timeout INTEGER,
+                deadline TIMESTAMP,
+                deadline_kind TEXT,
+                capacity INTEGER DEFAULT 1,
+                slots_left INTEGER,
+                slots_done INTEGER DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS tasks_created_date_idx ON tasks (created_date DESC);
+            CREATE INDEX IF NOT EXISTS tasks_deadline_idx ON tasks (deadline)
+                WHERE deadline IS NOT NULL;
+            CREATE INDEX IF NOT EXISTS tasks_open_idx ON tasks (created_date DESC)
+                WHERE available = true AND active = true AND taken_by IS NULL;
+
+            CREATE TABLE IF NOT EXISTS user_tasks (
+                user_id INTEGER,
+                task_id TEXT,
+                status TEXT,
+                taken_date TIMESTAMP,
+                completed_date TIMESTAMP,
+                deadline TIMESTAMP,
+                proof TEXT,
+                PRIMARY KEY (user_id, task_id)
+            );
+            CREATE INDEX IF NOT EXISTS user_tasks_deadline_idx ON user_tasks (deadline)
+                WHERE status = 'active';
+            CREATE INDEX IF NOT EXISTS user_tasks_task_idx ON user_tasks (task_id);
+
+            CREATE TABLE IF NOT EXISTS tracking_links (
+                link_id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                task_id TEXT,
+                created TIMESTAMP,
+                clicks INTEGER DEFAULT 0,
+                conversions INTEGER DEFAULT 0,
+                active BOOLEAN DEFAULT true,
+                work_link TEXT
+            );
+            CREATE INDEX IF NOT EXISTS tracking_links_task_user_idx ON tracking_links (task_id, user_id);
+
+            CREATE TABLE IF NOT EXISTS pending_links (
+                task_id TEXT,
+                user_id INTEGER,
+                username TEXT,
+                task_title TEXT,
+                message_sent TIMESTAMP,
+                tracking_link TEXT,
+                PRIMARY KEY (task_id, user_id)
+            );
+            CREATE INDEX IF NOT EXISTS pending_links_sent_idx ON pending_links (message_sent);
+
+            CREATE TABLE IF NOT EXISTS report_queue (
+                entry_id TEXT PRIMARY KEY,
+                created TIMESTAMP,
+                payload TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_by INTEGER,
+                updated_at TIMESTAMP
+            );
+
+            -- Ближайший срок задания, как у триггера tasks_set_deadline в PostgreSQL:
+            -- отложенное — публикация, открытое — окончание
+            CREATE TRIGGER IF NOT EXISTS tasks_deadline_insert AFTER INSERT ON tasks
+            BEGIN
+                UPDATE tasks SET
+                    deadline = CASE
+                        WHEN NEW.completed OR NOT NEW.active THEN NULL
+                        WHEN NOT NEW.available AND NEW.publish_at IS NOT NULL AND NEW.slots_left > 0 THEN NEW.publish_at
+                        WHEN NEW.available AND NEW.expires_at IS NOT NULL THEN NEW.expires_at
+                    END,
+                    deadline_kind = CASE
+                        WHEN NEW.completed OR NOT NEW.active THEN NULL
+                        WHEN NOT NEW.available AND NEW.publish_at IS NOT NULL AND NEW.slots_left > 0 THEN 'publish'
+                        WHEN NEW.available AND NEW.expires_at IS NOT NULL THEN 'expire'
+                    END
+                WHERE task_id = NEW.task_id;
+            END;
+            CREATE TRIGGER IF NOT EXISTS tasks_deadline_update
+            AFTER UPDATE OF active, available, completed, slots_left, publish_at, expires_at ON tasks
+            BEGIN
+                UPDATE tasks SET
+                    deadline = CASE
+                        WHEN NEW.completed OR NOT NEW.active THEN NULL
+                        WHEN NOT NEW.available AND NEW.publish_at IS NOT NULL AND NEW.slots_left > 0 THEN NEW.publish_at
+                        WHEN NEW.available AND NEW.expires_at IS NOT NULL THEN NEW.expires_at
+                    END,
+                    deadline_kind = CASE
+                        WHEN NEW.completed OR NOT NEW.active THEN NULL
+                        WHEN NOT NEW.available AND NEW.publish_at IS NOT NULL AND NEW.slots_left > 0 THEN 'publish'
+                        WHEN NEW.available AND NEW.expires_at IS NOT NULL THEN 'expire'
+                    END
+                WHERE task_id = NEW.task_id;
+            END;
+        ''')
+        print(f"✅ Таблицы SQLite созданы/проверены ({SQLITE_PATH})")
+
+    @classmethod
+    async def close(cls):
+        """Закрытие соединения"""
+        if cls._conn is not None:
+            cls._conn.close()
+            cls._conn = None
+
+
+class UserManager(UserStore):
+    @staticmethod
+    async def get_or_create_user(user_id: int, username: str = "", first_name: str = ""):
+        """Получение или создание пользователя"""
+        conn = SQLiteDB.connection()
+        user = conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        if not user:
+            conn.execute('''
+                INSERT INTO users (user_id, username, first_name, joined_date, earned, rating)
+                VALUES (?, ?, ?, ?, 0, 0)
+                ON CONFLICT (user_id) DO NOTHING
+            ''', (user_id, username, first_name, datetime.now()))
+            return None
+        if user['blocked']:
+            # Пользователь снова написал боту — значит, разблокировал его
+            conn.execute('UPDATE users SET blocked = false WHERE user_id = ?', (user_id,))
+        return dict(user)
+
+    @staticmethod
+    async def get_user_stats(user_id: int) -> Dict:
+        """Получение статистики пользователя"""
+        row = SQLiteDB.connection().execute('''
+            SELECT
+                (SELECT COUNT(*) FROM user_tasks
+                 WHERE user_id = ?1 AND status = 'completed') AS completed_count,
+                (SELECT COUNT(*) FROM user_tasks
+                 WHERE user_id = ?1 AND status = 'active') AS active_count,
+                (SELECT earned FROM users WHERE user_id = ?1) AS earned
+        ''', (user_id,)).fetchone()
+        completed_count = row['completed_count']
+        return {
+            "completed_count": completed_count,
+            "active_count": row['active_count'],
+            "total_earned": row['earned'] or 0,
+            "rating": completed_count * 10
+        }
+
+    @staticmethod
+    async def add_earned(user_id: int, amount: float):
+        """Добавление заработка пользователю"""
+        SQLiteDB.connection().execute(
+            'UPDATE users SET earned = earned + ? WHERE user_id = ?',
+            (amount, user_id)
+        )
+
+
+class TaskManager(TaskStore):
+    tracking_url = staticmethod(PostgresTaskManager.tracking_url)
+
+    @staticmethod
+    async def create_task(
+        title: str,
+        description: str,
+        task_type: str,
+        target: str,
+        reward: float,
+        created_by: int,
+        requirements: str = "",
+        publish_at: Optional[datetime] = None,
+        expires_at: Optional[datetime] = None,
+        claim_timeout: Optional[int] = None,
+        capacity: int = 1
+    ) -> str:
+        """Создание нового задания (параметры — как у TaskManager PostgreSQL)"""
+        created_date = datetime.now()
+        available = publish_at is None or publish_at <= created_date
+        conn = SQLiteDB.connection()
+        for _ in range(ID_INSERT_ATTEMPTS):
+            task_id = generate_id()
+            cursor = conn.execute('''
+                INSERT INTO tasks (
+                    task_id, title, description, type, target, reward,
+                    requirements, created_by, created_date, active, available,
+                    publish_at, expires_at, claim_timeout, capacity, slots_left, slots_done
+                ) VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9, true, ?10, ?11, ?12, ?13, ?14, ?14, 0)
+                ON CONFLICT (task_id) DO NOTHING
+            ''', (task_id, title, description, task_type, target, reward,
+                  requirements, created_by, created_date, available,
+                  publish_at, expires_at, claim_timeout, capacity))
+            if cursor.rowcount == 1:
+                SQLiteDB.notify('tasks', 'I', task_id)
+                return task_id
+        raise RuntimeError("Не удалось сгенерировать уникальный ID задания")
+
+    @staticmethod
+    async def get_available_tasks(task_type: Optional[str] = None, limit: Optional[int] = None) -> List[TaskListItem]:
+        """Получение списка доступных заданий"""
+        rows = SQLiteDB.connection().execute(f'''
+            SELECT {TaskListItem.columns()} FROM tasks
+            WHERE {OPEN_CONDITION} AND (?1 IS NULL OR type = ?1)
+            ORDER BY created_date DESC
+            LIMIT ?2
+        ''', (task_type, _limit(limit))).fetchall()
+        return TaskListItem.from_records(rows)
+
+    @staticmethod
+    async def search_tasks(text: Optional[str] = None, task_type: Optional[str] = None,
+                           min_reward: Optional[float] = None, max_reward: Optional[float] = None,
+                           limit: int = 10, offset: int = 0) -> Tuple[List[TaskListItem], bool]:
+        """Поиск открытых заданий по словам, типу и диапазону вознаграждения
+
+        Каждое слово должно встретиться в заголовке, описании или требованиях;
+        задания, где слова есть в заголовке, идут первыми. Морфологии, как у
+        полнотекстового поиска PostgreSQL, здесь нет.
+        """
+        conditions = [OPEN_CONDITION]
+        args: List = []
+        order = 'created_date DESC, task_id DESC'
+        words = [word.casefold() for word in (text or '').split()]
+        if words:
+            document = "casefold(coalesce(title, '') || ' ' || coalesce(description, '') || ' ' || coalesce(requirements, ''))"
+            title_hits = []
+            for word in words:
+                args.append(word)
+                conditions.append(f"instr({document}, ?{len(args)}) > 0")
+                title_hits.append(f"(instr(casefold(coalesce(title, '')), ?{len(args)}) > 0)")
+            order = f"{' + '.join(title_hits)} DESC, " + order
+        if task_type:
+            args.append(task_type)
+            conditions.append(f"type = ?{len(args)}")
+        if min_reward is not None:
+            args.append(min_reward)
+            conditions.append(f"reward >= ?{len(args)}")
+        if max_reward is not None:
+            args.append(max_reward)
+            conditions.append(f"reward <= ?{len(args)}")
+        args.extend([limit + 1, offset])
+        rows = SQLiteDB.connection().execute(f'''
+            SELECT {TaskListItem.columns()} FROM tasks
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {order}
+            LIMIT ?{len(args) - 1} OFFSET ?{len(args)}
+        ''', args).fetchall()
+        return TaskListItem.from_records(rows[:limit]), len(rows) > limit
+
+    @staticmethod
+    async def count_available_by_type() -> Dict[str, int]:
+        """Количество доступных заданий по типам"""
+        rows = SQLiteDB.connection().execute(f'''
+            SELECT type, COUNT(*) AS count FROM tasks
+            WHERE {OPEN_CONDITION}
+            GROUP BY type
+        ''').fetchall()
+        return {row['type']: row['count'] for row in rows}
+
+    @staticmethod
+    async def get_task(task_id: str) -> Optional[TaskDetail]:
+        """Получение задания по ID"""
+        row = SQLiteDB.connection().execute(
+            f'SELECT {TaskDetail.columns()} FROM tasks WHERE task_id = ?',
+            (task_id,)
+        ).fetchone()
+        return TaskDetail.from_record(row)
+
+    @staticmethod
+    async def take_task(task_id: str, user_id: int, username: str) -> Optional[TakenTask]:
+        """Взятие задания в одной транзакции: место, ссылка и ожидающая выдача
+
+        Те же шаги, что у серверной функции take_task в PostgreSQL.
+        """
+        now = datetime.now()
+        with SQLiteDB.transaction() as conn:
+            # Исполнитель уже держит или выполнил это задание
+            if conn.execute('''
+                SELECT 1 FROM user_tasks
+                WHERE user_id = ? AND task_id = ? AND status <> 'expired'
+            ''', (user_id, task_id)).fetchone():
+                return None
+            cursor = conn.execute(f'''
+                UPDATE tasks
+                SET slots_left = slots_left - 1, available = slots_left > 1
+                WHERE task_id = ? AND {OPEN_CONDITION} AND slots_left > 0
+            ''', (task_id,))
+            if cursor.rowcount == 0:
+                return None
+            task = TakenTask.from_record(conn.execute(
+                f'SELECT {TakenTask.columns()} FROM tasks WHERE task_id = ?', (task_id,)
+            ).fetchone())
+            timeout = task.claim_timeout if task.claim_timeout is not None else CLAIM_TIMEOUT_MINUTES
+            task.claim_deadline = now + timedelta(minutes=timeout)
+            conn.execute('''
+                INSERT INTO user_tasks (user_id, task_id, status, taken_date, deadline)
+                VALUES (?, ?, 'active', ?, ?)
+                ON CONFLICT (user_id, task_id) DO UPDATE SET
+                    status = 'active',
+                    taken_date = excluded.taken_date,
+                    completed_date = NULL,
+                    deadline = excluded.deadline,
+                    proof = NULL
+            ''', (user_id, task_id, now, task.claim_deadline))
+
+            for _ in range(ID_INSERT_ATTEMPTS):
+                link_id = generate_id()
+                cursor = conn.execute('''
+                    INSERT INTO tracking_links (link_id, user_id, task_id, created, clicks, conversions, active)
+                    VALUES (?, ?, ?, ?, 0, 0, true)
+                    ON CONFLICT (link_id) DO NOTHING
+                ''', (link_id, user_id, task_id, now))
+                if cursor.rowcount == 1:
+                    break
+            else:
+                raise RuntimeError("Не удалось сгенерировать уникальный ID ссылки")
+            task.tracking_link = TaskManager.tracking_url(link_id)
+
+            conn.execute('''
+                INSERT INTO pending_links (task_id, user_id, username, task_title, message_sent, tracking_link)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (task_id, user_id) DO UPDATE SET
+                    username = excluded.username,
+                    task_title = excluded.task_title,
+                    message_sent = excluded.message_sent,
+                    tracking_link = excluded.tracking_link
+            ''', (task_id, user_id, username, task.title, now, task.tracking_link))
+        SQLiteDB.notify('tasks', 'U', task_id)
+        SQLiteDB.notify('pending_links', 'I', task_id)
+        return task
+
+    @staticmethod
+    async def complete_task(task_id: str, user_id: int, proof: str = "") -> Optional[TaskDetail]:
+        """Завершение взятия с начислением награды; возвращает задание или None"""
+        completed_at = datetime.now()
+        with SQLiteDB.transaction() as conn:
+            # Условие status = 'active' не дает начислить награду дважды
+            cursor = conn.execute('''
+                UPDATE user_tasks
+                SET status = 'completed', completed_date = ?, proof = ?
+                WHERE user_id = ? AND task_id = ? AND status = 'active'
+            ''', (completed_at, proof, user_id, task_id))
+            if cursor.rowcount == 0:
+                return None
+            conn.execute('''
+                UPDATE tasks
+                SET slots_done = slots_done + 1,
+                    proof = ?1,
+                    completed = slots_done + 1 >= capacity,
+                    completed_date = CASE WHEN slots_done + 1 >= capacity THEN ?2 ELSE completed_date END,
+                    active = active AND slots_done + 1 < capacity
+                WHERE task_id = ?3
+            ''', (proof, completed_at, task_id))
+            task = TaskDetail.from_record(conn.execute(
+                f'SELECT {TaskDetail.columns()} FROM tasks WHERE task_id = ?', (task_id,)
+            ).fetchone())
+            conn.execute(
+                'UPDATE users SET earned = earned + ? WHERE user_id = ?',
+                (task.reward or 0, user_id)
+            )
+        SQLiteDB.notify('tasks', 'U', task_id)
+        Leaderboards.apply(task_id, user_id, task.reward or 0, completed_at)
+        return task
+
+    @staticmethod
+    async def issue_work_link(task_id: str, link: str, user_id: Optional[int] = None) -> Optional[Dict]:
+        """Выдача рабочей ссылки: сохранение и снятие из ожидающих
+
+        user_id=None — самому раннему ожидающему исполнителю задания.
+        Возвращает запись ожидающей ссылки с названием задания или None.
+        """
+        with SQLiteDB.transaction() as conn:
+            row = conn.execute('''
+                SELECT p.*, t.title FROM pending_links p
+                JOIN tasks t ON t.task_id = p.task_id
+                WHERE p.task_id = ?1 AND (?2 IS NULL OR p.user_id = ?2)
+                ORDER BY p.message_sent
+                LIMIT 1
+            ''', (task_id, user_id)).fetchone()
+            if not row:
+                return None
+            conn.execute(
+                'DELETE FROM pending_links WHERE task_id = ? AND user_id = ?',
+                (task_id, row['user_id'])
+            )
+            conn.execute('''
+                UPDATE tracking_links SET work_link = ?
+                WHERE task_id = ? AND user_id = ? AND active
+            ''', (link, task_id, row['user_id']))
+        SQLiteDB.notify('pending_links', 'D', task_id)
+        return dict(row)
+
+    @staticmethod
+    async def issue_work_links(links: Dict[Tuple[str, Optional[int]], str]) -> List[Dict]:
+        """Массовая выдача рабочих ссылок в одной транзакции
+
+        links: (task_id, user_id) -> ссылка; user_id=None — всем ожидающим
+        исполнителям задания. Строки с конкретным исполнителем обрабатываются
+        первыми, поэтому они важнее строки на все задание.
+        """
+        issued: List[Dict] = []
+        with SQLiteDB.transaction() as conn:
+            for (task_id, user_id), link in sorted(links.items(), key=lambda item: item[0][1] is None):
+                rows = conn.execute('''
+                    SELECT p.*, t.title FROM pending_links p
+                    JOIN tasks t ON t.task_id = p.task_id
+                    WHERE p.task_id = ?1 AND (?2 IS NULL OR p.user_id = ?2)
+                ''', (task_id, user_id)).fetchall()
+                keys = [(task_id, row['user_id']) for row in rows]
+                conn.executemany('DELETE FROM pending_links WHERE task_id = ? AND user_id = ?', keys)
+                conn.executemany('''
+                    UPDATE tracking_links SET work_link = ?
+                    WHERE task_id = ? AND user_id = ? AND active
+                ''', [(link, *key) for key in keys])
+                issued.extend({**dict(row), 'link': link} for row in rows)
+        for task_id in {row['task_id'] for row in issued}:
+            SQLiteDB.notify('pending_links', 'D', task_id)
+        return issued
+
+    @staticmethod
+    async def next_deadlines(until: datetime, limit: int) -> List[Tuple[str, datetime]]:
+        """Ближайшие сроки заданий и взятий до момента until"""
+        rows = SQLiteDB.connection().execute('''
+            SELECT task_id, deadline AS "deadline [TIMESTAMP]" FROM (
+                SELECT task_id, deadline FROM tasks
+                WHERE deadline IS NOT NULL AND deadline <= ?1
+                UNION ALL
+                SELECT task_id, deadline FROM user_tasks
+                WHERE status = 'active' AND deadline <= ?1
+            )
+            ORDER BY deadline
+            LIMIT ?2
+        ''', (until, limit)).fetchall()
+        return [(row['task_id'], row['deadline']) for row in rows]
+
+    @staticmethod
+    async def sweep_deadlines(now: datetime, limit: int) -> List[DueTask]:
+        """Обработка наступивших сроков: до limit заданий и до limit взятий
+
+        publish — задание публикуется; expire — снимается с приема; claim —
+        место исполнителя возвращается, его ожидающая выдача и ссылка снимаются.
+        """
+        with SQLiteDB.transaction() as conn:
+            tasks = DueTask.from_records(conn.execute(f'''
+                SELECT {DueTask.columns()} FROM tasks
+                WHERE deadline IS NOT NULL AND deadline <= ?
+                ORDER BY deadline
+                LIMIT ?
+            ''', (now, limit)).fetchall())
+            conn.executemany(
+                'UPDATE tasks SET available = true WHERE task_id = ?',
+                [(task.task_id,) for task in tasks if task.deadline_kind == 'publish']
+            )
+            conn.executemany(
+                'UPDATE tasks SET active = false, available = false WHERE task_id = ?',
+                [(task.task_id,) for task in tasks if task.deadline_kind == 'expire']
+            )
+
+            claims = conn.execute('''
+                SELECT ut.user_id, ut.task_id, t.title FROM user_tasks ut
+                JOIN tasks t ON t.task_id = ut.task_id
+                WHERE ut.status = 'active' AND ut.deadline <= ?
+                ORDER BY ut.deadline
+                LIMIT ?
+            ''', (now, limit)).fetchall()
+            keys = [(row['user_id'], row['task_id']) for row in claims]
+            conn.executemany(
+                "UPDATE user_tasks SET status = 'expired' WHERE user_id = ? AND task_id = ?", keys
+            )
+            # Задание освобождается и от прежнего единственного исполнителя (taken_by)
+            conn.executemany('''
+                UPDATE tasks
+                SET slots_left = slots_left + 1, available = active,
+                    taken_by = NULL, assigned_date = NULL
+                WHERE task_id = ?
+            ''', [(task_id,) for _, task_id in keys])
+            conn.executemany(
+                'DELETE FROM pending_links WHERE user_id = ? AND task_id = ?', keys
+            )
+            conn.executemany(
+                'UPDATE tracking_links SET active = false WHERE user_id = ? AND task_id = ?', keys
+            )
+            tasks += [
+                DueTask(task_id=row['task_id'], deadline_kind='claim', taken_by=row['user_id'], title=row['title'])
+                for row in claims
+            ]
+        for task_id in {task.task_id for task in tasks}:
+            SQLiteDB.notify('tasks', 'U', task_id)
+        return tasks
+
+    @staticmethod
+    async def get_user_tasks(user_id: int, status: str, limit: Optional[int] = None) -> List[UserTaskRow]:
+        """Взятия пользователя с заданным статусом (выполненные — последние первыми)"""
+        rows = SQLiteDB.connection().execute('''
+            SELECT t.task_id, t.title, t.reward, ut.deadline FROM tasks t
+            JOIN user_tasks ut ON t.task_id = ut.task_id
+            WHERE ut.user_id = ? AND ut.status = ?
+            ORDER BY ut.completed_date IS NULL, ut.completed_date DESC, ut.taken_date
+            LIMIT ?
+        ''', (user_id, status, _limit(limit))).fetchall()
+        return UserTaskRow.from_records(rows)
+
+    @staticmethod
+    async def get_recent_tasks(limit: int) -> List[TaskAdminRow]:
+        """Последние созданные задания для админских списков"""
+        rows = SQLiteDB.connection().execute(f'''
+            SELECT {TaskAdminRow.columns()} FROM tasks
+            ORDER BY created_date DESC
+            LIMIT ?
+        ''', (limit,)).fetchall()
+        return TaskAdminRow.from_records(rows)
+
+    @staticmethod
+    async def get_dashboard_counters() -> Dict:
+        """Счетчики админ-панели одним запросом"""
+        row = SQLiteDB.connection().execute('''
+            SELECT
+                (SELECT COUNT(*) FROM pending_links) AS pending_count,
+                (SELECT COUNT(*) FROM users) AS total_users,
+                COUNT(*) AS total_tasks,
+                COUNT(*) FILTER (WHERE active) AS active_tasks,
+                COUNT(*) FILTER (
+                    WHERE active AND slots_left + slots_done < capacity
+                ) AS in_progress_tasks,
+                COUNT(*) FILTER (WHERE completed) AS completed_tasks,
+                COALESCE(SUM(reward * slots_done), 0) AS total_payout
+            FROM tasks
+        ''').fetchone()
+        return dict(row)
+
+    @staticmethod
+    async def get_completion_totals(start: datetime, end: datetime) -> Dict:
+        """Выполненные взятия и выплаты за период, число активных пользователей"""
+        row = SQLiteDB.connection().execute('''
+            SELECT
+                COUNT(*) AS count,
+                COALESCE(SUM(t.reward), 0) AS earnings,
+                (SELECT COUNT(DISTINCT user_id) FROM user_tasks) AS active_users
+            FROM user_tasks ut
+            JOIN tasks t ON t.task_id = ut.task_id
+            WHERE ut.status = 'completed' AND ut.completed_date BETWEEN ? AND ?
+        ''', (start, end)).fetchone()
+        return dict(row)
+
+    @staticmethod
+    async def get_top_earners(start: datetime, end: datetime, limit: int) -> List[Tuple[int, float]]:
+        """Лучшие исполнители за период: (user_id, заработок), порядок как у LeaderBoard.top"""
+        rows = SQLiteDB.connection().execute('''
+            SELECT ut.user_id, SUM(t.reward) AS earned
+            FROM user_tasks ut
+            JOIN tasks t ON t.task_id = ut.task_id
+            WHERE ut.status = 'completed' AND ut.completed_date BETWEEN ? AND ?
+            GROUP BY ut.user_id
+            ORDER BY earned DESC, ut.user_id
+            LIMIT ?
+        ''', (start, end, limit)).fetchall()
+        return [(row['user_id'], row['earned']) for row in rows]
+
+    @staticmethod
+    async def get_leaderboard_snapshot(week_start: datetime, day_start: datetime,
+                                       recent_since: datetime) -> Tuple[List, List]:
+        """Суммы заработка по исполнителям (total/week/day) и недавние выполнения"""
+        conn = SQLiteDB.connection()
+        rows = conn.execute('''
+            SELECT ut.user_id,
+                SUM(t.reward) AS total,
+                SUM(t.reward) FILTER (WHERE ut.completed_date >= ?1) AS week,
+                SUM(t.reward) FILTER (WHERE ut.completed_date >= ?2) AS day
+            FROM user_tasks ut
+            JOIN tasks t ON t.task_id = ut.task_id
+            WHERE ut.status = 'completed'
+            GROUP BY ut.user_id
+        ''', (week_start, day_start)).fetchall()
+        recent = conn.execute('''
+            SELECT task_id, user_id FROM user_tasks
+            WHERE status = 'completed' AND completed_date >= ?
+        ''', (recent_since,)).fetchall()
+        return rows, recent
+
+
+class AdminManager(AdminStore):
+    @staticmethod
+    async def is_admin(user_id: int) -> bool:
+        """Проверка, является ли пользователь админом"""
+        if user_id == MAIN_ADMIN_ID:
+            return True
+        return SQLiteDB.connection().execute(
+            'SELECT 1 FROM admins WHERE user_id = ?', (user_id,)
+        ).fetchone() is not None
+
+    @staticmethod
+    async def is_main_admin(user_id: int) -> bool:
+        """Проверка, является ли пользователь главным админом"""
+        return user_id == MAIN_ADMIN_ID
+
+    @staticmethod
+    async def add_admin(user_id: int, username: str = "", added_by: int = None):
+        """Добавление администратора"""
+        SQLiteDB.connection().execute('''
+            INSERT INTO admins (user_id, username, added_by, added_date, permissions)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                username = excluded.username,
+                added_by = excluded.added_by,
+                added_date = excluded.added_date,
+                permissions = excluded.permissions
+        ''', (user_id, username, added_by, datetime.now(),
+              json.dumps(["manage_tasks", "view_stats"])))
+        SQLiteDB.notify('admins', 'I', str(user_id))
+
+    @staticmethod
+    async def remove_admin(user_id: int) -> bool:
+        """Удаление администратора"""
+        cursor = SQLiteDB.connection().execute('DELETE FROM admins WHERE user_id = ?', (user_id,))
+        SQLiteDB.notify('admins', 'D', str(user_id))
+        return cursor.rowcount == 1
+
+    @staticmethod
+    async def get_all_admins() -> List[Dict]:
+        """Получение всех администраторов"""
+        rows = SQLiteDB.connection().execute('SELECT * FROM admins').fetchall()
+        return [dict(row) for row in rows]
+
+
+class PendingLinksManager(PendingLinkStore):
+    @staticmethod
+    async def save_pending(task_id: str, data: Dict):
+        """Сохранение ожидающей ссылки исполнителя"""
+        SQLiteDB.connection().execute('''
+            INSERT INTO pending_links (task_id, user_id, username, task_title, message_sent, tracking_link)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (task_id, user_id) DO UPDATE SET
+                username = excluded.username,
+                task_title = excluded.task_title,
+                message_sent = excluded.message_sent,
+                tracking_link = excluded.tracking_link
+        ''', (task_id, data['user_id'], data['username'], data['task_title'],
+              data['message_sent'], data['tracking_link']))
+        SQLiteDB.notify('pending_links', 'I', task_id)
+
+    @staticmethod
+    async def get_pending(task_id: str, user_id: Optional[int] = None) -> Optional[Dict]:
+        """Получение ожидающей ссылки (user_id=None — самой ранней по заданию)"""
+        row = SQLiteDB.connection().execute('''
+            SELECT * FROM pending_links
+            WHERE task_id = ?1 AND (?2 IS NULL OR user_id = ?2)
+            ORDER BY message_sent
+            LIMIT 1
+        ''', (task_id, user_id)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    async def delete_pending(task_id: str, user_id: Optional[int] = None):
+        """Удаление ожидающей ссылки (user_id=None — всех по заданию)"""
+        SQLiteDB.connection().execute('''
+            DELETE FROM pending_links
+            WHERE task_id = ?1 AND (?2 IS NULL OR user_id = ?2)
+        ''', (task_id, user_id))
+        SQLiteDB.notify('pending_links', 'D', task_id)
+
+    @staticmethod
+    async def get_all_pending(limit: Optional[int] = None) -> List[Dict]:
+        """Получение ожидающих ссылок (самые старые первыми)"""
+        rows = SQLiteDB.connection().execute(
+            'SELECT * FROM pending_links ORDER BY message_sent LIMIT ?',
+            (_limit(limit),)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+class TrackingLinksManager(TrackingLinkStore):
+    @staticmethod
+    async def get_link(link_id: str) -> Optional[Dict]:
+        """Получение ссылки по ID"""
+        row = SQLiteDB.connection().execute(
+            'SELECT * FROM tracking_links WHERE link_id = ?', (link_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    async def register_click(link_id: str) -> Optional[Dict]:
+        """Учет перехода: счетчик кликов и данные ссылки"""
+        conn = SQLiteDB.connection()
+        conn.execute('UPDATE tracking_links SET clicks = clicks + 1 WHERE link_id = ?', (link_id,))
+        row = conn.execute('SELECT * FROM tracking_links WHERE link_id = ?', (link_id,)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    async def increment_clicks(link_id: str):
+        """Увеличение счетчика кликов"""
+        SQLiteDB.connection().execute(
+            'UPDATE tracking_links SET clicks = clicks + 1 WHERE link_id = ?', (link_id,)
+        )
+
+    @staticmethod
+    async def add_conversion(link_id: str):
+        """Добавление конверсии"""
+        SQLiteDB.connection().execute(
+            'UPDATE tracking_links SET conversions = conversions + 1 WHERE link_id = ?', (link_id,)
+        )
+
+
+class ReportQueueManager(ReportQueueStore):
+    @staticmethod
+    async def push(entry_id: str, payload: Dict):
+        """Сохранение отчета до отправки сводкой"""
+        SQLiteDB.connection().execute(
+            'INSERT OR IGNORE INTO report_queue (entry_id, created, payload) VALUES (?, ?, ?)',
+            (entry_id, datetime.now(), json.dumps(payload, ensure_ascii=False))
+        )
+
+    @staticmethod
+    async def remove(entry_ids: List[str]):
+        """Удаление отправленных отчетов"""
+        SQLiteDB.connection().executemany(
+            'DELETE FROM report_queue WHERE entry_id = ?', [(entry_id,) for entry_id in entry_ids]
+        )
+
+    @staticmethod
+    async def claim_stale(before: datetime, now: datetime) -> List[Tuple[str, Dict]]:
+        """Перехват отчетов, сохраненных раньше before: их время становится now"""
+        with SQLiteDB.transaction() as conn:
+            rows = conn.execute(
+                'SELECT entry_id, payload FROM report_queue WHERE created < ? ORDER BY entry_id', (before,)
+            ).fetchall()
+            conn.execute('UPDATE report_queue SET created = ? WHERE created < ?', (now, before))
+        return [(row['entry_id'], json.loads(row['payload'])) for row in rows]
+
+
+class SettingsManager(SettingsStore):
+    @staticmethod
+    async def get_all() -> Dict[str, str]:
+        """Все сохраненные настройки: ключ -> значение"""
+        rows = SQLiteDB.connection().execute('SELECT key, value FROM settings').fetchall()
+        return {row['key']: row['value'] for row in rows}
+
+    @staticmethod
+    async def set(key: str, value: Optional[str], updated_by: Optional[int] = None):
+        """Сохранение настройки; None — удаление (действует значение по умолчанию)"""
+        conn = SQLiteDB.connection()
+        if value is None:
+            conn.execute('DELETE FROM settings WHERE key = ?', (key,))
+            SQLiteDB.notify('settings', 'D', key)
+            return
+        conn.execute('''
+            INSERT INTO settings (key, value, updated_by, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                value = excluded.value,
+                updated_by = excluded.updated_by,
+                updated_at = excluded.updated_at
+        ''', (key, value, updated_by, datetime.now()))
+        SQLiteDB.notify('settings', 'U', key)
+
+
+# Снимок админ-панели обновляется по локальным изменениям
+SQLiteDB.subscribe('tasks', AdminDashboard.nudge)
+SQLiteDB.subscribe('pending_links', AdminDashboard.nudge)
@@ -0,0 +1,263 @@
+import inspect
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from models import DueTask, TakenTask, TaskAdminRow, TaskDetail, TaskListItem, UserTaskRow
+
+
+class UserStore(ABC):
+    """Пользователи и их заработок"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_or_create_user(user_id: int, username: str = "", first_name: str = "") -> Optional[Dict]:
+        """Получение пользователя; новый создается (тогда возвращается None)"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_user_stats(user_id: int) -> Dict:
+        """Выполнено, в работе, заработано и рейтинг"""
+
+    @staticmethod
+    @abstractmethod
+    async def add_earned(user_id: int, amount: float):
+        """Добавление заработка пользователю"""
+
+
+class TaskStore(ABC):
+    """Задания, места исполнителей и сроки"""
+
+    @staticmethod
+    @abstractmethod
+    async def create_task(title: str, description: str, task_type: str, target: str,
+                          reward: float, created_by: int, requirements: str = "",
+                          publish_at: Optional[datetime] = None,
+                          expires_at: Optional[datetime] = None,
+                          claim_timeout: Optional[int] = None, capacity: int = 1) -> str:
+        """Создание задания; возвращает его ID"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_available_tasks(task_type: Optional[str] = None,
+                                  limit: Optional[int] = None) -> List[TaskListItem]:
+        """Открытые задания, новые первыми"""
+
+    @staticmethod
+    @abstractmethod
+    async def search_tasks(text: Optional[str] = None, task_type: Optional[str] = None,
+                           min_reward: Optional[float] = None, max_reward: Optional[float] = None,
+                           limit: int = 10, offset: int = 0) -> Tuple[List[TaskListItem], bool]:
+        """Страница поиска открытых заданий и признак следующей страницы"""
+
+    @staticmethod
+    @abstractmethod
+    async def count_available_by_type() -> Dict[str, int]:
+        """Количество открытых заданий по типам"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_task(task_id: str) -> Optional[TaskDetail]:
+        """Карточка задания"""
+
+    @staticmethod
+    @abstractmethod
+    async def take_task(task_id: str, user_id: int, username: str) -> Optional[TakenTask]:
+        """Взятие места; None — мест нет или задание уже взято этим пользователем"""
+
+    @staticmethod
+    @abstractmethod
+    async def complete_task(task_id: str, user_id: int, proof: str = "") -> Optional[TaskDetail]:
+        """Сдача взятого места с начислением награды; None — взятия нет"""
+
+    @staticmethod
+    @abstractmethod
+    async def issue_work_link(task_id: str, link: str, user_id: Optional[int] = None) -> Optional[Dict]:
+        """Выдача рабочей ссылки ожидающему исполнителю"""
+
+    @staticmethod
+    @abstractmethod
+    async def issue_work_links(links: Dict[Tuple[str, Optional[int]], str]) -> List[Dict]:
+        """Массовая выдача рабочих ссылок в одной транзакции"""
+
+    @staticmethod
+    @abstractmethod
+    async def next_deadlines(until: datetime, limit: int) -> List[Tuple[str, datetime]]:
+        """Ближайшие сроки заданий и взятий до момента until"""
+
+    @staticmethod
+    @abstractmethod
+    async def sweep_deadlines(now: datetime, limit: int) -> List[DueTask]:
+        """Обработка наступивших сроков: публикация, окончание, возврат мест"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_user_tasks(user_id: int, status: str, limit: Optional[int] = None) -> List[UserTaskRow]:
+        """Взятия пользователя с заданным статусом (выполненные — последние первыми)"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_recent_tasks(limit: int) -> List[TaskAdminRow]:
+        """Последние созданные задания для админских списков"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_dashboard_counters() -> Dict:
+        """Счетчики админ-панели"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_completion_totals(start: datetime, end: datetime) -> Dict:
+        """Выполненные взятия и выплаты за период, число активных пользователей"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_top_earners(start: datetime, end: datetime, limit: int) -> List[Tuple[int, float]]:
+        """Лучшие исполнители за период: (user_id, заработок)"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_leaderboard_snapshot(week_start: datetime, day_start: datetime,
+                                       recent_since: datetime) -> Tuple[List, List]:
+        """Суммы заработка по исполнителям и недавние выполнения (одним снимком)"""
+
+
+class AdminStore(ABC):
+    """Администраторы"""
+
+    @staticmethod
+    @abstractmethod
+    async def is_admin(user_id: int) -> bool:
+        """Является ли пользователь админом"""
+
+    @staticmethod
+    @abstractmethod
+    async def is_main_admin(user_id: int) -> bool:
+        """Является ли пользователь главным админом"""
+
+    @staticmethod
+    @abstractmethod
+    async def add_admin(user_id: int, username: str = "", added_by: int = None):
+        """Добавление администратора"""
+
+    @staticmethod
+    @abstractmethod
+    async def remove_admin(user_id: int) -> bool:
+        """Удаление администратора"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_all_admins() -> List[Dict]:
+        """Все администраторы"""
+
+
+class PendingLinkStore(ABC):
+    """Исполнители, ожидающие рабочую ссылку"""
+
+    @staticmethod
+    @abstractmethod
+    async def save_pending(task_id: str, data: Dict):
+        """Сохранение ожидающей ссылки исполнителя"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_pending(task_id: str, user_id: Optional[int] = None) -> Optional[Dict]:
+        """Ожидающая ссылка (user_id=None — самая ранняя по заданию)"""
+
+    @staticmethod
+    @abstractmethod
+    async def delete_pending(task_id: str, user_id: Optional[int] = None):
+        """Удаление ожидающей ссылки (user_id=None — всех по заданию)"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_all_pending(limit: Optional[int] = None) -> List[Dict]:
+        """Ожидающие ссылки, самые старые первыми"""
+
+
+class TrackingLinkStore(ABC):
+    """Отслеживающие ссылки исполнителей"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_link(link_id: str) -> Optional[Dict]:
+        """Ссылка по ID"""
+
+    @staticmethod
+    @abstractmethod
+    async def register_click(link_id: str) -> Optional[Dict]:
+        """Учет перехода; возвращает ссылку или None"""
+
+    @staticmethod
+    @abstractmethod
+    async def increment_clicks(link_id: str):
+        """Увеличение счетчика кликов"""
+
+    @staticmethod
+    @abstractmethod
+    async def add_conversion(link_id: str):
+        """Добавление конверсии"""
+
+
+class ReportQueueStore(ABC):
+    """Отчеты о выполнении, ожидающие отправки сводкой"""
+
+    @staticmethod
+    @abstractmethod
+    async def push(entry_id: str, payload: Dict):
+        """Сохранение отчета до отправки"""
+
+    @staticmethod
+    @abstractmethod
+    async def remove(entry_ids: List[str]):
+        """Удаление отправленных отчетов"""
+
+    @staticmethod
+    @abstractmethod
+    async def claim_stale(before: datetime, now: datetime) -> List[Tuple[str, Dict]]:
+        """Перехват отчетов, сохраненных раньше before: их время становится now"""
+
+
+class SettingsStore(ABC):
+    """Настройки бота, которые админы меняют без перезапуска"""
+
+    @staticmethod
+    @abstractmethod
+    async def get_all() -> Dict[str, str]:
+        """Все сохраненные настройки: ключ -> значение"""
+
+    @staticmethod
+    @abstractmethod
+    async def set(key: str, value: Optional[str], updated_by: Optional[int] = None):
+        """Сохранение настройки; None — удаление (действует значение по умолчанию)"""
+
+
+# Интерфейс -> имя менеджера, под которым бот его использует
+STORES = {
+    UserStore: 'UserManager',
+    TaskStore: 'TaskManager',
+    AdminStore: 'AdminManager',
+    PendingLinkStore: 'PendingLinksManager',
+    TrackingLinkStore: 'TrackingLinksManager',
+    ReportQueueStore: 'ReportQueueManager',
+    SettingsStore: 'SettingsManager',
+}
+
+
+def check_contract(manager: type, interface: type):
+    """Проверка, что менеджер реализует интерфейс: те же корутины и параметры
+
+    Менеджеры не создают экземпляров, поэтому ABC сам пропуск метода не
+    заметит — проверка выполняется при выборе хранилища.
+    """
+    for name in sorted(interface.__abstractmethods__):
+        method = getattr(manager, name, None)
+        if not inspect.iscoroutinefunction(method):
+            raise TypeError(f"{manager.__module__}.{manager.__name__}.{name} не реализован как корутина")
+        expected = inspect.signature(getattr(interface, name)).parameters
+        actual = inspect.signature(method).parameters
+        missing = [param for param in expected if param not in actual]
+        if missing:
+            raise TypeError(
+                f"{manager.__module__}.{manager.__name__}.{name}: нет параметров {', '.join(missing)}"
+            )
@@ -0,0 +1,201 @@
+import html
+import string
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional
+
+from telegram.helpers import escape_markdown
+
+# Сколько различных экранированных значений помнит процесс
+ESCAPE_CACHE_SIZE = 4096
+
+_FORMATTER = string.Formatter()
+
+
+class Markup(str):
+    """Готовая разметка: при подстановке в шаблон не экранируется"""
+
+    __slots__ = ()
+
+
+def join(parts: Iterable[str], separator: str = "") -> Markup:
+    """Склейка отрисованных фрагментов (строки без разметки сюда не передаются)"""
+    return Markup(separator.join(parts))
+
+
+def _markdown_entities(literals: List[str]) -> List[Optional[str]]:
+    """Сущность Markdown, открытая в конце каждого фрагмента: ее закрывающая последовательность
+
+    Разбор повторяет правила Telegram для Markdown (v1): внутри сущности
+    экранирования нет, она заканчивается первым своим закрывающим символом.
+    """
+    entities = []
+    end = None
+    for literal in literals:
+        i = 0
+        while i < len(literal):
+            if end is None:
+                char = literal[i]
+                if char == '\\' and literal[i + 1:i + 2] in ('_', '*', '`', '['):
+                    i += 2
+                    continue
+                if literal.startswith('```', i):
+                    end = '```'
+                    i += 3
+                    continue
+                if char in '_*`':
+                    end = char
+                elif char == '[':
+                    end = ']'
+                i += 1
+            elif literal.startswith(end, i):
+                i += len(end)
+                # После текста ссылки идет ее адрес в скобках
+                end = ')' if end == ']' and literal.startswith('(', i) else None
+                if end:
+                    i += 1
+            else:
+                i += 1
+        entities.append(end)
+    return entities
+
+
+def _markdown_v2_entities(literals: List[str]) -> List[Optional[str]]:
+    """То же для MarkdownV2: экранирование отличается только в коде и адресе ссылки"""
+    entities = []
+    end = None
+    for literal in literals:
+        i = 0
+        while i < len(literal):
+            if end is None:
+                if literal[i] == '\\':
+                    i += 2
+                    continue
+                if literal.startswith('```', i):
+                    end = '```'
+                    i += 3
+                elif literal.startswith('](', i):
+                    end = ')'
+                    i += 2
+                else:
+                    end = '`' if literal[i] == '`' else None
+                    i += 1
+            elif literal[i] == '\\':
+                i += 2
+            elif literal.startswith(end, i):
+                i += len(end)
+                end = None
+            else:
+                i += 1
+        entities.append(end)
+    return entities
+
+
+def _no_entities(literals: List[str]) -> List[Optional[str]]:
+    return [None] * len(literals)
+
+
+# Режим разметки -> разбор сущностей шаблона
+_ENTITY_PARSERS: Dict[Optional[str], Callable[[List[str]], List[Optional[str]]]] = {
+    'Markdown': _markdown_entities,
+    'MarkdownV2': _markdown_v2_entities,
+    'HTML': _no_entities,
+    None: _no_entities,
+}
+
+
+@lru_cache(maxsize=ESCAPE_CACHE_SIZE)
+def _escape(parse_mode: Optional[str], entity: Optional[str], text: str) -> str:
+    """Значение поля, безопасное для parse_mode внутри сущности entity"""
+    if parse_mode == 'Markdown':
+        if entity is None:
+            return escape_markdown(text)
+        if entity in ('*', '_', '`'):
+            # Экранировать внутри сущности нельзя: она закрывается и открывается заново
+            return text.replace(entity, f"{entity}\\{entity}{entity}")
+        if entity == '```':
+            return text.replace('```', '``\u200b`')
+        if entity == ']':
+            return text.replace(']', '］')
+        return text.replace(')', '%29')
+    if parse_mode == 'MarkdownV2':
+        entity_type = {'`': 'code', '```': 'pre', ')': 'text_link'}.get(entity)
+        return escape_markdown(text, version=2, entity_type=entity_type)
+    if parse_mode == 'HTML':
+        return html.escape(text)
+    return text
+
+
+class _Field:
+    __slots__ = ('name', 'spec', 'conversion', 'entity')
+
+    def __init__(self, name: str, spec: str, conversion: Optional[str], entity: Optional[str]):
+        self.name = name
+        self.spec = spec
+        self.conversion = conversion
+        self.entity = entity
+
+
+class Template:
+    """Шаблон сообщения, разобранный один раз при создании
+
+    Текст шаблона — разметка parse_mode, поля {имя[.атрибут|[ключ]][!r][:формат]}
+    заполняются при отрисовке. Значения полей экранируются для parse_mode с
+    учетом сущности, внутри которой стоит поле (в `коде` и в тексте правила
+    разные), поэтому подчеркивания и звездочки в названиях заданий и именах
+    не ломают сообщение. Markup (в том числе результат другого шаблона)
+    подставляется как есть. Шаблон без полей отрисовывается один раз.
+    """
+
+    __slots__ = ('source', 'parse_mode', '_parts', '_static')
+
+    def __init__(self, source: str, parse_mode: Optional[str] = 'Markdown'):
+        if parse_mode not in _ENTITY_PARSERS:
+            raise ValueError(f"Неизвестный режим разметки: {parse_mode}")
+        self.source = source
+        self.parse_mode = parse_mode
+
+        parsed = list(_FORMATTER.parse(source))
+        entities = _ENTITY_PARSERS[parse_mode]([literal for literal, _, _, _ in parsed])
+        # Telegram отклонит такое сообщение целиком — ошибка видна сразу при импорте
+        if entities and entities[-1] is not None:
+            raise ValueError(f"Незакрытая сущность {entities[-1]!r} в шаблоне: {source[:40]!r}")
+        parts = []
+        for (literal, name, spec, conversion), entity in zip(parsed, entities):
+            if literal:
+                # Соседние фрагменты текста хранятся одной строкой
+                if parts and isinstance(parts[-1], str):
+                    parts[-1] += literal
+                else:
+                    parts.append(literal)
+            if name is None:
+                continue
+            if not name or name.isdigit():
+                raise ValueError(f"Поле шаблона без имени: {source[:40]!r}")
+            if '{' in spec:
+                raise ValueError(f"Вложенные поля в формате не поддерживаются: {{{name}:{spec}}}")
+            parts.append(_Field(name, spec, conversion, entity))
+        self._parts = tuple(parts)
+        self._static = None
+        if all(isinstance(part, str) for part in parts):
+            self._static = Markup("".join(parts))
+
+    def render(self, **values) -> Markup:
+        """Текст сообщения с подставленными и экранированными значениями"""
+        if self._static is not None:
+            return self._static
+        out = []
+        for part in self._parts:
+            if isinstance(part, str):
+                out.append(part)
+                continue
+            value, _ = _FORMATTER.get_field(part.name, (), values)
+            if part.conversion:
+                value = _FORMATTER.convert_field(value, part.conversion)
+            if isinstance(value, Markup) and not part.spec:
+                out.append(value)
+            else:
+                out.append(_escape(self.parse_mode, part.entity, format(value, part.spec)))
+        return Markup("".join(out))
+
+    def __repr__(self) -> str:
+        return f"Template({self.source[:40]!r}, parse_mode={self.parse_mode!r})"
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import sqlite_db  # noqa: E402
+
+# Отдельная БД PostgreSQL для тестов: перед каждым тестом все ее таблицы очищаются
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL', '')
+
+BACKENDS = ['sqlite', pytest.param('postgres', marks=pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_DATABASE_URL не задан"
+))]
+
+
+@pytest.fixture(scope='session')
+def loop():
+    """Один цикл событий на все тесты: пул asyncpg привязан к циклу"""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.run_until_complete(database.PostgresDB.close_pool())
+    loop.close()
+
+
+@pytest.fixture(scope='session')
+def run(loop):
+    """Выполнение корутины в цикле тестов"""
+    return loop.run_until_complete
+
+
+def _managers(module) -> SimpleNamespace:
+    return SimpleNamespace(
+        name=module.__name__,
+        UserManager=module.UserManager,
+        TaskManager=module.TaskManager,
+        PendingLinksManager=module.PendingLinksManager,
+        TrackingLinksManager=module.TrackingLinksManager,
+    )
+
+
+async def _reset_postgres():
+    await database.PostgresDB.init_db()
+    async with database.PostgresDB.connection() as conn:
+        tables = await conn.fetch(
+            "SELECT tablename FROM pg_tables WHERE schemaname = current_schema()"
+        )
+        await conn.execute(
+            f"TRUNCATE {', '.join(row['tablename'] for row in tables)} CASCADE"
+        )
+
+
+async def _release_pool():
+    # Фоновые обновления индекса после записи завершаются до закрытия пула:
+    # пул общий на процесс, а следующий тест может работать с другой БД
+    pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    await asyncio.gather(*pending, return_exceptions=True)
+    await database.PostgresDB.close_pool()
+
+
+@pytest.fixture(scope='session')
+def release_pool(run):
+    """Закрытие пула PostgreSQL после фоновых задач"""
+    return lambda: run(_release_pool())
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, run, tmp_path, monkeypatch):
+    """Менеджеры хранилища на чистой БД: SQLite всегда, PostgreSQL — при TEST_DATABASE_URL"""
+    if request.param == 'sqlite':
+        monkeypatch.setattr(sqlite_db, 'SQLITE_PATH', str(tmp_path / 'traffic.db'))
+        run(sqlite_db.SQLiteDB.init_db())
+        yield _managers(sqlite_db)
+        run(sqlite_db.SQLiteDB.close())
+    else:
+        monkeypatch.setattr(database, 'DATABASE_URL', TEST_DATABASE_URL)
+        run(_reset_postgres())
+        yield _managers(database)
+        run(_release_pool())
@@ -0,0 +1,29 @@
+"""Планы горячих запросов против сохраненных в query_plans/ (нужен PLAN_CHECK_DATABASE_URL)"""
+import pytest
+
+import database
+import query_plans
+
+pytestmark = pytest.mark.skipif(
+    not query_plans.PLAN_CHECK_DATABASE_URL, reason="PLAN_CHECK_DATABASE_URL не задан"
+)
+
+
+@pytest.fixture(scope='module')
+def plans_db(run, release_pool):
+    """Заполненная БД проверки: соединение и ID для сценариев"""
+    database_url = database.DATABASE_URL
+    release_pool()
+    conn, ids = run(query_plans.prepare())
+    yield conn, ids
+    run(conn.close())
+    release_pool()
+    database.DATABASE_URL = database_url
+
+
+@pytest.mark.parametrize('scenario', query_plans.SCENARIOS, ids=lambda scenario: scenario.name)
+def test_query_plan(run, plans_db, scenario):
+    conn, ids = plans_db
+    statements = run(query_plans.run_scenario(conn, scenario, ids))
+    problems = query_plans.check(scenario, statements, query_plans.load_baseline(scenario.name))
+    assert not problems, '\n'.join(problems)
@@ -0,0 +1,366 @@
+"""Общие проверки хранилищ: SQLite и PostgreSQL должны вести себя одинаково"""
+from datetime import datetime, timedelta
+
+
+def create(run, store, **kwargs):
+    """Задание с параметрами по умолчанию; возвращает его ID"""
+    kwargs.setdefault('reward', 10.0)
+    return run(store.TaskManager.create_task(
+        kwargs.pop('title', 'Задание'), 'Описание', 'channel', '@target',
+        created_by=1, **kwargs
+    ))
+
+
+def pending(run, store, limit=None):
+    return {(row['task_id'], row['user_id']) for row in run(store.PendingLinksManager.get_all_pending(limit))}
+
+
+# Взятие
+
+def test_take_issues_link_and_pending(run, store):
+    task_id = create(run, store)
+    taken = run(store.TaskManager.take_task(task_id, 101, 'alice'))
+
+    assert taken.task_id == task_id
+    assert taken.slots_left == 0
+    assert taken.tracking_link
+    assert taken.claim_deadline > datetime.now()
+    assert run(store.PendingLinksManager.get_pending(task_id, 101))['tracking_link'] == taken.tracking_link
+    assert task_id not in [task.task_id for task in run(store.TaskManager.get_available_tasks())]
+    assert [row.task_id for row in run(store.TaskManager.get_user_tasks(101, 'active'))] == [task_id]
+
+
+def test_double_take_is_rejected(run, store):
+    task_id = create(run, store, capacity=2)
+    assert run(store.TaskManager.take_task(task_id, 101, 'alice'))
+    assert run(store.TaskManager.take_task(task_id, 101, 'alice')) is None
+    assert run(store.TaskManager.get_task(task_id)).slots_left == 1
+
+
+def test_take_stops_when_slots_run_out(run, store):
+    task_id = create(run, store, capacity=2)
+    assert run(store.TaskManager.take_task(task_id, 101, 'alice')).slots_left == 1
+    assert run(store.TaskManager.take_task(task_id, 102, 'bob')).slots_left == 0
+    assert run(store.TaskManager.take_task(task_id, 103, 'carol')) is None
+
+    task = run(store.TaskManager.get_task(task_id))
+    assert task.slots_left == 0
+    assert not task.available
+    assert run(store.TaskManager.get_available_tasks()) == []
+
+
+def test_take_unknown_task(run, store):
+    assert run(store.TaskManager.take_task('missing', 101, 'alice')) is None
+
+
+# Выполнение
+
+def test_complete_pays_reward(run, store):
+    run(store.UserManager.get_or_create_user(101, 'alice'))
+    task_id = create(run, store, reward=25.0)
+    run(store.TaskManager.take_task(task_id, 101, 'alice'))
+
+    task = run(store.TaskManager.complete_task(task_id, 101, 'proof'))
+    assert task.completed
+    assert not task.active
+    assert task.slots_done == 1
+
+    stats = run(store.UserManager.get_user_stats(101))
+    assert stats['completed_count'] == 1
+    assert stats['active_count'] == 0
+    assert stats['total_earned'] == 25.0
+
+
+def test_complete_keeps_task_open_until_capacity(run, store):
+    task_id = create(run, store, capacity=2)
+    run(store.TaskManager.take_task(task_id, 101, 'alice'))
+
+    task = run(store.TaskManager.complete_task(task_id, 101))
+    assert not task.completed
+    assert task.active
+    assert task.slots_done == 1
+    assert [row.task_id for row in run(store.TaskManager.get_available_tasks())] == [task_id]
+
+
+def test_double_complete_pays_once(run, store):
+    run(store.UserManager.get_or_create_user(101, 'alice'))
+    task_id = create(run, store, reward=25.0)
+    run(store.TaskManager.take_task(task_id, 101, 'alice'))
+
+    assert run(store.TaskManager.complete_task(task_id, 101))
+    assert run(store.TaskManager.complete_task(task_id, 101)) is None
+    assert run(store.UserManager.get_user_stats(101))['total_earned'] == 25.0
+
+
+def test_complete_without_take(run, store):
+    task_id = create(run, store)
+    assert run(store.TaskManager.complete_task(task_id, 101)) is None
+    assert run(store.TaskManager.get_task(task_id)).slots_done == 0
+
+
+def test_completed_task_cannot_be_taken_again(run, store):
+    task_id = create(run, store, capacity=2)
+    run(store.TaskManager.take_task(task_id, 101, 'alice'))
+    run(store.TaskManager.complete_task(task_id, 101))
+    assert run(store.TaskManager.take_task(task_id, 101, 'alice')) is None
+
+
+# Сроки
+
+def test_claim_expiry_returns_slot(run, store):
+    task_id = create(run, store, claim_timeout=5)
+    taken = run(store.TaskManager.take_task(task_id, 101, 'alice'))
+
+    assert run(store.TaskManager.sweep_deadlines(datetime.now(), 10)) == []
+    due_at = taken.claim_deadline + timedelta(seconds=1)
+    assert run(store.TaskManager.next_deadlines(due_at, 10))[0][0] == task_id
+
+    due = run(store.TaskManager.sweep_deadlines(due_at, 10))
+    assert [(row.task_id, row.deadline_kind, row.taken_by) for row in due] == [(task_id, 'claim', 101)]
+
+    task = run(store.TaskManager.get_task(task_id))
+    assert task.slots_left == 1
+    assert task.available
+    assert run(store.PendingLinksManager.get_pending(task_id, 101)) is None
+    assert run(store.TaskManager.get_user_tasks(101, 'active')) == []
+    assert run(store.TaskManager.complete_task(task_id, 101)) is None
+
+    # Место освободилось — то же задание можно взять снова
+    assert run(store.TaskManager.take_task(task_id, 101, 'alice'))
+    assert run(store.TaskManager.sweep_deadlines(datetime.now(), 10)) == []
+
+
+def test_publish_sweep(run, store):
+    publish_at = datetime.now() + timedelta(hours=1)
+    task_id = create(run, store, publish_at=publish_at)
+
+    task = run(store.TaskManager.get_task(task_id))
+    assert not task.available
+    assert task.deadline_kind == 'publish'
+    assert run(store.TaskManager.take_task(task_id, 101, 'alice')) is None
+    assert run(store.TaskManager.sweep_deadlines(datetime.now(), 10)) == []
+
+    due = run(store.TaskManager.sweep_deadlines(publish_at, 10))
+    assert [(row.task_id, row.deadline_kind) for row in due] == [(task_id, 'publish')]
+
+    task = run(store.TaskManager.get_task(task_id))
+    assert task.available
+    assert task.deadline is None
+    assert [row.task_id for row in run(store.TaskManager.get_available_tasks())] == [task_id]
+
+
+def test_expire_sweep(run, store):
+    expires_at = datetime.now() + timedelta(hours=1)
+    task_id = create(run, store, expires_at=expires_at)
+    assert run(store.TaskManager.get_task(task_id)).deadline_kind == 'expire'
+
+    due = run(store.TaskManager.sweep_deadlines(expires_at, 10))
+    assert [(row.task_id, row.deadline_kind) for row in due] == [(task_id, 'expire')]
+
+    task = run(store.TaskManager.get_task(task_id))
+    assert not task.active
+    assert not task.available
+    assert task.deadline is None
+    assert run(store.TaskManager.take_task(task_id, 101, 'alice')) is None
+    assert run(store.TaskManager.sweep_deadlines(expires_at, 10)) == []
+
+
+def test_publish_then_expire(run, store):
+    now = datetime.now()
+    task_id = create(run, store, publish_at=now + timedelta(hours=1), expires_at=now + timedelta(hours=2))
+
+    run(store.TaskManager.sweep_deadlines(now + timedelta(hours=1), 10))
+    task = run(store.TaskManager.get_task(task_id))
+    assert task.available
+    assert task.deadline_kind == 'expire'
+
+    due = run(store.TaskManager.sweep_deadlines(now + timedelta(hours=2), 10))
+    assert [row.deadline_kind for row in due] == ['expire']
+
+
+# Рабочие ссылки
+
+def test_issue_work_link_to_earliest_pending(run, store):
+    task_id = create(run, store, capacity=2)
+    run(store.TaskManager.take_task(task_id, 101, 'alice'))
+    run(store.TaskManager.take_task(task_id, 102, 'bob'))
+
+    issued = run(store.TaskManager.issue_work_link(task_id, 'https://work/1'))
+    assert issued['user_id'] == 101
+    assert issued['title'] == 'Задание'
+    assert pending(run, store) == {(task_id, 102)}
+
+    issued = run(store.TaskManager.issue_work_link(task_id, 'https://work/2', 102))
+    assert issued['user_id'] == 102
+    assert pending(run, store) == set()
+    assert run(store.TaskManager.issue_work_link(task_id, 'https://work/3')) is None
+
+
+def test_issue_work_link_to_other_user(run, store):
+    task_id = create(run, store)
+    run(store.TaskManager.take_task(task_id, 101, 'alice'))
+    assert run(store.TaskManager.issue_work_link(task_id, 'https://work/1', 102)) is None
+    assert pending(run, store) == {(task_id, 101)}
+
+
+def test_issue_work_links_in_bulk(run, store):
+    shared = create(run, store, title='Общее', capacity=2)
+    single = create(run, store, title='Одно')
+    run(store.TaskManager.take_task(shared, 101, 'alice'))
+    run(store.TaskManager.take_task(shared, 102, 'bob'))
+    run(store.TaskManager.take_task(single, 103, 'carol'))
+
+    issued = run(store.TaskManager.issue_work_links({
+        (shared, None): 'https://work/all',
+        (shared, 102): 'https://work/bob',
+        (single, 103): 'https://work/carol',
+        ('missing', None): 'https://work/none',
+    }))
+    assert sorted((row['task_id'], row['user_id'], row['link'], row['title']) for row in issued) == sorted([
+        (shared, 101, 'https://work/all', 'Общее'),
+        (shared, 102, 'https://work/bob', 'Общее'),
+        (single, 103, 'https://work/carol', 'Одно'),
+    ])
+    assert pending(run, store) == set()
+
+
+def test_issue_work_links_with_wrong_ids_touch_nothing(run, store):
+    task_id = create(run, store)
+    run(store.TaskManager.take_task(task_id, 101, 'alice'))
+
+    assert run(store.TaskManager.issue_work_links({})) == []
+    assert run(store.TaskManager.issue_work_links({
+        (task_id, 999): 'https://work/1',
+        ('missing', 101): 'https://work/2',
+    })) == []
+    assert pending(run, store) == {(task_id, 101)}
+
+
+# Ожидающие ссылки
+
+def test_pending_links(run, store):
+    now = datetime.now()
+    for user_id, minutes in ((101, 2), (102, 1), (103, 3)):
+        run(store.PendingLinksManager.save_pending('task-a', {
+            'user_id': user_id,
+            'username': f'user{user_id}',
+            'task_title': 'Задание',
+            'message_sent': now + timedelta(minutes=minutes),
+            'tracking_link': f'https://t.me/bot?start={user_id}',
+        }))
+    run(store.PendingLinksManager.save_pending('task-b', {
+        'user_id': 101, 'username': 'user101', 'task_title': 'Другое',
+        'message_sent': now, 'tracking_link': 'https://t.me/bot?start=b',
+    }))
+
+    assert run(store.PendingLinksManager.get_pending('task-a'))['user_id'] == 102
+    assert run(store.PendingLinksManager.get_pending('task-a', 103))['username'] == 'user103'
+    assert run(store.PendingLinksManager.get_pending('task-a', 999)) is None
+    oldest = run(store.PendingLinksManager.get_all_pending(2))
+    assert [(row['task_id'], row['user_id']) for row in oldest] == [('task-b', 101), ('task-a', 102)]
+
+    run(store.PendingLinksManager.delete_pending('task-a', 102))
+    assert run(store.PendingLinksManager.get_pending('task-a'))['user_id'] == 101
+    run(store.PendingLinksManager.delete_pending('task-a'))
+    assert pending(run, store) == {('task-b', 101)}
+
+
+def test_save_pending_replaces_entry(run, store):
+    data = {
+        'user_id': 101, 'username': 'alice', 'task_title': 'Задание',
+        'message_sent': datetime.now(), 'tracking_link': 'https://t.me/bot?start=1',
+    }
+    run(store.PendingLinksManager.save_pending('task-a', data))
+    run(store.PendingLinksManager.save_pending('task-a', {**data, 'tracking_link': 'https://t.me/bot?start=2'}))
+    assert run(store.PendingLinksManager.get_all_pending()) == [
+        {**data, 'task_id': 'task-a', 'tracking_link': 'https://t.me/bot?start=2'}
+    ]
+
+
+# Админ-панель и рейтинг
+
+def test_dashboard_counters(run, store):
+    for user_id in (101, 102):
+        run(store.UserManager.get_or_create_user(user_id, f'user{user_id}'))
+    in_progress = create(run, store, reward=10.0)
+    completed = create(run, store, reward=25.0)
+    create(run, store, reward=5.0)
+    run(store.TaskManager.take_task(in_progress, 101, 'alice'))
+    run(store.TaskManager.take_task(completed, 102, 'bob'))
+    run(store.TaskManager.complete_task(completed, 102))
+
+    counters = run(store.TaskManager.get_dashboard_counters())
+    assert {key: int(value) for key, value in counters.items()} == {
+        'pending_count': 2,
+        'total_users': 2,
+        'total_tasks': 3,
+        'active_tasks': 2,
+        'in_progress_tasks': 1,
+        'completed_tasks': 1,
+        'total_payout': 25,
+    }
+
+
+def test_dashboard_counters_on_empty_db(run, store):
+    counters = run(store.TaskManager.get_dashboard_counters())
+    assert all(value == 0 for value in counters.values())
+
+
+def test_completion_totals_count_claims(run, store):
+    start = datetime.now()
+    shared = create(run, store, reward=50.0, capacity=3)
+    single = create(run, store, reward=20.0)
+    for task_id, user_id in ((shared, 101), (shared, 102), (single, 103)):
+        run(store.TaskManager.take_task(task_id, user_id, f'user{user_id}'))
+        run(store.TaskManager.complete_task(task_id, user_id))
+    # Взятое, но не выполненное место в итоги не входит
+    run(store.TaskManager.take_task(shared, 104, 'user104'))
+    end = datetime.now()
+
+    totals = run(store.TaskManager.get_completion_totals(start, end))
+    assert (totals['count'], float(totals['earnings']), totals['active_users']) == (3, 120.0, 4)
+    assert float(run(store.TaskManager.get_dashboard_counters())['total_payout']) == 120.0
+
+    totals = run(store.TaskManager.get_completion_totals(start - timedelta(days=2), start - timedelta(days=1)))
+    assert (totals['count'], float(totals['earnings'])) == (0, 0.0)
+
+
+def test_top_earners(run, store):
+    start = datetime.now()
+    for user_id, reward in ((101, 10.0), (101, 5.0), (102, 15.0), (103, 20.0)):
+        task_id = create(run, store, reward=reward)
+        run(store.TaskManager.take_task(task_id, user_id, f'user{user_id}'))
+        run(store.TaskManager.complete_task(task_id, user_id))
+    end = datetime.now()
+
+    # Равный заработок — меньший user_id выше, как в таблице лидеров
+    assert run(store.TaskManager.get_top_earners(start, end, 2)) == [(103, 20.0), (101, 15.0)]
+    assert len(run(store.TaskManager.get_top_earners(start, end, 10))) == 3
+    assert run(store.TaskManager.get_top_earners(start - timedelta(days=2), start - timedelta(days=1), 1)) == []
+
+
+def test_leaderboard_snapshot(run, store):
+    done = []
+    for user_id, reward in ((101, 10.0), (101, 3.0), (102, 5.0)):
+        task_id = create(run, store, reward=reward)
+        run(store.TaskManager.take_task(task_id, user_id, f'user{user_id}'))
+        run(store.TaskManager.complete_task(task_id, user_id))
+        done.append((task_id, user_id))
+    # Взятое, но не выполненное задание в рейтинг не входит
+    run(store.TaskManager.take_task(create(run, store, reward=100.0), 103, 'user103'))
+
+    now = datetime.now()
+    rows, recent = run(store.TaskManager.get_leaderboard_snapshot(
+        now - timedelta(days=7), now + timedelta(hours=1), now - timedelta(minutes=5)
+    ))
+    assert {row['user_id']: (row['total'], row['week'], row['day']) for row in rows} == {
+        101: (13.0, 13.0, None),
+        102: (5.0, 5.0, None),
+    }
+    assert sorted((row['task_id'], row['user_id']) for row in recent) == sorted(done)
+
+    rows, recent = run(store.TaskManager.get_leaderboard_snapshot(
+        now - timedelta(days=7), now - timedelta(days=1), now + timedelta(minutes=5)
+    ))
+    assert {row['user_id']: row['day'] for row in rows} == {101: 13.0, 102: 5.0}
+    assert list(recent) == []
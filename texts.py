@@ -0,0 +1,451 @@
+from templates import Template
+
+# Тексты сообщений бота. Шаблоны разбираются один раз при импорте; значения
+# полей (названия заданий, имена, ссылки, доказательства) экранируются при
+# отрисовке, поэтому пользовательский текст не ломает Markdown.
+
+# ========== ГЛАВНОЕ МЕНЮ ==========
+WELCOME = Template(
+    "🚀 *Приветствуем, будущий трафик-менеджер!*\n\n"
+    "Переходи по ссылкам — мы покажем и научим, "
+    "как действительно зарабатывать на трафике.\n\n"
+    "❗️ Мы работаем *ТОЛЬКО* с белым трафиком — честно, стабильно и без рисков.\n\n"
+    "*Вступая в нашу команду, ты получаешь:*\n"
+    "✅ готового бота для работы\n"
+    "✅ подробный и понятный мануал\n"
+    "✅ поддержку кураторов\n"
+    "✅ работу бок о бок с профессионалами\n"
+    "✅ практику, опыт и рост с первого дня\n\n"
+    "*Если хочешь развиваться и зарабатывать — тебе точно к нам!*"
+)
+MAIN_MENU = Template("🚀 *Главное меню*\n\nВыберите раздел для работы:")
+STALE_NOTE = Template("\n\n⚠️ База данных недоступна, данные на {since:%H:%M}")
+TRACKING_ENABLED = Template(
+    "🎯 *Отслеживание включено!*\n\n"
+    "*Задание:* {task.title}\n"
+    "*Описание:* {task.description}\n\n"
+    "Теперь ваши переходы по этой ссылке отслеживаются."
+)
+HELP = Template(
+    "❓ *Помощь и поддержка*\n\n"
+    "*Как работать с ботом:*\n"
+    "1. 👤 *Профиль* — ваша статистика и рейтинг\n"
+    "2. 📋 *Доступные задания* — выбирайте задания для выполнения\n"
+    "3. ✅ *Взятие задания* — после взятия ожидайте ссылку от админа\n"
+    "4. 📊 *Отчет* — после выполнения отправьте доказательство\n"
+    "5. 💰 *Вывод средств* — доступен от 500 руб. (обращаться к админу)\n\n"
+    "*Важные моменты:*\n"
+    "• Работаем только с белым трафиком\n"
+    "• Качество выполнения влияет на рейтинг\n"
+    "• Регулярные исполнители получают более выгодные задания\n"
+    "• Все вопросы к администратору\n\n"
+    "*Контакты поддержки:*\n"
+    "👑 Главный администратор: @main\\_admin"
+)
+
+# ========== ПРОФИЛЬ И СТАТИСТИКА ==========
+PROFILE = Template(
+    "👤 *Ваш профиль*\n\n"
+    "*ID:* {user.id}\n"
+    "*Имя:* {user.first_name}\n"
+    "*Username:* @{username}\n\n"
+    "*Статистика:*\n"
+    "✅ Выполнено заданий: {stats[completed_count]}\n"
+    "📊 Активных заданий: {stats[active_count]}\n"
+    "💰 Заработано всего: {stats[total_earned]} руб.\n"
+    "⭐ Рейтинг: {stats[rating]}/100\n\n"
+    "*Статус:* {status}"
+    "{stale}"
+)
+ACTIVE_TASKS = Template("📋 *Ваши активные задания:*\n\n")
+ACTIVE_TASK = Template("• {task.title} - {task.reward} руб.\n")
+ACTIVE_TASK_DEADLINE = Template("  ⌛ Сдать до {deadline}\n")
+COMPLETED_TASKS = Template("📋 *Ваши последние выполненные задания:*\n\n")
+COMPLETED_TASK = Template("✅ {task.title} - {task.reward} руб.\n")
+MY_STATS = Template(
+    "📊 *Ваша статистика*\n\n"
+    "✅ *Выполнено заданий:* {stats[completed_count]}\n"
+    "🎯 *Активных заданий:* {stats[active_count]}\n"
+    "💰 *Всего заработано:* {stats[total_earned]} руб.\n"
+    "⭐ *Рейтинг исполнителя:* {stats[rating]}/100\n\n"
+    "*Место среди исполнителей:*\n"
+    "{ranks}\n\n"
+    "*Эффективность:* {efficiency}\n\n"
+    "Продолжайте в том же духе! Каждое выполненное задание повышает ваш рейтинг."
+)
+LEADERBOARD = Template("{period} — *лидеры*\n\n")
+LEADERBOARD_EMPTY = Template("Пока никто не выполнил заданий за этот период.\n")
+LEADERBOARD_ROW = Template("{place}. {name} — {earned:g} руб.\n")
+LEADERBOARD_RANK = Template("\n*Ваше место:* #{place} из {size} — {earned:g} руб.")
+LEADERBOARD_UNRANKED = Template("\nВыполните задание, чтобы попасть в таблицу!")
+
+# ========== ЗАДАНИЯ ==========
+AVAILABLE_TASKS = Template("📋 *Доступные задания:*\n\n{hint}{stale}")
+AVAILABLE_TASKS_OF_TYPE = Template("📋 *Доступные задания: {task_type}*\n\n{hint}{stale}")
+SEARCH = Template(
+    "🔎 *Поиск заданий*\n\n"
+    "{query}"
+    "*Тип:* {task_type}\n"
+    "*Вознаграждение:* {reward}\n\n"
+    "{hint}"
+)
+SEARCH_QUERY = Template("*Запрос:* {text}\n")
+SEARCH_PAGE = Template("Страница {page}. Выберите задание:")
+SEARCH_NOTHING = Template("Ничего не найдено. Попробуйте другие слова или фильтры.")
+SEARCH_DIALOG = Template(
+    "🔎 *Поиск заданий*\n\n"
+    "Отправьте слова для поиска, например: подписчики телеграм\n\n"
+    "Или отправьте '-', чтобы выбрать задания только по типу и вознаграждению."
+)
+FIND_USAGE = Template(
+    "🔎 Отправьте слова для поиска или '-', чтобы показать все задания.\n\n"
+    "*Пример:* `/find подписчики`"
+)
+TASK_DETAILS = Template(
+    "🎯 *{task.title}*\n\n"
+    "*Описание:* {task.description}\n"
+    "*Тип:* {task.type}\n"
+    "*Цель:* {task.target}\n"
+    "*Вознаграждение:* {task.reward} руб.\n"
+    "*Требования:* {task.requirements}\n"
+    "{schedule}\n"
+    "*Статус:* {status}"
+)
+TASK_DETAILS_SLOTS = Template("\n*Свободных мест:* {task.slots_left} из {task.capacity}")
+SCHEDULE_PUBLISH = Template("🗓 *Публикация:* {moment}")
+SCHEDULE_EXPIRES = Template("⏳ *Доступно до:* {moment}")
+SCHEDULE_CLAIM_TIMEOUT = Template("⏱ *На выполнение:* {hours:g} ч.")
+TASK_TAKEN_NOTICE = Template(
+    "🚀 *НОВОЕ ЗАДАНИЕ ВЗЯТО!*\n\n"
+    "*Исполнитель:* {name} (@{username})\n"
+    "*Задание:* {task.title}\n"
+    "*Цель:* {task.target}\n"
+    "*Вознаграждение:* {task.reward} руб.\n"
+    "*Осталось мест:* {task.slots_left} из {task.capacity}\n\n"
+    "👑 *Администратору:*\n"
+    "Выдайте исполнителю рабочую ссылку:\n"
+    "`{task.tracking_link}`\n\n"
+    "Используйте кнопки ниже для управления:"
+)
+TASK_TAKEN = Template(
+    "✅ *Задание успешно взято!*\n\n"
+    "*{task.title}*\n\n"
+    "Ожидайте, когда администратор выдаст вам "
+    "специальную ссылку для работы в группе {group}\n\n"
+    "Как получите ссылку — начинайте работу!\n"
+    "После выполнения не забудьте отправить отчет."
+)
+TASK_TAKEN_DEADLINE = Template(
+    "\n\n⌛ *Сдать до:* {deadline}\n"
+    "Иначе место вернется в общий список."
+)
+PROOF_REQUEST = Template(
+    "📝 *Отправка отчета*\n\n"
+    "Пожалуйста, отправьте доказательство выполнения задания:\n"
+    "• Ссылку на результат\n"
+    "• Скриншот\n"
+    "• Текстовый отчет или файл\n\n"
+    "Отправьте одним сообщением; несколько скриншотов — одним альбомом."
+)
+PROOF_ACCEPTED = Template(
+    "✅ *Отчет успешно отправлен!*\n\n"
+    "Ваше задание отмечено как выполненное.\n"
+    "Вознаграждение будет начислено после проверки администратором."
+)
+WORK_LINK = Template(
+    "🔗 *Рабочая ссылка готова!*\n\n"
+    "*Задание:* {title}\n"
+    "*Ваша ссылка:*\n"
+    "{link}\n\n"
+    "Используйте эту ссылку для выполнения задания.\n"
+    "После выполнения отправьте отчет командой /start и выберите задание."
+)
+CLAIM_EXPIRED = Template(
+    "⌛ *Время на выполнение истекло*\n\n"
+    "*Задание:* {task.title}\n\n"
+    "Ваше место вернулось в общий список. "
+    "Вы можете взять задание снова, если места еще есть."
+)
+TASK_ANNOUNCEMENT = Template(
+    "🆕 *Новое задание!*\n\n"
+    "*{task.title}*\n\n"
+    "🎯 *Цель:* {task.target}\n"
+    "💰 *Вознаграждение:* {task.reward} руб.\n\n"
+    "Успейте взять, пока задание свободно!"
+)
+
+# ========== ОТЧЕТЫ О ВЫПОЛНЕНИИ ==========
+REPORT = Template(
+    "📊 *ЕЖЕДНЕВНЫЙ ОТЧЕТ*\n\n"
+    "*Исполнитель:* {entry[name]}\n"
+    "*Задание:* {entry[title]}\n"
+    "*Результат:* Выполнено ✅\n"
+    "*Вознаграждение:* {entry[reward]:g} руб.\n"
+    "*Доказательство:* {preview}"
+)
+REPORT_DIGEST = Template("📊 *ОТЧЕТЫ О ВЫПОЛНЕНИИ* ({count}, {total:g} руб.)\n\n")
+REPORT_DIGEST_ITEM = Template(
+    "*{number}.* {entry[name]} — {entry[title]} — {entry[reward]:g} руб.\n"
+    "{preview}\n\n"
+)
+DAILY_REPORT = Template(
+    "📊 *ЕЖЕДНЕВНЫЙ ОТЧЕТ {day:%d.%m.%Y}*\n\n"
+    "*Выполнено заданий за день:* {totals[count]}\n"
+    "*Выплачено за день:* {totals[earnings]} руб.\n"
+    "*Активных пользователей:* {totals[active_users]}\n\n"
+    "*Топ дня:*\n"
+    "{top}"
+    "\n*Система работает стабильно. Все задачи выполнены.*"
+)
+DAILY_REPORT_TOP = Template("Лучший исполнитель: ID {user_id} - {earned:g} руб.\n")
+DAILY_REPORT_NO_TOP = Template("Нет выполненных заданий за день\n")
+
+# ========== АДМИН-ПАНЕЛЬ ==========
+ADMIN_PANEL = Template(
+    "👑 *Панель администратора*\n\n"
+    "*Ваш статус:* {status}\n"
+    "*ID:* {user_id}\n"
+    "*Дата входа:* {now:%d.%m.%Y %H:%M}\n"
+    "*Ожидает ссылок:* {pending_count}\n"
+    "_Данные на {refreshed_at:%H:%M:%S}_"
+)
+ADMIN_PANEL_SHORT = Template(
+    "👑 *Панель администратора*\n\n*Ожидает ссылок:* {pending_count}\n\nВыберите раздел для управления:"
+)
+PENDING_LINKS_EMPTY = Template("🔗 *Нет ожидающих ссылок*\n\nВсе ссылки выданы.")
+PENDING_LINKS = Template("🔗 *Ожидают выдачи ссылок:*\n\n")
+PENDING_LINK = Template(
+    "{number}. *{pending[task_title]}*\n"
+    "   Исполнитель: {pending[username]}\n"
+    "   ID: {pending[user_id]}\n"
+    "   Ссылка: `{pending[tracking_link]}`\n\n"
+)
+PENDING_LINKS_MORE = Template("... и еще {count} заданий\n\n")
+WORK_LINK_DIALOG = Template(
+    "🔗 *Установка рабочей ссылки*\n\n"
+    "*Задание:* {pending[task_title]}\n"
+    "*Исполнитель:* {pending[username]}\n"
+    "*Отслеживающая ссылка:*\n"
+    "`{pending[tracking_link]}`\n\n"
+    "Отправьте рабочую ссылку для этого задания.\n"
+    "Или нажмите кнопку 'Пропустить'."
+)
+WORK_LINK_SENT = Template(
+    "✅ *Ссылка отправлена!*\n\n"
+    "Задание: {title}\n"
+    "Исполнитель: {username}\n"
+    "Ссылка: {link}"
+)
+BULK_LINKS_DIALOG = Template(
+    "📥 *Массовая выдача ссылок*\n\n"
+    "Отправьте сообщение или .txt файл, где каждая строка:\n"
+    "`ID_задания ссылка` — всем ожидающим исполнителям задания\n"
+    "`ID_задания/ID_исполнителя ссылка` — одному исполнителю\n\n"
+    "*Пример:*\n"
+    "`06gn3t247r2rf2m0 https://example.com/a`\n"
+    "`06gn3t247r2rf2m1/123456789 https://example.com/b`\n\n"
+    "Все ссылки применяются одной операцией (до {limit} строк), "
+    "исполнители получат их автоматически."
+)
+BULK_LINKS_SUMMARY = Template(
+    "📥 *Массовая выдача ссылок*\n\n"
+    "✅ Выдано: {issued}\n"
+    "⚠️ Нет в ожидающих: {not_found}\n"
+    "❌ Нераспознанных строк: {bad_lines}\n"
+)
+BULK_LINKS_NOT_FOUND = Template("\n*Не найдены:* {ids}{more}\n")
+BULK_LINKS_ID = Template("`{key}`")
+BULK_LINKS_MORE = Template(" и еще {count}")
+BULK_LINKS_DELIVERING = Template("\n📨 Доставка исполнителям...")
+BULK_LINKS_DELIVERED = Template("\n📨 Доставлено: {sent}, не доставлено: {failed}")
+ADMINS = Template("👥 *Список администраторов:*\n\n👑 Главный администратор (ID: {main_admin_id})\n\n")
+ADMIN = Template(
+    "👤 Администратор (ID: {admin[user_id]})\n"
+    "   Username: {username}\n"
+    "   Добавлен: {admin[added_date]:%d.%m.%Y}\n\n"
+)
+ADD_ADMIN_DIALOG = Template(
+    "👥 *Добавление администратора*\n\n"
+    "Отправьте мне ID пользователя, которого хотите сделать администратором.\n\n"
+    "*Как получить ID пользователя:*\n"
+    "1. Попросите пользователя написать @userinfobot\n"
+    "2. Или перешлите мне любое сообщение от этого пользователя\n\n"
+    "Отправьте ID или перешлите сообщение:"
+)
+ADMIN_ADDED = Template(
+    "✅ *Администратор добавлен!*\n\n"
+    "*ID:* {user_id}\n"
+    "*Имя:* {name}\n"
+    "*Добавил:* {added_by}\n\n"
+    "Пользователь теперь имеет доступ к админ-панели."
+)
+ADMIN_APPOINTED = Template(
+    "🎉 *Поздравляем!*\n\n"
+    "Вас назначили администратором в боте Traffic Team!\n\n"
+    "Теперь у вас есть доступ к админ-панели. Используйте команду /start для начала работы."
+)
+
+# ========== СОЗДАНИЕ ЗАДАНИЯ ==========
+CREATE_TASK_TITLE = Template(
+    "➕ *Создание нового задания*\n\n"
+    "*Шаг 1 из 8*\n"
+    "Введите заголовок задания:\n\n"
+    "*Пример:* Привлечение подписчиков в Telegram-канал"
+)
+CREATE_TASK_DESCRIPTION = Template(
+    "*Шаг 2 из 8*\n"
+    "Введите подробное описание задания:\n\n"
+    "*Пример:* Необходимо привлечь 1000 реальных подписчиков в канал @example. "
+    "Подписчики должны быть активными, не ботами."
+)
+CREATE_TASK_TYPE = Template("*Шаг 3 из 8*\nВыберите тип задания:")
+CREATE_TASK_TARGET = Template(
+    "*Шаг 4 из 8*\n"
+    "Введите цель (количество/результат):\n\n"
+    "*Пример:* 1000 подписчиков, 500 переходов, 100 установок"
+)
+CREATE_TASK_REWARD = Template(
+    "*Шаг 5 из 8*\n"
+    "Введите вознаграждение (в рублях):\n\n"
+    "*Пример:* 1500"
+)
+CREATE_TASK_CAPACITY = Template(
+    "*Шаг 6 из 8*\n"
+    "Сколько исполнителей могут выполнить задание?\n"
+    "Каждый получит свою ссылку и свое вознаграждение.\n\n"
+    "*Пример:* 1000 (или 1 — один исполнитель)"
+)
+CREATE_TASK_REQUIREMENTS = Template(
+    "*Шаг 7 из 8*\n"
+    "Введите дополнительные требования (или '-' если нет):\n\n"
+    "*Пример:* Только реальные пользователи, без накрутки"
+)
+CREATE_TASK_SCHEDULE = Template(
+    "*Шаг 8 из 8*\n"
+    "Укажите сроки задания (или '-' чтобы опубликовать сразу без ограничений).\n"
+    "Каждый пункт необязателен:\n\n"
+    "*Пример:*\n"
+    "публикация: 25.12.2024 10:00\n"
+    "окончание: 31.12.2024 23:59\n"
+    "на выполнение: 24"
+)
+TASK_CREATED = Template(
+    "✅ *Задание успешно создано!*\n\n"
+    "*ID задания:* {task_id}\n"
+    "*Название:* {data[title]}\n"
+    "*Цель:* {data[target]}\n"
+    "*Вознаграждение:* {data[reward]} руб.\n"
+    "*Исполнителей:* {capacity}\n"
+    "{schedule}\n"
+    "{availability}"
+)
+TASK_PUBLISH_LATER = Template("Задание появится в разделе 'Доступные задания' в момент публикации.")
+TASK_PUBLISHED = Template("Задание теперь доступно для выполнения в разделе 'Доступные задания'.")
+BROADCAST_STARTING = Template("📣 *Рассылка запускается...*\n\n*Задание:* {task.title}")
+
+# ========== СТАТИСТИКА ДЛЯ АДМИНОВ ==========
+ADMIN_STATS = Template(
+    "📊 *Общая статистика системы*\n\n"
+    "*Пользователей:* {dashboard[total_users]}\n"
+    "*Всего заданий:* {dashboard[total_tasks]}\n"
+    "*Активных заданий:* {dashboard[in_progress_tasks]}\n"
+    "*Выполненных заданий:* {dashboard[completed_tasks]}\n"
+    "*Общая выплата:* {dashboard[total_payout]} руб.\n\n"
+    "*Топ-5 исполнителей:*\n"
+)
+ADMIN_STATS_TOP = Template("{place}. ID {user_id}: {earned:g} руб.\n")
+METRICS = Template("📈 *Динамика*\n👆 переходы · 🎯 конверсии · ✋ взято · ✅ выполнено\n\n")
+METRICS_PERIOD = Template("*За {title}:* {totals}\n")
+METRICS_DAYS = Template("\n*По дням:*\n")
+METRICS_DAY = Template("{day:%d.%m}: 👆 {clicks} · ✅ {completions}\n")
+METRICS_HINT = Template("\nПо заданию, исполнителю или ссылке: `/metrics task <ID> [дней]`")
+METRICS_USAGE = Template(
+    "Использование: `/metrics <task|user|link> <ID> [дней]`\n\n"
+    "*Пример:* `/metrics task 0123abcd 7`"
+)
+METRICS_SUMMARY = Template(
+    "📈 *Динамика: {dimension}* `{key}`\n\n"
+    "*За {days} дн.:* {totals}\n\n"
+    "👆 переходы · 🎯 конверсии · ✋ взято · ✅ выполнено"
+)
+DBSTATS_USAGE = Template("Использование: `/dbstats [total|mean|max|calls]` или `/dbstats reset`")
+DBSTATS = Template(
+    "🗄 *Запросы к БД* с {since:%d.%m %H:%M} (эта реплика)\n"
+    "По {order}; медленные — от {slow_ms:g} мс\n\n"
+)
+DBSTATS_EMPTY = Template("Запросов пока не было.")
+DBSTATS_QUERY = Template(
+    "*{number}.* {item[calls]} выз. · всего {item[total]:.0f} мс · "
+    "ср. {item[mean]:.1f} мс · макс. {item[max]:.0f} мс · строк {item[rows]:.1f}"
+    "{flags}\n"
+    "`{sql}`\n\n"
+)
+ALL_TASKS_EMPTY = Template("📁 *Все задания*\n\nПока нет созданных заданий.")
+ALL_TASKS = Template("📁 *Все задания (последние 20):*\n\n")
+ALL_TASKS_ROW = Template(
+    "{icon} {task.task_id}: {title} - {task.reward} руб.\n"
+    "   Свободно: {task.slots_left}/{task.capacity}, Выполнено: {task.slots_done}\n\n"
+)
+MANAGE_TASKS = Template(
+    "📁 *Управление заданиями*\n\n"
+    "*Всего заданий:* {dashboard[total_tasks]}\n"
+    "*Активных:* {dashboard[active_tasks]}\n"
+    "*Завершенных:* {dashboard[completed_tasks]}\n\n"
+    "*Последние 5 заданий:*\n"
+)
+MANAGE_TASKS_ROW = Template("{place}. {icon} {task.title} - {task.reward} руб.{slots}\n")
+
+# ========== НАСТРОЙКИ ==========
+MANAGE_BLOCKS = Template(
+    "📁 *Управление структурой бота*\n\n"
+    "*Основные блоки:*\n"
+    "1. 👤 Профиль пользователя\n"
+    "2. 📋 Система заданий\n"
+    "3. 📊 Статистика и отчетность\n"
+    "4. 👥 Админ-панель\n"
+    "5. ❓ Помощь и поддержка\n\n"
+    "*Подблоки заданий:*\n"
+    "• Создание/редактирование заданий\n"
+    "• Назначение/проверка заданий\n"
+    "• Генерация отслеживающих ссылок\n"
+    "• Автоматические отчеты\n\n"
+    "*Настройки коммуникации:*\n"
+    "• Уведомления в группы\n"
+    "• Личные сообщения пользователям\n"
+    "• Система эскалации проблем"
+)
+WELCOME_EDITOR = Template(
+    "📝 *Приветственное сообщение*\n\n"
+    "{state}\n"
+    "Так его видят пользователи в /start:\n\n"
+    "{current}"
+)
+NOTIFICATION_SETTINGS = Template(
+    "⚙️ *Настройки уведомлений*\n\n"
+    "*Текущие настройки:*\n"
+    "• Группа уведомлений о взятых заданиях: {notification_group}\n"
+    "• Группа отчетов о выполнении и ежедневного отчета: {report_group}\n"
+    "• Ежедневный отчет: 23:00\n\n"
+    "Бот должен состоять в группе и иметь право писать в нее."
+)
+LINK_TEMPLATES = Template(
+    "🔗 *Шаблон отслеживающих ссылок*\n\n"
+    "*Текущий шаблон:* {state}\n"
+    "`{template}`\n\n"
+    "*Как это работает:*\n"
+    "1. Бот генерирует уникальный ID ссылки и подставляет его вместо `{{link_id}}`\n"
+    "2. Пользователь получает ссылку с этим ID\n"
+    "3. При переходе по ссылке отслеживаются клики\n"
+    "4. Статистика сохраняется в базу данных\n\n"
+    "Новый шаблон действует для ссылок, выданных после изменения."
+)
+SETTING_DEFAULT = Template("по умолчанию")
+SETTING_CUSTOM = Template("изменен в админ-панели")
+SETTING_PROMPT = Template(
+    "✏️ *{title}*\n\n"
+    "{hint}\n\n"
+    "Отправьте новое значение сообщением или «-», чтобы вернуть значение по умолчанию."
+)
+SETTING_SAVED = Template("✅ *{title}:* настройка сохранена и уже действует.")
+SETTING_RESET = Template("↩️ *{title}:* возвращено значение по умолчанию.")
+SETTING_INVALID = Template("❌ {error}\n\nОтправьте исправленное значение или «-» для значения по умолчанию.")